@@ -124,8 +124,12 @@ class GenericAgent(Agent):
             # cause it to be too long
 
             chat_messages = Discussion([system_prompt, human_prompt])
+            chat_llm = self.chat_llm
+            if getattr(chat_llm, "stream", False):
+                # stop the generation once the action is complete
+                chat_llm = partial(chat_llm, stop_tags=main_prompt.required_tags)
             ans_dict = retry(
-                self.chat_llm,
+                chat_llm,
                 chat_messages,
                 n_retry=self.max_retry,
                 parser=main_prompt._parse_answer,
@@ -31,6 +31,8 @@ class GenericPromptFlags(dp.Flags):
         be_cautious (bool): Instruct the agent to be cautious about its actions.
         extra_instructions (Optional[str]): Extra instructions to provide to the agent.
         add_missparsed_messages (bool): When retrying, add the missparsed messages to the prompt.
+        cache_friendly_layout (bool): Put the parts of the prompt that don't change between steps
+            (action space, hints, examples) first, so that providers can reuse their prefix cache.
         flag_group (Optional[str]): Group of flags used.
     """
 
@@ -49,6 +51,7 @@ class GenericPromptFlags(dp.Flags):
     extra_instructions: str | None = None
     add_missparsed_messages: bool = True
     max_trunc_itr: int = 20
+    cache_friendly_layout: bool = False
     flag_group: str = None
 
 
@@ -102,6 +105,9 @@ class MainPrompt(dp.Shrinkable):
 
     @property
     def _prompt(self) -> HumanMessage:
+        if self.flags.cache_friendly_layout:
+            return self._cache_friendly_prompt()
+
         prompt = HumanMessage(self.instructions.prompt)
         prompt.add_text(
             f"""\
@@ -118,8 +124,50 @@ class MainPrompt(dp.Shrinkable):
         )
 
         if self.flags.use_abstract_example:
-            prompt.add_text(
-                f"""
+            prompt.add_text(self._abstract_example())
+
+        if self.flags.use_concrete_example:
+            prompt.add_text(self._concrete_example())
+        return self.obs.add_screenshot(prompt)
+
+    def _cache_friendly_prompt(self) -> HumanMessage:
+        """Same content, with the blocks that are identical at every step first.
+
+        The invariant blocks come first and are byte-stable, then the goal, the history which
+        only grows during an episode, and the current observation last.
+        """
+        invariant = f"""\
+{self.action_prompt.prompt}\
+{self.hints.prompt}\
+{self.be_cautious.prompt}\
+{self.think.prompt}\
+{self.memory.prompt}\
+{self.criticise.prompt}\
+"""
+        if self.flags.use_abstract_example:
+            invariant += self._abstract_example()
+        if self.flags.use_concrete_example:
+            invariant += self._concrete_example()
+        prompt = HumanMessage(invariant)
+
+        instructions = self.instructions.prompt
+        if isinstance(instructions, str):
+            prompt.add_text(instructions)
+        else:
+            for part in instructions:
+                prompt.add_content(part["type"], part[part["type"]])
+
+        prompt.add_text(
+            f"""\
+{self.history.prompt}\
+{self.plan.prompt}\
+{self.obs.prompt}\
+"""
+        )
+        return self.obs.add_screenshot(prompt)
+
+    def _abstract_example(self) -> str:
+        return f"""
 # Abstract Example
 
 Here is an abstract version of the answer with description of the content of
@@ -131,11 +179,9 @@ answer:
 {self.criticise.abstract_ex}\
 {self.action_prompt.abstract_ex}\
 """
-            )
 
-        if self.flags.use_concrete_example:
-            prompt.add_text(
-                f"""
+    def _concrete_example(self) -> str:
+        return f"""
 # Concrete Example
 
 Here is a concrete example of how to format your answer.
@@ -146,13 +192,16 @@ Make sure to follow the template with proper tags:
 {self.criticise.concrete_ex}\
 {self.action_prompt.concrete_ex}\
 """
-            )
-        return self.obs.add_screenshot(prompt)
 
     def shrink(self):
         self.history.shrink()
         self.obs.shrink()
 
+    @property
+    def required_tags(self) -> list[str]:
+        """Tags the answer must contain, a streamed answer can be stopped once they are closed."""
+        return (["think"] if self.think.is_visible else []) + ["action"]
+
     def _parse_answer(self, text_answer):
         ans_dict = {}
         ans_dict.update(self.think.parse_answer(text_answer))
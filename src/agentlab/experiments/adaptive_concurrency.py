@@ -0,0 +1,211 @@
+"""Adapt the number of concurrent episodes to the resources of the host.
+
+The memory used by an episode (mostly the browser) varies a lot between benchmarks. A fixed n_jobs
+either overcommits the machine, leading to OOM kills, or underuses it. `AdaptiveConcurrency`
+samples host CPU and memory, as well as the RSS of each worker (including its browser processes),
+and adjusts the number of episodes allowed to run at the same time:
+
+- When memory or CPU usage is above its threshold, the limit is lowered below the number of
+  running episodes, so that no new episode starts until usage goes down. It is lowered at most
+  once per `decrease_cooldown`, giving the running episodes time to finish before lowering again.
+- When all allowed episodes are running and there is room for one more (based on the RSS of the
+  current episodes), the limit is raised by one.
+
+Workers whose RSS grows past `worker_memory_limit_gb` while idle are killed, so that they are
+replaced by fresh processes.
+"""
+
+import logging
+import time
+
+import numpy as np
+import psutil
+
+logger = logging.getLogger(__name__)
+
+GB = 1024**3
+
+
+class AdaptiveConcurrency:
+    """Controller for the number of episodes running concurrently.
+
+    Args:
+        min_jobs: int
+            Lower bound on the number of concurrent episodes.
+        max_jobs: int
+            Upper bound on the number of concurrent episodes. If None, it is set to n_jobs when
+            the run starts.
+        initial_jobs: int
+            Number of concurrent episodes at the start. Defaults to min_jobs.
+        max_memory_percent: float
+            Host memory usage (in %) above which concurrency is lowered.
+        max_cpu_percent: float
+            Host CPU usage (in %) above which concurrency is lowered.
+        worker_memory_limit_gb: float
+            Idle workers using more than this are restarted. Running workers above the limit are
+            reported. None to disable.
+        poll_interval: float
+            Seconds between two updates.
+        decrease_cooldown: float
+            Minimum seconds between two decreases of the limit. Usage stays high until running
+            episodes finish, lowering the limit on each update would drop it to min_jobs.
+        idle_worker_name: str
+            Process name of idle workers. Only idle workers are restarted.
+    """
+
+    def __init__(
+        self,
+        min_jobs: int = 1,
+        max_jobs: int = None,
+        initial_jobs: int = None,
+        max_memory_percent: float = 85.0,
+        max_cpu_percent: float = 95.0,
+        worker_memory_limit_gb: float = 4.0,
+        poll_interval: float = 5.0,
+        decrease_cooldown: float = 60.0,
+        idle_worker_name: str = "ray::IDLE",
+    ):
+        self.min_jobs = max(1, min_jobs)
+        self.max_jobs = max_jobs
+        self.initial_jobs = initial_jobs
+        self.max_memory_percent = max_memory_percent
+        self.max_cpu_percent = max_cpu_percent
+        self.worker_memory_limit_gb = worker_memory_limit_gb
+        self.poll_interval = poll_interval
+        self.decrease_cooldown = decrease_cooldown
+        self.idle_worker_name = idle_worker_name
+
+        self.limit = None
+        self._last_decrease = None
+        self.history = []
+        self._worker_pids = set()
+        self._reported_pids = set()
+
+    def start(self, n_jobs: int):
+        """Set the bounds and initial limit for a new run with n_jobs available workers."""
+        if self.max_jobs is None:
+            self.max_jobs = n_jobs
+        self.max_jobs = max(self.min_jobs, self.max_jobs)
+        self.limit = self._clip(self.initial_jobs or self.min_jobs)
+        self.history = []
+        self._last_decrease = None
+        psutil.cpu_percent(interval=None)  # the first call always returns 0
+
+    def update(self, busy_pids: list[int]) -> int:
+        """Sample resources, adjust the limit and restart leaking idle workers.
+
+        Args:
+            busy_pids: list[int]
+                PIDs of the workers currently running an episode.
+
+        Returns:
+            int: The number of episodes allowed to run concurrently.
+        """
+        if self.limit is None:
+            self.start(self.max_jobs or len(busy_pids) or self.min_jobs)
+
+        busy_pids = set(busy_pids)
+        self._worker_pids.update(busy_pids)
+        memory = psutil.virtual_memory()
+        cpu_percent = psutil.cpu_percent(interval=None)
+        worker_rss = {pid: process_tree_rss(pid) for pid in busy_pids}
+        worker_rss = {pid: rss for pid, rss in worker_rss.items() if rss is not None}
+        n_running = len(busy_pids)
+
+        now = time.monotonic()
+        if memory.percent > self.max_memory_percent or cpu_percent > self.max_cpu_percent:
+            cooling_down = (
+                self._last_decrease is not None
+                and now - self._last_decrease < self.decrease_cooldown
+            )
+            new_limit = self.limit if cooling_down else self._clip(min(self.limit, n_running) - 1)
+            if new_limit < self.limit:
+                self._last_decrease = now
+                logger.warning(
+                    f"Host usage is high (memory {memory.percent:.0f}%, cpu {cpu_percent:.0f}%). "
+                    f"Lowering concurrency to {new_limit}."
+                )
+        elif n_running >= self.limit and self._has_room_for_one_more(memory, worker_rss):
+            new_limit = self._clip(self.limit + 1)
+        else:
+            new_limit = self.limit
+
+        self.limit = new_limit
+        self.history.append(
+            dict(
+                time=time.time(),
+                limit=self.limit,
+                n_running=n_running,
+                memory_percent=memory.percent,
+                cpu_percent=cpu_percent,
+                mean_worker_rss_gb=_mean(worker_rss.values()) / GB if worker_rss else None,
+            )
+        )
+
+        self._report_leaking_busy_workers(worker_rss)
+        self.restart_leaking_workers(busy_pids)
+        return self.limit
+
+    def restart_leaking_workers(self, busy_pids: set[int] = ()) -> list[int]:
+        """Kill idle workers using more memory than worker_memory_limit_gb.
+
+        Returns:
+            list[int]: The PIDs of the killed workers.
+        """
+        if self.worker_memory_limit_gb is None:
+            return []
+
+        killed = []
+        for pid in list(self._worker_pids - set(busy_pids)):
+            try:
+                process = psutil.Process(pid)
+                if process.name() != self.idle_worker_name:
+                    continue  # busy with something else, e.g. a speculative duplicate
+                rss = process_tree_rss(pid)
+                if rss is not None and rss > self.worker_memory_limit_gb * GB:
+                    logger.warning(f"Worker {pid} uses {rss / GB:.1f}GB while idle, restarting it.")
+                    process.kill()
+                    killed.append(pid)
+                    self._worker_pids.discard(pid)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                self._worker_pids.discard(pid)
+        return killed
+
+    def _has_room_for_one_more(self, memory, worker_rss: dict[int, int]) -> bool:
+        if not worker_rss:
+            return True
+        projected_percent = memory.percent + 100 * _mean(worker_rss.values()) / memory.total
+        return projected_percent < self.max_memory_percent
+
+    def _report_leaking_busy_workers(self, worker_rss: dict[int, int]):
+        if self.worker_memory_limit_gb is None:
+            return
+        for pid, rss in worker_rss.items():
+            if rss > self.worker_memory_limit_gb * GB and pid not in self._reported_pids:
+                self._reported_pids.add(pid)
+                logger.warning(
+                    f"Worker {pid} uses {rss / GB:.1f}GB, it will be restarted once idle."
+                )
+
+    def _clip(self, n_jobs: int) -> int:
+        max_jobs = self.max_jobs if self.max_jobs is not None else n_jobs
+        return int(min(max(n_jobs, self.min_jobs), max_jobs))
+
+
+def process_tree_rss(pid: int) -> int | None:
+    """RSS in bytes of a process and all its children. None if the process does not exist."""
+    try:
+        process = psutil.Process(pid)
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        return rss
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return None
+
+
+def _mean(values):
+    return float(np.mean(list(values)))
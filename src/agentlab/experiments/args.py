@@ -1,8 +1,12 @@
 import copy
+import hashlib
+import json
 from abc import ABC
 from dataclasses import fields, is_dataclass
+from enum import Enum
 from itertools import product
-from typing import Any
+from pathlib import Path
+from typing import Any, Iterator
 
 import numpy as np
 
@@ -43,22 +47,27 @@ def _find_cprod_with_paths(obj, path=None):
         List[Tuple[List[str], CrossProd]]: A list of tuples where the first element is the path to the CrossProd
             object and the second element is the CrossProd object.
     """
+    return _find_with_paths(obj, CrossProd, path)
+
+
+def _find_with_paths(obj, cls, path=None):
+    """Find all the objects of type cls and their paths, through dataclasses and dicts."""
     if path is None:
         path = []
 
-    if isinstance(obj, CrossProd):
+    if isinstance(obj, cls):
         return [(path, obj)]
 
-    cprod_paths = []
+    found = []
     if is_dataclass(obj):
         for field in fields(obj):
             field_value = getattr(obj, field.name)
-            cprod_paths += _find_cprod_with_paths(field_value, path + [field.name])
+            found += _find_with_paths(field_value, cls, path + [field.name])
     elif isinstance(obj, dict):
         for key, value in obj.items():
-            cprod_paths += _find_cprod_with_paths(value, path + [key])
+            found += _find_with_paths(value, cls, path + [key])
 
-    return cprod_paths
+    return found
 
 
 def _set_value(obj, path, value):
@@ -177,6 +186,169 @@ def _sample_single(obj):
     return obj
 
 
+def iter_sweep(
+    obj: Any | list[Any],
+    n_samples: int = 1,
+    seed: int = None,
+    dedup: bool = True,
+    shard_index: int = 0,
+    n_shards: int = 1,
+    independent: bool = False,
+) -> Iterator[Any]:
+    """Lazily yield the configurations of a sweep, like `sample_and_expand_cross_product`.
+
+    Each object is sampled n_samples times (Distribution objects are replaced by a sample), then
+    each sample is expanded into all combinations of its CrossProd objects. Configurations are
+    generated one at a time and only the objects on the path to a changed value are copied: all
+    other sub-objects are shared between configurations and with obj. Set independent=True to get
+    deep copies, e.g. before calling `set_benchmark` on agent configurations.
+
+    Args:
+        obj: Any | List[Any],
+            The object(s) to sweep over.
+        n_samples: int,
+            Number of samples per object. Ignored for objects without Distribution.
+        seed: int,
+            Seed for sampling. If None, np.random is used. Must be the same for all shards.
+        dedup: bool,
+            If True, skip configurations identical to a previous one (see `config_hash`).
+        shard_index: int,
+            Index of the shard to generate, in [0, n_shards).
+        n_shards: int,
+            Number of shards. Configurations are assigned to shards by hash, so that identical
+            configurations fall in the same shard, and all shards together cover the sweep.
+        independent: bool,
+            If True, yield deep copies sharing nothing with obj or each other.
+
+    Yields:
+        Any: The configurations of the sweep, or of the requested shard.
+
+    Raises:
+        ValueError: If shard_index is not in [0, n_shards).
+    """
+    if not 0 <= shard_index < n_shards:
+        raise ValueError(f"shard_index must be in [0, {n_shards}), got {shard_index}.")
+
+    rng = np.random.default_rng(seed) if seed is not None else None
+    obj_list = obj if isinstance(obj, list) else [obj]
+    seen = set()
+
+    for obj in obj_list:
+        dist_paths = _find_with_paths(obj, Distribution)
+        for _ in range(n_samples if dist_paths else 1):
+            samples = [(path, _sample_distribution(dist, rng)) for path, dist in dist_paths]
+            sampled = _replace_paths(obj, samples)
+
+            cprod_paths = _find_cprod_with_paths(sampled)
+            paths = [path for path, _ in cprod_paths]
+            elements = [cprod.elements for _, cprod in cprod_paths]
+            for combo in product(*elements):
+                config = _replace_paths(sampled, list(zip(paths, combo)))
+
+                if dedup or n_shards > 1:
+                    digest = config_hash(config)
+                    if int(digest[:16], 16) % n_shards != shard_index:
+                        continue
+                    if dedup:
+                        key = bytes.fromhex(digest[:32])
+                        if key in seen:
+                            continue
+                        seen.add(key)
+
+                yield copy.deepcopy(config) if independent else config
+
+
+def _sample_distribution(dist: Distribution, rng=None):
+    if rng is None:
+        return dist.sample()
+    return dist.sample(rng=rng)
+
+
+def _replace_paths(obj, path_values):
+    """Copy of obj with the values at the given paths replaced.
+
+    Only the objects along the paths are (shallow) copied, everything else is shared with obj.
+    """
+    if not path_values:
+        return obj
+    for path, value in path_values:
+        if len(path) == 0:
+            return value
+
+    children = {}
+    for path, value in path_values:
+        children.setdefault(path[0], []).append((path[1:], value))
+
+    new_obj = copy.copy(obj)
+    for key, child_values in children.items():
+        if isinstance(obj, dict):
+            new_obj[key] = _replace_paths(obj[key], child_values)
+        else:
+            setattr(new_obj, key, _replace_paths(getattr(obj, key), child_values))
+    return new_obj
+
+
+def config_hash(obj, exclude: tuple[str] = ()) -> str:
+    """Stable hash of a (nested) dataclass configuration.
+
+    Dataclasses and other objects are hashed by class name and attribute values, recursively.
+    Functions and classes are hashed by their qualified name.
+
+    Args:
+        obj: Any
+            The configuration to hash.
+        exclude: tuple[str]
+            Names of top level fields to ignore.
+
+    Returns:
+        str: The sha256 hex digest.
+
+    Raises:
+        TypeError: If the configuration contains an object without a stable representation,
+            e.g. a lambda.
+    """
+    canonical = _canonical(obj)
+    if isinstance(canonical, dict):
+        canonical = {key: value for key, value in canonical.items() if key not in exclude}
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _canonical(obj):
+    """JSON serializable representation of a configuration."""
+    if is_dataclass(obj) and not isinstance(obj, type):
+        canonical = {"__class__": f"{type(obj).__module__}.{type(obj).__qualname__}"}
+        for field in fields(obj):
+            canonical[field.name] = _canonical(getattr(obj, field.name, None))
+        return canonical
+    if isinstance(obj, dict):
+        return {str(key): _canonical(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(value) for value in obj]
+    if isinstance(obj, (set, frozenset)):
+        return sorted((_canonical(value) for value in obj), key=repr)
+    if isinstance(obj, Enum):
+        return f"{type(obj).__qualname__}.{obj.name}"
+    if isinstance(obj, Path):
+        return str(obj)
+    if obj is None or isinstance(obj, (str, bool, int, float)):
+        return obj
+    if hasattr(obj, "item"):  # numpy scalars
+        return obj.item()
+    # the repr of other objects usually contains their memory address, which changes every run
+    if isinstance(obj, type) or (callable(obj) and hasattr(obj, "__qualname__")):
+        name = f"{obj.__module__}.{obj.__qualname__}"
+        if "<" in name:  # lambdas and local functions don't have a unique name
+            raise TypeError(f"Can't hash {obj!r}, it doesn't have a unique name.")
+        return name
+    if hasattr(obj, "__dict__"):
+        canonical = {"__class__": f"{type(obj).__module__}.{type(obj).__qualname__}"}
+        for key, value in vars(obj).items():
+            canonical[key] = _canonical(value)
+        return canonical
+    raise TypeError(f"Can't hash {obj!r} of type {type(obj).__qualname__}.")
+
+
 class Toggle:
     pass
 
@@ -0,0 +1,312 @@
+"""Estimate the duration and cost of a study before launching it.
+
+Past episodes (see `scheduling.load_episode_records`) give the expected duration, token usage and
+cost of each experiment. Combined with the dependency graph, this predicts the wall time of the
+study for a range of n_jobs and recommends the smallest n_jobs close to the best wall time.
+
+Usage:
+    agentlab-estimate --benchmark miniwob --agent_config agentlab.agents.generic_agent.AGENT_4o_MINI --history path/to/previous/study
+"""
+
+import argparse
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+import bgym
+import numpy as np
+import pandas as pd
+
+from agentlab.agents.agent_args import AgentArgs
+from agentlab.experiments import graph_analysis, scheduling
+from agentlab.experiments.launch_exp import import_object
+from agentlab.experiments.study import Study
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_N_JOBS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+@dataclass
+class StudyEstimate:
+    """Predicted wall time and LLM usage of a study.
+
+    Attributes:
+        n_exp: int
+            Number of experiments to run (dummy experiments are excluded).
+        n_with_history: int
+            Number of experiments whose duration comes from past episodes of the same task. The
+            others fall back to env_args.max_steps.
+        n_jobs_list: list[int]
+            The n_jobs that were evaluated.
+        makespans: list[float]
+            Predicted wall time in seconds for each n_jobs.
+        total_duration: float
+            Sum of the expected durations, i.e. the wall time with n_jobs=1.
+        critical_path: float
+            Wall time with unlimited workers, limited by the dependency graph.
+        max_parallelism: int
+            Maximum number of experiments that can run at the same time given the dependency
+            graph. More workers than that are never used.
+        input_tokens: float
+            Expected total number of input tokens.
+        output_tokens: float
+            Expected total number of output tokens.
+        cost: float
+            Expected total cost in USD.
+        n_with_usage: int
+            Number of experiments with token and cost history. Usage of the others is unknown
+            and not included in the totals.
+        recommended_n_jobs: int
+            Smallest n_jobs whose makespan is within tolerance of the best one.
+    """
+
+    n_exp: int
+    n_with_history: int
+    n_jobs_list: list[int]
+    makespans: list[float]
+    total_duration: float
+    critical_path: float
+    max_parallelism: int
+    input_tokens: float
+    output_tokens: float
+    cost: float
+    n_with_usage: int
+    recommended_n_jobs: int
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Wall time, speedup and efficiency for each n_jobs."""
+        makespans = np.array(self.makespans, dtype=float)
+        n_jobs = np.array(self.n_jobs_list)
+        speedup = self.total_duration / np.maximum(makespans, 1e-9)
+        return pd.DataFrame(
+            {
+                "n_jobs": n_jobs,
+                "wall_time_h": makespans / 3600,
+                "speedup": speedup,
+                "efficiency": speedup / n_jobs,
+            }
+        ).set_index("n_jobs")
+
+    def __str__(self):
+        lines = [
+            f"Experiments: {self.n_exp} ({self.n_with_history} with duration history)",
+            f"Sequential time: {self.total_duration / 3600:.2f} h",
+            f"Critical path: {self.critical_path / 3600:.2f} h",
+            f"Max parallelism: {self.max_parallelism}",
+            f"Tokens: {self.input_tokens:,.0f} input, {self.output_tokens:,.0f} output"
+            f" ({self.n_with_usage} experiments with usage history)",
+            f"Cost: ${self.cost:,.2f}",
+            "",
+            self.to_dataframe().to_string(float_format="{:.2f}".format),
+            "",
+            f"Recommended n_jobs: {self.recommended_n_jobs}",
+        ]
+        return "\n".join(lines)
+
+
+def estimate_study(
+    study: Study | bgym.Benchmark | str,
+    agent_args: list[AgentArgs] | AgentArgs = None,
+    history_dirs: list[Path] | Path = None,
+    n_jobs_list: list[int] = None,
+    order_by_duration: bool = None,
+    ignore_dependencies: bool = False,
+    tolerance: float = 0.1,
+) -> StudyEstimate:
+    """Predict the wall time, token usage and cost of a study.
+
+    Args:
+        study: Study | bgym.Benchmark | str
+            The study to estimate, or a benchmark to run agent_args on.
+        agent_args: list[AgentArgs] | AgentArgs
+            The agents to run on the benchmark. Ignored if study is a Study.
+        history_dirs: list[Path] | Path
+            Directories of previous studies to get episode statistics from. Defaults to
+            study.duration_history.
+        n_jobs_list: list[int]
+            The n_jobs to evaluate. Defaults to powers of 2 up to the maximum parallelism of the
+            dependency graph.
+        order_by_duration: bool
+            If True, assume longest first submission. Defaults to study.order_by_duration.
+        ignore_dependencies: bool
+            Passed to the Study when building it from a benchmark.
+        tolerance: float
+            Relative slack on the best wall time used to recommend n_jobs.
+
+    Returns:
+        StudyEstimate: The estimate.
+    """
+    if not isinstance(study, Study):
+        study = Study(agent_args, study, ignore_dependencies=ignore_dependencies)
+    if history_dirs is None:
+        history_dirs = study.duration_history
+    if order_by_duration is None:
+        order_by_duration = study.order_by_duration
+
+    exp_args_list = study.exp_args_list
+    records = scheduling.load_episode_records(history_dirs) if history_dirs else None
+    task_durations = scheduling.durations_by_task(records) if records is not None else {}
+
+    durations = scheduling.expected_durations(exp_args_list, task_durations)
+    if order_by_duration:
+        order = scheduling.longest_first_indices(exp_args_list, durations)
+        exp_args_list = [exp_args_list[i] for i in order]
+        durations = [durations[i] for i in order]
+
+    to_run = [not getattr(exp_args, "is_dummy", False) for exp_args in exp_args_list]
+    n_exp = sum(to_run)
+    dep_graph = graph_analysis.graph_from_exp_args(exp_args_list)
+    parallelism = graph_analysis.max_parallelism(dep_graph)
+    if n_jobs_list is None:
+        n_jobs_list = [n for n in DEFAULT_N_JOBS if n < parallelism] + [max(1, parallelism)]
+    makespans = [
+        scheduling.estimate_makespan(exp_args_list, durations, n_jobs) for n_jobs in n_jobs_list
+    ]
+
+    usage = expected_usage(exp_args_list, records)
+    usage = usage[to_run]
+    known_usage = usage.dropna()
+
+    return StudyEstimate(
+        n_exp=n_exp,
+        n_with_history=sum(
+            exp_args.env_args.task_name in task_durations
+            for exp_args, run in zip(exp_args_list, to_run)
+            if run
+        ),
+        n_jobs_list=list(n_jobs_list),
+        makespans=makespans,
+        total_duration=float(sum(durations)),
+        critical_path=graph_analysis.critical_path(dep_graph, dict(zip(dep_graph, durations)))[0],
+        max_parallelism=parallelism,
+        input_tokens=float(known_usage["input_tokens"].sum()),
+        output_tokens=float(known_usage["output_tokens"].sum()),
+        cost=float(known_usage["cost"].sum()),
+        n_with_usage=len(known_usage),
+        recommended_n_jobs=recommend_n_jobs(n_jobs_list, makespans, tolerance=tolerance),
+    )
+
+
+def expected_usage(exp_args_list: list[bgym.ExpArgs], records: pd.DataFrame = None) -> pd.DataFrame:
+    """Expected token usage and cost of each experiment.
+
+    Uses the median over past episodes of the same agent on the same task. Falls back to the
+    median over all tasks of the same agent, then to the median over all agents on the same task.
+
+    Args:
+        exp_args_list: list[ExpArgs]
+            The experiments to estimate.
+        records: pd.DataFrame
+            Past episodes as returned by `scheduling.load_episode_records`.
+
+    Returns:
+        pd.DataFrame: Columns input_tokens, output_tokens and cost, one row per experiment in the
+            same order. Unknown values are NaN.
+    """
+    columns = ["input_tokens", "output_tokens", "cost"]
+    if records is None or len(records) == 0:
+        return pd.DataFrame(np.nan, index=range(len(exp_args_list)), columns=columns)
+
+    records = records.dropna(subset=columns)
+    by_agent_task = records.groupby(["agent_name", "task_name"])[columns].median()
+    by_agent = records.groupby("agent_name")[columns].median()
+    by_task = records.groupby("task_name")[columns].median()
+
+    rows = []
+    for exp_args in exp_args_list:
+        agent_name = getattr(exp_args.agent_args, "agent_name", None)
+        task_name = exp_args.env_args.task_name
+        if (agent_name, task_name) in by_agent_task.index:
+            rows.append(by_agent_task.loc[(agent_name, task_name)])
+        elif agent_name in by_agent.index:
+            rows.append(by_agent.loc[agent_name])
+        elif task_name in by_task.index:
+            rows.append(by_task.loc[task_name])
+        else:
+            rows.append(pd.Series(np.nan, index=columns))
+    return pd.DataFrame(rows, columns=columns).reset_index(drop=True)
+
+
+def recommend_n_jobs(n_jobs_list: list[int], makespans: list[float], tolerance: float = 0.1) -> int:
+    """Smallest n_jobs whose makespan is within tolerance of the best makespan.
+
+    Past the knee of the curve, more workers barely reduce the wall time, e.g. because of the
+    dependency graph or a few long episodes.
+
+    Args:
+        n_jobs_list: list[int]
+            The evaluated n_jobs.
+        makespans: list[float]
+            The makespan for each n_jobs.
+        tolerance: float
+            Relative slack on the best makespan.
+
+    Returns:
+        int: The recommended n_jobs.
+    """
+    best = min(makespans)
+    candidates = [
+        n_jobs
+        for n_jobs, makespan in zip(n_jobs_list, makespans)
+        if makespan <= best * (1 + tolerance)
+    ]
+    return min(candidates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the duration and cost of a study.")
+    parser.add_argument(
+        "--study_dir",
+        type=str,
+        default=None,
+        help="Directory of an existing study to estimate (e.g. before relaunching it).",
+    )
+    parser.add_argument(
+        "--benchmark", type=str, default=None, help="Name of the benchmark, e.g. miniwob_tiny_test."
+    )
+    parser.add_argument(
+        "--agent_config",
+        type=str,
+        nargs="+",
+        default=["agentlab.agents.generic_agent.AGENT_4o_MINI"],
+        help="Python path to the agent config(s).",
+    )
+    parser.add_argument(
+        "--history",
+        type=str,
+        nargs="*",
+        default=None,
+        help="Directories of previous studies to get episode durations, tokens and cost from.",
+    )
+    parser.add_argument("--n_jobs", type=int, nargs="+", default=None, help="n_jobs to evaluate.")
+    parser.add_argument("--order_by_duration", action="store_true")
+    parser.add_argument("--ignore_dependencies", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+
+    args = parser.parse_args()
+
+    if args.study_dir is not None:
+        study = Study.load(args.study_dir)
+        study.find_incomplete()
+        agent_args = None
+    elif args.benchmark is not None:
+        study = args.benchmark
+        agent_args = [import_object(path) for path in args.agent_config]
+    else:
+        parser.error("Either --study_dir or --benchmark is required.")
+
+    estimate = estimate_study(
+        study,
+        agent_args=agent_args,
+        history_dirs=args.history,
+        n_jobs_list=args.n_jobs,
+        order_by_duration=args.order_by_duration or None,
+        ignore_dependencies=args.ignore_dependencies,
+        tolerance=args.tolerance,
+    )
+    print(estimate)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,12 +26,23 @@ RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
 
 def run_exp(exp_arg: ExpArgs, *dependencies, avg_step_timeout=60):
-    """Run exp_args.run() with a timeout and handle dependencies."""
+    """Run exp_args.run() with a timeout and handle dependencies.
+
+    If exp_arg has a `step_deadlines` attribute, each step of the episode is watched by a
+    `StepWatchdog` (see `agentlab.experiments.step_watchdog`).
+    """
     # episode_timeout = _episode_timeout(exp_arg, avg_step_timeout=avg_step_timeout)
     # logger.warning(f"Running {exp_arg.exp_id} with timeout of {episode_timeout} seconds.")
     # with timeout_manager(seconds=episode_timeout):
     # this timeout method is not robust enough. using ray.cancel instead
-    return exp_arg.run()
+    step_deadlines = getattr(exp_arg, "step_deadlines", None)
+    if step_deadlines is None or getattr(exp_arg, "is_dummy", False):
+        return exp_arg.run()
+
+    from agentlab.experiments.step_watchdog import watch_episode
+
+    with watch_episode(exp_arg, step_deadlines):
+        return exp_arg.run()
 
 
 def _episode_timeout(exp_arg: ExpArgs, avg_step_timeout=60):
@@ -130,14 +141,27 @@ def add_dependencies(exp_args_list: list[ExpArgs], task_dependencies: dict[str,
 
 
 # Mock implementation of the ExpArgs class with timestamp checks for unit testing
+class MockedAgentArgs:
+    def prepare(self):
+        pass
+
+    def close(self):
+        pass
+
+
 class MockedExpArgs:
-    def __init__(self, exp_id, depends_on=None):
+    def __init__(self, exp_id, depends_on=None, task_time=3):
         self.exp_id = exp_id
         self.exp_name = f"exp_{exp_id}"
         self.depends_on = depends_on if depends_on else []
+        self.task_time = task_time
         self.start_time = None
         self.end_time = None
         self.env_args = None
+        self.agent_args = MockedAgentArgs()
+
+    def prepare(self, exp_root):
+        pass
 
     def run(self):
         self.start_time = time()
@@ -147,7 +171,7 @@ class MockedExpArgs:
 
         # pw = playwright.sync_api.sync_playwright().start()
         # pw.selectors.set_test_id_attribute("mytestid")
-        sleep(3)  # Simulate task execution time
+        sleep(self.task_time)  # Simulate task execution time
         self.end_time = time()
         return self
 
@@ -0,0 +1,292 @@
+"""Analysis of task dependency graphs, e.g. `benchmark.dependency_graph_over_tasks()`.
+
+A dependency graph is a dict mapping each task to the list of tasks it depends on. Dependencies
+that are not keys of the dict are ignored. All functions are linear in the size of the graph,
+except `max_antichain` which needs the transitive closure.
+"""
+
+
+def successor_index(dep_graph: dict[str, list[str]]) -> dict[str, list[str]]:
+    """Map each task to the list of tasks depending on it.
+
+    Args:
+        dep_graph: dict[str, list[str]]
+            Mapping from task to its dependencies.
+
+    Returns:
+        dict[str, list[str]]: Mapping from task to its successors, with the same keys as
+            dep_graph.
+    """
+    successors = {node: [] for node in dep_graph}
+    for node, deps in dep_graph.items():
+        for dep in deps:
+            if dep in successors:
+                successors[dep].append(node)
+    return successors
+
+
+def topological_order(dep_graph: dict[str, list[str]]) -> list[str]:
+    """Order tasks such that dependencies come before their dependents.
+
+    Raises:
+        ValueError: If the graph has a cycle.
+    """
+    return [node for level in topological_levels(dep_graph) for node in level]
+
+
+def topological_levels(dep_graph: dict[str, list[str]]) -> list[list[str]]:
+    """Group tasks by the length of the longest dependency chain leading to them.
+
+    Level 0 contains the tasks without dependencies. Tasks of a level only depend on tasks of
+    previous levels, so each level can run fully in parallel once the previous ones are done.
+
+    Args:
+        dep_graph: dict[str, list[str]]
+            Mapping from task to its dependencies.
+
+    Returns:
+        list[list[str]]: The tasks of each level, in the order of dep_graph.
+
+    Raises:
+        ValueError: If the graph has a cycle.
+    """
+    successors = successor_index(dep_graph)
+    n_pending = {node: sum(dep in dep_graph for dep in deps) for node, deps in dep_graph.items()}
+
+    levels = []
+    current = [node for node, n in n_pending.items() if n == 0]
+    n_visited = 0
+    while current:
+        levels.append(current)
+        n_visited += len(current)
+        next_level = []
+        for node in current:
+            for succ in successors[node]:
+                n_pending[succ] -= 1
+                if n_pending[succ] == 0:
+                    next_level.append(succ)
+        current = next_level
+
+    if n_visited != len(dep_graph):
+        raise ValueError("The dependency graph has a cycle.")
+    return levels
+
+
+def compress_chains(
+    dep_graph: dict[str, list[str]],
+) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
+    """Merge chains of tasks into single nodes.
+
+    A chain is a maximal sequence of tasks t1 -> t2 -> ... -> tk where each task t(i+1) depends
+    only on t(i), and t(i+1) is the only task depending on t(i). Chains have to run
+    sequentially, so they can be treated as a single task for planning. Merged nodes are named
+    "{t1}-{tk}".
+
+    Args:
+        dep_graph: dict[str, list[str]]
+            Mapping from task to its dependencies.
+
+    Returns:
+        tuple[dict[str, list[str]], dict[str, list[str]]]: The compressed graph and a mapping
+            from each node of the compressed graph to the tasks it contains, in order.
+    """
+    successors = successor_index(dep_graph)
+    deps_of = {node: [dep for dep in deps if dep in dep_graph] for node, deps in dep_graph.items()}
+
+    def continues_chain(node):
+        """True if node is merged with its single dependency."""
+        deps = deps_of[node]
+        return len(deps) == 1 and len(successors[deps[0]]) == 1 and deps[0] != node
+
+    chains = {}
+    node_to_chain = {}
+    for node in dep_graph:
+        if continues_chain(node):
+            continue  # will be added when walking from the head of its chain
+        chain = [node]
+        while len(successors[chain[-1]]) == 1 and continues_chain(successors[chain[-1]][0]):
+            chain.append(successors[chain[-1]][0])
+        name = node if len(chain) == 1 else f"{chain[0]}-{chain[-1]}"
+        chains[name] = chain
+        for task in chain:
+            node_to_chain[task] = name
+
+    compressed = {
+        name: [node_to_chain[dep] for dep in deps_of[chain[0]]] for name, chain in chains.items()
+    }
+    return compressed, chains
+
+
+def critical_path(
+    dep_graph: dict[str, list[str]], durations: dict[str, float] = None
+) -> tuple[float, list[str]]:
+    """Find the longest chain of dependent tasks.
+
+    This is a lower bound on the makespan, whatever the number of workers.
+
+    Args:
+        dep_graph: dict[str, list[str]]
+            Mapping from task to its dependencies.
+        durations: dict[str, float]
+            Duration of each task. Missing tasks have a duration of 1. If None, the length is the
+            number of tasks on the path.
+
+    Returns:
+        tuple[float, list[str]]: The length of the critical path and its tasks, in order.
+    """
+    durations = durations or {}
+    finish = {}
+    parent = {}
+    for node in topological_order(dep_graph):
+        start = 0.0
+        parent[node] = None
+        for dep in dep_graph[node]:
+            if dep in finish and finish[dep] > start:
+                start = finish[dep]
+                parent[node] = dep
+        finish[node] = start + durations.get(node, 1)
+
+    if not finish:
+        return 0.0, []
+
+    node = max(finish, key=finish.get)
+    length = finish[node]
+    path = []
+    while node is not None:
+        path.append(node)
+        node = parent[node]
+    return length, path[::-1]
+
+
+def max_antichain(dep_graph: dict[str, list[str]]) -> list[str]:
+    """Find the largest set of tasks that are pairwise independent.
+
+    No task of the set depends, directly or transitively, on another one. Its size is the
+    maximum number of tasks that can ever run in parallel, so more workers than that is wasted.
+    Computed with Dilworth's theorem: a maximum matching between the tasks and their transitive
+    successors gives a minimum chain cover, and König's theorem recovers the antichain.
+
+    Args:
+        dep_graph: dict[str, list[str]]
+            Mapping from task to its dependencies.
+
+    Returns:
+        list[str]: The tasks of a maximum antichain, in the order of dep_graph.
+
+    Raises:
+        ValueError: If the graph has a cycle.
+    """
+    nodes = list(dep_graph)
+    index = {node: i for i, node in enumerate(nodes)}
+    reach = _transitive_successors(dep_graph, index)
+    adjacency = [_bits_to_list(bits) for bits in reach]
+
+    match_left, match_right = _hopcroft_karp(adjacency, len(nodes))
+
+    # König: starting from unmatched left nodes, alternate non-matching and matching edges.
+    visited_left = [False] * len(nodes)
+    visited_right = [False] * len(nodes)
+    stack = [u for u in range(len(nodes)) if match_left[u] == -1]
+    for u in stack:
+        visited_left[u] = True
+    while stack:
+        u = stack.pop()
+        for v in adjacency[u]:
+            if not visited_right[v] and match_left[u] != v:
+                visited_right[v] = True
+                w = match_right[v]
+                if w != -1 and not visited_left[w]:
+                    visited_left[w] = True
+                    stack.append(w)
+
+    # minimum vertex cover = unvisited left + visited right. The antichain is its complement.
+    return [node for i, node in enumerate(nodes) if visited_left[i] and not visited_right[i]]
+
+
+def max_parallelism(dep_graph: dict[str, list[str]]) -> int:
+    """Maximum number of tasks that can run in parallel. See `max_antichain`."""
+    return len(max_antichain(dep_graph))
+
+
+def graph_from_exp_args(exp_args_list) -> dict[str, list[str]]:
+    """Dependency graph over experiments, keyed by exp_id (or position if exp_id is None)."""
+    return {
+        exp_args.exp_id if exp_args.exp_id is not None else str(i): list(exp_args.depends_on)
+        for i, exp_args in enumerate(exp_args_list)
+    }
+
+
+def _transitive_successors(dep_graph, index) -> list[int]:
+    """Bitset of all the transitive successors of each node."""
+    successors = successor_index(dep_graph)
+    reach = [0] * len(index)
+    for node in reversed(topological_order(dep_graph)):
+        bits = 0
+        for succ in successors[node]:
+            bits |= reach[index[succ]] | (1 << index[succ])
+        reach[index[node]] = bits
+    return reach
+
+
+def _bits_to_list(bits: int) -> list[int]:
+    indices = []
+    while bits:
+        low = bits & -bits
+        indices.append(low.bit_length() - 1)
+        bits ^= low
+    return indices
+
+
+def _hopcroft_karp(adjacency: list[list[int]], n_right: int) -> tuple[list[int], list[int]]:
+    """Maximum bipartite matching. Returns the match of each left and right node, or -1."""
+    n_left = len(adjacency)
+    match_left = [-1] * n_left
+    match_right = [-1] * n_right
+    inf = float("inf")
+
+    while True:
+        # BFS from free left nodes to build layers
+        dist = [inf] * n_left
+        queue = [u for u in range(n_left) if match_left[u] == -1]
+        for u in queue:
+            dist[u] = 0
+        found = False
+        head = 0
+        while head < len(queue):
+            u = queue[head]
+            head += 1
+            for v in adjacency[u]:
+                w = match_right[v]
+                if w == -1:
+                    found = True
+                elif dist[w] == inf:
+                    dist[w] = dist[u] + 1
+                    queue.append(w)
+        if not found:
+            return match_left, match_right
+
+        # iterative DFS along the layers to find vertex-disjoint augmenting paths
+        next_edge = [0] * n_left
+        for root in range(n_left):
+            if match_left[root] != -1:
+                continue
+            path = [root]
+            while path:
+                u = path[-1]
+                if next_edge[u] == len(adjacency[u]):
+                    dist[u] = inf  # dead end
+                    path.pop()
+                    continue
+                v = adjacency[u][next_edge[u]]
+                next_edge[u] += 1
+                w = match_right[v]
+                if w == -1:
+                    # augment along the path
+                    for u in reversed(path):
+                        v_prev = match_left[u]
+                        match_left[u] = v
+                        match_right[v] = u
+                        v = v_prev
+                    break
+                if dist[w] == dist[u] + 1:
+                    path.append(w)
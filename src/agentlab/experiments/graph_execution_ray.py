@@ -2,13 +2,19 @@
 
 # # Disable Ray log deduplication
 # os.environ["RAY_DEDUP_LOGS"] = "0"
+import json
 import logging
 import time
+from copy import deepcopy
+from pathlib import Path
 
 import bgym
+import numpy as np
 import ray
+from browsergym.experiments.loop import ExpResult, _move_old_exp
 from ray.util import state
 
+from agentlab.experiments.adaptive_concurrency import AdaptiveConcurrency
 from agentlab.experiments.exp_utils import _episode_timeout, run_exp
 
 logger = logging.getLogger(__name__)
@@ -16,8 +22,47 @@ logger = logging.getLogger(__name__)
 run_exp = ray.remote(run_exp)
 
 
-def execute_task_graph(exp_args_list: list[bgym.ExpArgs], avg_step_timeout=60):
-    """Execute a task graph in parallel while respecting dependencies using Ray."""
+def execute_task_graph(
+    exp_args_list: list[bgym.ExpArgs],
+    avg_step_timeout=60,
+    speculative_execution=False,
+    task_durations: dict[str, list[float]] = None,
+    concurrency: AdaptiveConcurrency = None,
+    task_options: dict = None,
+    max_running: int = None,
+    kill_grace: float = 60,
+):
+    """Execute a task graph in parallel while respecting dependencies using Ray.
+
+    Args:
+        exp_args_list: list[ExpArgs]
+            List of experiments to run. Dependencies are specified with `exp_args.depends_on`.
+        avg_step_timeout: int
+            Used to compute the timeout of each episode. See `_episode_timeout`.
+        speculative_execution: bool
+            If True, launch duplicates of straggling episodes on idle workers. See
+            `SpeculativeExecution`.
+        task_durations: dict[str, list[float]]
+            Historical episode durations (in seconds) keyed by task name. Only used with
+            speculative_execution to decide when an episode is a straggler.
+        concurrency: AdaptiveConcurrency
+            If not None, tasks are submitted lazily, once their dependencies are finished and
+            while the number of running tasks is below the limit of the controller. See
+            `AdaptiveDispatcher`.
+        task_options: dict
+            Extra ray options of each task, e.g. the scheduling strategy of a resource
+            reservation. See `RayRuntime.reserve`.
+        max_running: int
+            Number of tasks that can run concurrently, when the tasks don't have the whole ray
+            runtime for themselves. Used by speculative_execution to count idle workers.
+        kill_grace: float
+            Seconds given to a cancelled episode to stop before it is force killed. See
+            `poll_for_timeout`.
+
+    Returns:
+        dict[str, Any]: Dictionary of exp_id: result
+    """
+    task_options = task_options or {}
 
     exp_args_map = {exp_args.exp_id: exp_args for exp_args in exp_args_list}
     task_map = {}
@@ -28,21 +73,53 @@ def execute_task_graph(exp_args_list: list[bgym.ExpArgs], avg_step_timeout=60):
             dependency_tasks = [get_task(exp_args_map[dep_key]) for dep_key in exp_arg.depends_on]
 
             # Create new task that depends on the dependency results
-            task_map[exp_arg.exp_id] = run_exp.options(name=f"{exp_arg.exp_name}").remote(
-                exp_arg, *dependency_tasks, avg_step_timeout=avg_step_timeout
-            )
+            task_map[exp_arg.exp_id] = run_exp.options(
+                name=f"{exp_arg.exp_name}", **task_options
+            ).remote(exp_arg, *dependency_tasks, avg_step_timeout=avg_step_timeout)
         return task_map[exp_arg.exp_id]
 
-    # Build task graph
-    for exp_arg in exp_args_list:
-        get_task(exp_arg)
-
     max_timeout = max([_episode_timeout(exp_args, avg_step_timeout) for exp_args in exp_args_list])
+    poll_interval = max_timeout * 0.1
 
-    return poll_for_timeout(task_map, max_timeout, poll_interval=max_timeout * 0.1)
+    dispatcher = None
+    if concurrency is None:
+        # Build task graph
+        for exp_arg in exp_args_list:
+            get_task(exp_arg)
+    else:
+        dispatcher = AdaptiveDispatcher(exp_args_list, get_task, concurrency)
+        dispatcher.update(task_map, [], [])
+        poll_interval = min(poll_interval, concurrency.poll_interval)
 
+    speculator = None
+    if speculative_execution:
+        speculator = SpeculativeExecution(
+            exp_args_list,
+            task_durations=task_durations,
+            avg_step_timeout=avg_step_timeout,
+            task_options=task_options,
+            max_running=max_running,
+        )
+        poll_interval = min(poll_interval, speculator.poll_interval)
 
-def poll_for_timeout(tasks: dict[str, ray.ObjectRef], timeout: float, poll_interval: float = 1.0):
+    return poll_for_timeout(
+        task_map,
+        max_timeout,
+        poll_interval=poll_interval,
+        speculator=speculator,
+        dispatcher=dispatcher,
+        kill_grace=kill_grace,
+    )
+
+
+def poll_for_timeout(
+    tasks: dict[str, ray.ObjectRef],
+    timeout: float,
+    poll_interval: float = 1.0,
+    speculator: "SpeculativeExecution" = None,
+    dispatcher: "AdaptiveDispatcher" = None,
+    kill_grace: float = 60,
+):
     """Cancel tasks that exceeds the timeout
 
     I tried various different methods for killing a job that hangs. so far it's
@@ -55,38 +132,71 @@ def poll_for_timeout(tasks: dict[str, ray.ObjectRef], timeout: float, poll_inter
             Timeout in seconds
         poll_interval: float
             Polling interval in seconds
+        speculator: SpeculativeExecution
+            If not None, it is given the chance to launch duplicates of straggling tasks and
+            `tasks` is updated inplace with the winning attempts.
+        dispatcher: AdaptiveDispatcher
+            If not None, it submits pending tasks as resources allow. `tasks` is updated inplace
+            with the new submissions.
+        kill_grace: float
+            Seconds after the timeout during which tasks are cancelled gracefully, before being
+            force killed.
 
     Returns:
         dict[str, Any]: Dictionary of task_id: result
     """
-    task_list = list(tasks.values())
-    task_ids = list(tasks.keys())
-
     logger.warning(f"Any task exceeding {timeout} seconds will be cancelled.")
 
     while True:
+        if speculator is None:
+            task_list = list(tasks.values())
+        else:
+            task_list = speculator.all_refs(tasks)
+
         ready, not_ready = ray.wait(task_list, num_returns=len(task_list), timeout=poll_interval)
+        elapsed_times = {}
         for task in not_ready:
             elapsed_time = get_elapsed_time(task)
+            elapsed_times[task] = elapsed_time
             # print(f"Task {task.task_id().hex()} elapsed time: {elapsed_time}")
             if elapsed_time is not None and elapsed_time > timeout:
                 msg = f"Task {task.task_id().hex()} hase been running for {elapsed_time}s, more than the timeout: {timeout}s."
-                if elapsed_time < timeout + 60 + poll_interval:
+                if elapsed_time < timeout + kill_grace + poll_interval:
                     logger.warning(msg + " Cancelling task.")
                     ray.cancel(task, force=False, recursive=False)
                 else:
                     logger.warning(msg + " Force killing.")
                     ray.cancel(task, force=True, recursive=False)
-        if len(ready) == len(task_list):
-            results = []
-            for task in ready:
+
+        n_idle = None
+        if dispatcher is not None:
+            dispatcher.update(tasks, task_list, ready)
+            n_idle = dispatcher.n_idle
+
+        if speculator is not None:
+            speculator.update(tasks, ready, elapsed_times, n_idle=n_idle)
+
+        # the updates may have submitted tasks or duplicates that were not waited on yet
+        current_refs = list(tasks.values()) if speculator is None else speculator.all_refs(tasks)
+        all_ready = set(current_refs) <= set(ready)
+        if all_ready and (dispatcher is None or dispatcher.is_done()):
+            results = {}
+            for task_id, task in tasks.items():
                 try:
                     result = ray.get(task)
                 except Exception as e:
                     result = e
-                results.append(result)
+                results[task_id] = result
 
-            return {task_id: result for task_id, result in zip(task_ids, results)}
+            return results
+
+
+def get_duration(task_ref: ray.ObjectRef):
+    """Return the running time of a finished task, or None if not available."""
+    task_info = state.get_task(task_ref.task_id().hex(), address="auto")
+    if task_info and task_info.start_time_ms is not None and task_info.end_time_ms is not None:
+        return (task_info.end_time_ms - task_info.start_time_ms) / 1000.0
+    return None
 
 
 def get_elapsed_time(task_ref: ray.ObjectRef):
@@ -99,3 +209,275 @@ def get_elapsed_time(task_ref: ray.ObjectRef):
         return elapsed_time
     else:
         return None  # Task has not started yet
+
+
+class SpeculativeExecution:
+    """Launch duplicates of straggling episodes and keep the first attempt to finish.
+
+    Long-tail episodes (e.g. a page that loads slowly, or an LLM stuck in retries) often decide the
+    total time of a study. When the queue is empty and some workers are idle, any independent
+    episode (no dependencies and no dependents) running for more than `slack` times the
+    `quantile` of its historical durations is launched a second time, in a fresh directory.
+
+    The first attempt to finish successfully wins, an attempt whose summary_info has an `err_msg`
+    counts as failed. The other one is force-cancelled and its directory is hidden (prefixed with
+    "_") so that results are not mixed. When an attempt fails, the other one keeps running. Each
+    episode is duplicated at most once.
+
+    Historical durations come from `task_durations` when there is enough history for the task,
+    otherwise from all durations available, including episodes completed during this run.
+
+    Limitations:
+        - Only independent episodes are duplicated. Episodes of tasks that need an instance reset
+          (e.g. webarena tasks chained with `depends_on`) share their backend state, and running
+          two attempts at once would corrupt it. Duplicating them after a reset of the instance
+          is not supported.
+        - Only the ray backend supports speculative execution. With joblib or sequential
+          execution, `speculative_execution` is ignored.
+
+    Attributes:
+        exp_args_map: dict[str, ExpArgs]
+            The experiments being executed, by exp_id.
+        candidates: set[str]
+            exp_ids of experiments that can safely be duplicated.
+        task_durations: dict[str, list[float]]
+            Historical episode durations in seconds, keyed by task name.
+        observed_durations: list[float]
+            Durations of tasks completed during this run.
+        races: dict[str, tuple[ObjectRef, ObjectRef, ExpArgs]]
+            Ongoing races, exp_id: (original_ref, duplicate_ref, duplicate_exp_args).
+    """
+
+    def __init__(
+        self,
+        exp_args_list: list[bgym.ExpArgs],
+        task_durations: dict[str, list[float]] = None,
+        quantile=0.9,
+        slack=1.5,
+        min_history=5,
+        poll_interval=10,
+        avg_step_timeout=60,
+        task_options: dict = None,
+        max_running: int = None,
+    ):
+        self.exp_args_map = {exp_args.exp_id: exp_args for exp_args in exp_args_list}
+        dependents = {dep for exp_args in exp_args_list for dep in exp_args.depends_on}
+        self.candidates = {
+            exp_id
+            for exp_id, exp_args in self.exp_args_map.items()
+            if len(exp_args.depends_on) == 0 and exp_id not in dependents
+        }
+        self.task_durations = {key: list(val) for key, val in (task_durations or {}).items()}
+        self.quantile = quantile
+        self.slack = slack
+        self.min_history = min_history
+        self.poll_interval = poll_interval
+        self.avg_step_timeout = avg_step_timeout
+        self.task_options = task_options or {}
+        self.max_running = max_running
+
+        self.observed_durations = []
+        self.races = {}
+        self.duplicated = set()
+        self._seen_refs = set()
+
+    def all_refs(self, tasks: dict[str, ray.ObjectRef]) -> list[ray.ObjectRef]:
+        """All the refs to wait for, including duplicates."""
+        return list(tasks.values()) + [duplicate_ref for _, duplicate_ref, _ in self.races.values()]
+
+    def update(
+        self, tasks: dict[str, ray.ObjectRef], ready: list, elapsed_times: dict, n_idle: int = None
+    ):
+        """Record durations, resolve finished races and launch new duplicates.
+
+        Args:
+            tasks: dict[str, ObjectRef]
+                exp_id: task_ref of the current attempts. Updated inplace with race winners.
+            ready: list[ObjectRef]
+                Refs that are finished.
+            elapsed_times: dict[ObjectRef, float]
+                Elapsed time of refs that are not finished. None if not started yet.
+            n_idle: int
+                Number of workers available for duplicates. Defaults to the number of idle CPUs.
+        """
+        self._record_durations(ready)
+        self._resolve_races(tasks, set(ready))
+        self._launch_duplicates(tasks, elapsed_times, n_idle)
+
+    def straggler_threshold(self, exp_args: bgym.ExpArgs) -> float | None:
+        """Elapsed time after which an episode is considered a straggler. None if unknown."""
+        task_name = getattr(exp_args.env_args, "task_name", None)
+        durations = self.task_durations.get(task_name, [])
+        if len(durations) < self.min_history:
+            durations = self.observed_durations + [
+                duration for values in self.task_durations.values() for duration in values
+            ]
+        if len(durations) < self.min_history:
+            return None
+        return self.slack * float(np.quantile(durations, self.quantile))
+
+    def _record_durations(self, ready: list):
+        for ref in ready:
+            if ref in self._seen_refs:
+                continue
+            self._seen_refs.add(ref)
+            duration = get_duration(ref)
+            if duration is not None:
+                self.observed_durations.append(duration)
+
+    def _resolve_races(self, tasks: dict[str, ray.ObjectRef], ready: set):
+        for exp_id, (original_ref, duplicate_ref, duplicate_args) in list(self.races.items()):
+            attempts = [(original_ref, self.exp_args_map[exp_id]), (duplicate_ref, duplicate_args)]
+            finished = [i for i, (ref, _) in enumerate(attempts) if ref in ready]
+            if len(finished) == 0:
+                continue
+
+            succeeded = [i for i in finished if _succeeded(*attempts[i])]
+            if len(succeeded) > 0:
+                winner = succeeded[0]
+            elif len(finished) == len(attempts):
+                winner = 0  # both failed, keep the original
+            else:
+                winner = 1 - finished[0]  # the finished attempt failed, let the other one run
+
+            for i, (ref, exp_args) in enumerate(attempts):
+                if i == winner:
+                    continue
+                if ref not in ready:
+                    ray.cancel(ref, force=True, recursive=False)
+                _hide_attempt(exp_args)
+
+            logger.info(f"Speculative execution of {exp_id}: attempt {winner} was kept.")
+            tasks[exp_id] = attempts[winner][0]
+            del self.races[exp_id]
+
+    def _launch_duplicates(
+        self, tasks: dict[str, ray.ObjectRef], elapsed_times: dict, n_idle: int = None
+    ):
+        if n_idle is None and self.max_running is not None:
+            n_idle = self.max_running - len(elapsed_times)
+        elif n_idle is None:
+            n_idle = int(ray.available_resources().get("CPU", 0))
+        if n_idle < 1:
+            return  # the queue is not empty or workers are all busy
+
+        stragglers = []
+        for exp_id, ref in tasks.items():
+            if exp_id not in self.candidates or exp_id in self.duplicated:
+                continue
+            elapsed_time = elapsed_times.get(ref, None)
+            if elapsed_time is None:
+                continue
+            threshold = self.straggler_threshold(self.exp_args_map[exp_id])
+            if threshold is not None and elapsed_time > threshold:
+                stragglers.append((elapsed_time - threshold, exp_id))
+
+        stragglers.sort(reverse=True)
+        for _, exp_id in stragglers[:n_idle]:
+            exp_args = self.exp_args_map[exp_id]
+            duplicate_args = _make_duplicate(exp_args)
+            logger.warning(
+                f"Task {exp_args.exp_name} is straggling, launching a speculative duplicate."
+            )
+            duplicate_ref = run_exp.options(
+                name=f"{exp_args.exp_name}_speculative", **self.task_options
+            ).remote(duplicate_args, avg_step_timeout=self.avg_step_timeout)
+            self.races[exp_id] = (tasks[exp_id], duplicate_ref, duplicate_args)
+            self.duplicated.add(exp_id)
+
+
+class AdaptiveDispatcher:
+    """Submit tasks lazily, following the concurrency limit of an AdaptiveConcurrency controller.
+
+    A task is submitted once all its dependencies are finished (successfully or not), in the
+    order of exp_args_list, and only while fewer than `concurrency.limit` tasks are running.
+    Speculative duplicates count as running tasks.
+
+    Args:
+        exp_args_list: list[ExpArgs]
+            The experiments to run.
+        submit: callable
+            Submits an experiment and stores its ref in the tasks dict, e.g. get_task in
+            `execute_task_graph`.
+        concurrency: AdaptiveConcurrency
+            The controller deciding how many tasks can run.
+    """
+
+    def __init__(
+        self, exp_args_list: list[bgym.ExpArgs], submit: callable, concurrency: AdaptiveConcurrency
+    ):
+        self.pending = list(exp_args_list)
+        self.submit = submit
+        self.concurrency = concurrency
+        self.n_idle = 0
+        if concurrency.limit is None:
+            concurrency.start(int(ray.cluster_resources().get("CPU", 1)))
+
+    def update(self, tasks: dict[str, ray.ObjectRef], task_list: list, ready: list):
+        """Update the controller and submit pending tasks while below the limit."""
+        ready = set(ready)
+        running = [ref for ref in task_list if ref not in ready]
+        busy_pids = [pid for pid in map(get_worker_pid, running) if pid is not None]
+        limit = self.concurrency.update(busy_pids)
+
+        finished = {exp_id for exp_id, ref in tasks.items() if ref in ready}
+        n_running = len(running)
+        still_pending = []
+        for exp_args in self.pending:
+            deps_finished = all(dep in finished for dep in exp_args.depends_on)
+            if n_running < limit and deps_finished:
+                self.submit(exp_args)
+                n_running += 1
+            else:
+                still_pending.append(exp_args)
+        self.pending = still_pending
+        self.n_idle = max(0, limit - n_running)
+
+    def is_done(self) -> bool:
+        return len(self.pending) == 0
+
+
+def get_worker_pid(task_ref: ray.ObjectRef):
+    """Return the pid of the worker running the task, or None if not started."""
+    task_info = state.get_task(task_ref.task_id().hex(), address="auto")
+    if task_info and task_info.start_time_ms is not None and task_info.end_time_ms is None:
+        return task_info.worker_pid
+    return None
+
+
+def _succeeded(task_ref: ray.ObjectRef, exp_args: bgym.ExpArgs) -> bool:
+    """Whether a finished attempt completed its episode without error.
+
+    `ExpArgs.run` catches the errors of the episode and saves them in summary_info.json, so the
+    task of a crashed episode succeeds: the saved err_msg decides.
+    """
+    try:
+        ray.get(task_ref)
+    except Exception:
+        return False  # the worker died or the task was cancelled
+    exp_dir = getattr(exp_args, "exp_dir", None)
+    if exp_dir is None:
+        return True
+    try:
+        summary_info = ExpResult(exp_dir).summary_info
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    return not summary_info.get("err_msg")
+
+
+def _make_duplicate(exp_args: bgym.ExpArgs) -> bgym.ExpArgs:
+    """Copy exp_args and prepare it in a new directory next to the original one."""
+    duplicate_args = deepcopy(exp_args)
+    duplicate_args.speculative_attempt = getattr(exp_args, "speculative_attempt", 0) + 1
+    exp_dir = getattr(exp_args, "exp_dir", None)
+    if exp_dir is not None:
+        duplicate_args.exp_dir = None  # prevents prepare from moving the original directory
+        duplicate_args.prepare(exp_root=Path(exp_dir).parent)
+    return duplicate_args
+
+
+def _hide_attempt(exp_args: bgym.ExpArgs):
+    """Hide the directory of a losing attempt, so that its results are ignored."""
+    exp_dir = getattr(exp_args, "exp_dir", None)
+    if exp_dir is not None:
+        _move_old_exp(exp_dir)
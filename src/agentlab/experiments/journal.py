@@ -0,0 +1,241 @@
+"""Queryable store for the reproducibility journal.
+
+`reproducibility_journal.csv` lists the results of studies along with their reproducibility info.
+`JournalStore` keeps the journal in a SQLite file next to the CSV:
+
+- Rows are appended in a single write transaction. Concurrent studies (e.g. the workers of
+  `ParallelStudies`) are serialized by SQLite, without interleaved or lost rows.
+- The CSV is regenerated within the same transaction, it stays the file tracked in the repository.
+  If the CSV was changed by something else (e.g. a git pull), the store is rebuilt from it before
+  the next append.
+- agent_name, benchmark and date are indexed, so `query` and `leaderboard` don't read the whole
+  journal.
+
+Usage:
+    journal = JournalStore("reproducibility_journal.csv")
+    journal.leaderboard("miniwob")
+    journal.query(agent_name="GenericAgent-gpt-4o-mini-2024-07-18", since="2024-10-01")
+"""
+
+import csv
+import json
+import os
+import sqlite3
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+# Column types, for numerical comparisons and sorting. Other columns are stored as text.
+COLUMN_TYPES = {"avg_reward": "REAL", "std_err": "REAL", "n_err": "INTEGER"}
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class JournalStore:
+    """Reproducibility journal stored in SQLite, mirrored to a CSV file.
+
+    Args:
+        csv_path: str | Path
+            Path to the CSV journal. The SQLite file has the same name with a .sqlite suffix.
+    """
+
+    def __init__(self, csv_path: str | Path):
+        self.csv_path = Path(csv_path)
+        self.path = self.csv_path.with_suffix(".sqlite")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                "id INTEGER PRIMARY KEY, agent_name TEXT, benchmark TEXT, date TEXT)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS journal_agent ON journal (agent_name)")
+            conn.execute("CREATE INDEX IF NOT EXISTS journal_date ON journal (date)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS journal_benchmark "
+                "ON journal (benchmark, agent_name, date)"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction, holding the database lock from the start."""
+        with closing(sqlite3.connect(self.path, timeout=60, isolation_level=None)) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def append(self, rows: list[dict]):
+        """Append rows to the journal and regenerate the CSV, atomically.
+
+        Keys that are not columns of the journal yet are added as new columns.
+        """
+        with self._transaction() as conn:
+            self._sync_from_csv(conn)
+            self._insert(conn, rows)
+            self._export(conn, self.csv_path)
+
+    def query(
+        self,
+        agent_name: str | list[str] = None,
+        benchmark: str | list[str] = None,
+        since: str = None,
+        until: str = None,
+        **filters,
+    ) -> pd.DataFrame:
+        """Rows of the journal matching all the given filters, sorted by date.
+
+        Args:
+            agent_name: str | list[str]
+                Name(s) of the agent.
+            benchmark: str | list[str]
+                Name(s) of the benchmark.
+            since: str
+                Minimum date, as a prefix of the "%Y-%m-%d_%H-%M-%S" format, e.g. "2024-10".
+            until: str
+                Maximum date (excluded), same format as since.
+            **filters:
+                Other columns of the journal, e.g. agentlab_git_hash="...".
+
+        Returns:
+            pd.DataFrame: The matching rows, with the columns of the CSV.
+        """
+        filters.update(agent_name=agent_name, benchmark=benchmark)
+        clauses, params = [], []
+        with closing(sqlite3.connect(self.path, timeout=60)) as conn:
+            self._sync_from_csv(conn, write=False)
+            columns = self._columns(conn)
+            for name, value in filters.items():
+                if value is None:
+                    continue
+                if name not in columns:
+                    raise ValueError(f"Unknown journal column {name}.")
+                values = [value] if isinstance(value, str) else list(value)
+                clauses.append(f"{_quote(name)} IN ({', '.join('?' * len(values))})")
+                params.extend(str(value) for value in values)
+            if since is not None:
+                clauses.append("date >= ?")
+                params.append(since)
+            if until is not None:
+                clauses.append("date < ?")
+                params.append(until)
+
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            selected = ", ".join(_quote(name) for name in columns)
+            return pd.read_sql_query(
+                f"SELECT {selected} FROM journal {where} ORDER BY date, id", conn, params=params
+            )
+
+    def leaderboard(self, benchmark: str, latest: bool = True) -> pd.DataFrame:
+        """One row per agent evaluated on benchmark, sorted by avg_reward.
+
+        Args:
+            benchmark: str
+                Name of the benchmark.
+            latest: bool
+                If True, the most recent entry of each agent is kept, otherwise its best one.
+        """
+        order = "date DESC, id DESC" if latest else "avg_reward DESC, date DESC"
+        with closing(sqlite3.connect(self.path, timeout=60)) as conn:
+            self._sync_from_csv(conn, write=False)
+            columns = self._columns(conn)
+            if "avg_reward" not in columns:
+                return pd.DataFrame(columns=columns)
+            selected = ", ".join(_quote(name) for name in columns)
+            return pd.read_sql_query(
+                f"SELECT {selected} FROM ("
+                f"  SELECT *, ROW_NUMBER() OVER (PARTITION BY agent_name ORDER BY {order}) AS n"
+                f"  FROM journal WHERE benchmark = ?"
+                f") WHERE n = 1 ORDER BY avg_reward DESC",
+                conn,
+                params=[benchmark],
+            )
+
+    def export_csv(self, path: str | Path = None):
+        """Write the journal to a CSV file, by default the one of the journal."""
+        with self._transaction() as conn:
+            self._sync_from_csv(conn)
+            self._export(conn, Path(path) if path is not None else self.csv_path)
+
+    def __len__(self):
+        with closing(sqlite3.connect(self.path, timeout=60)) as conn:
+            self._sync_from_csv(conn, write=False)
+            return conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+
+    def _columns(self, conn) -> list[str]:
+        """Columns of the journal, in the order of the CSV."""
+        row = conn.execute("SELECT value FROM meta WHERE key = 'columns'").fetchone()
+        return json.loads(row[0]) if row is not None else []
+
+    def _add_columns(self, conn, names: list[str]):
+        columns = self._columns(conn)
+        table_columns = {row[1] for row in conn.execute("PRAGMA table_info(journal)")}
+        for name in names:
+            if name in columns:
+                continue
+            columns.append(name)
+            if name not in table_columns:
+                column_type = COLUMN_TYPES.get(name, "TEXT")
+                conn.execute(f"ALTER TABLE journal ADD COLUMN {_quote(name)} {column_type}")
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('columns', ?)", (json.dumps(columns),))
+
+    def _insert(self, conn, rows: list[dict]):
+        for row in rows:
+            self._add_columns(conn, list(row.keys()))
+            names = ", ".join(_quote(name) for name in row)
+            conn.execute(
+                f"INSERT INTO journal ({names}) VALUES ({', '.join('?' * len(row))})",
+                # values are written as in the CSV, numerical columns are converted by SQLite
+                [str(value) for value in row.values()],
+            )
+
+    def _csv_mtime(self) -> str | None:
+        try:
+            return str(os.stat(self.csv_path).st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _sync_from_csv(self, conn, write: bool = True):
+        """Rebuild the store from the CSV if it was modified outside of the store.
+
+        With write=False (read only connections), a stale store is rebuilt in a new transaction.
+        """
+        csv_mtime = self._csv_mtime()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'csv_mtime'").fetchone()
+        if csv_mtime is None or (row is not None and row[0] == csv_mtime):
+            return
+        if not write:
+            with self._transaction() as write_conn:
+                self._sync_from_csv(write_conn)
+            return
+
+        with open(self.csv_path, "r", newline="") as f:
+            reader = csv.DictReader(f)
+            rows = [{key: value for key, value in row.items() if key is not None} for row in reader]
+            header = reader.fieldnames or []
+        conn.execute("DELETE FROM journal")
+        conn.execute("DELETE FROM meta WHERE key = 'columns'")
+        self._add_columns(conn, header)
+        self._insert(conn, rows)
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('csv_mtime', ?)", (csv_mtime,))
+
+    def _export(self, conn, path: Path):
+        columns = self._columns(conn)
+        selected = ", ".join(_quote(name) for name in columns)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in conn.execute(f"SELECT {selected} FROM journal ORDER BY id"):
+                writer.writerow(["" if value is None else value for value in row])
+        os.replace(tmp_path, path)
+        if path == self.csv_path:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('csv_mtime', ?)", (self._csv_mtime(),)
+            )
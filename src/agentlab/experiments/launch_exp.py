@@ -5,7 +5,11 @@ from pathlib import Path
 import bgym
 from browsergym.experiments.loop import ExpArgs, yield_all_exp_results
 
+from agentlab.experiments.adaptive_concurrency import AdaptiveConcurrency
 from agentlab.experiments.exp_utils import run_exp
+from agentlab.experiments.model_servers import SERVERS
+from agentlab.experiments.ray_runtime import RayRuntime
+from agentlab.experiments.step_watchdog import StepDeadlines
 
 
 def run_experiments(
@@ -14,6 +18,11 @@ def run_experiments(
     study_dir,
     parallel_backend="ray",
     avg_step_timeout=60,
+    speculative_execution=False,
+    task_durations: dict[str, list[float]] = None,
+    adaptive_concurrency: AdaptiveConcurrency = None,
+    step_deadlines: StepDeadlines = None,
+    ray_runtime: RayRuntime = None,
 ):
     """Run a list of ExpArgs in parallel.
 
@@ -32,6 +41,24 @@ def run_experiments(
             The only backend that supports webarena graph dependencies correctly is ray or sequential.
         avg_step_timeout: int
             Will raise a TimeoutError if the episode is not finished after env_args.max_steps * avg_step_timeout seconds.
+        speculative_execution: bool
+            If True, idle workers will run duplicates of straggling episodes and keep the first
+            attempt to finish. Only supported by the ray backend.
+        task_durations: dict[str, list[float]]
+            Historical episode durations (in seconds) keyed by task name. Used by
+            speculative_execution to detect stragglers.
+        adaptive_concurrency: AdaptiveConcurrency
+            If not None, the number of concurrent episodes is adjusted between
+            adaptive_concurrency.min_jobs and n_jobs based on host CPU and memory usage, and
+            workers leaking memory are restarted. Only supported by the ray backend.
+        step_deadlines: StepDeadlines
+            If not None, the agent's get_action, the action execution and the environment step
+            each have their own deadline, enforced inside the worker. A step exceeding its
+            deadline ends the episode with an error and a "timeout" entry in its summary info.
+        ray_runtime: RayRuntime
+            If not None, the ray runtime is kept (or connected to) across runs, and the CPUs of
+            this run are reserved in it. By default, a local runtime with n_jobs CPUs is started
+            and shut down for this run only. Only used by the ray backend.
 
     Raises:
         ValueError: If the parallel_backend is not recognized.
@@ -48,10 +75,26 @@ def run_experiments(
     #     logging.warning("Only 1 job, switching to sequential backend.")
     #     parallel_backend = "sequential"
 
+    if speculative_execution and parallel_backend != "ray":
+        logging.warning(
+            f"speculative_execution is only supported by the ray backend. Ignoring it for {parallel_backend}."
+        )
+
+    if adaptive_concurrency is not None and parallel_backend != "ray":
+        logging.warning(
+            f"adaptive_concurrency is only supported by the ray backend. Ignoring it for {parallel_backend}."
+        )
+
     logging.info(f"Saving experiments to {study_dir}")
     for exp_args in exp_args_list:
-        exp_args.agent_args.prepare()
+        if step_deadlines is not None:
+            exp_args.step_deadlines = step_deadlines
         exp_args.prepare(exp_root=study_dir)
+
+    # each unique model server is prepared once, and closed once all its experiments are done
+    server_keys = SERVERS.acquire(
+        [e.agent_args for e in exp_args_list if not getattr(e, "is_dummy", False)]
+    )
     try:
         if parallel_backend == "joblib":
             from joblib import Parallel, delayed
@@ -80,13 +123,28 @@ def run_experiments(
         #     with make_dask_client(n_worker=n_jobs):
         #         execute_task_graph(exp_args_list)
         elif parallel_backend == "ray":
-            from agentlab.experiments.graph_execution_ray import execute_task_graph, ray
+            from agentlab.experiments.graph_execution_ray import execute_task_graph
+
+            if adaptive_concurrency is not None:
+                adaptive_concurrency.start(n_jobs)
+                n_jobs = adaptive_concurrency.max_jobs
 
-            ray.init(num_cpus=n_jobs)
+            if ray_runtime is None:
+                ray_runtime = RayRuntime(keep_alive=False, reserve_resources=False)
+            ray_runtime.start(n_jobs)
             try:
-                execute_task_graph(exp_args_list, avg_step_timeout=avg_step_timeout)
+                with ray_runtime.reserve(n_jobs) as (task_options, max_running):
+                    execute_task_graph(
+                        exp_args_list,
+                        avg_step_timeout=avg_step_timeout,
+                        speculative_execution=speculative_execution,
+                        task_durations=task_durations,
+                        concurrency=adaptive_concurrency,
+                        task_options=task_options,
+                        max_running=max_running if task_options else None,
+                    )
             finally:
-                ray.shutdown()
+                ray_runtime.stop()
         elif parallel_backend == "sequential":
             for exp_args in exp_args_list:
                 run_exp(exp_args, avg_step_timeout=avg_step_timeout)
@@ -95,9 +153,8 @@ def run_experiments(
     finally:
         # will close servers even if there is an exception or ctrl+c
         # servers won't be closed if the script is killed with kill -9 or segfaults.
-        logging.info("All jobs are finished. Calling agent_args.close() on all agents...")
-        for exp_args in exp_args_list:
-            exp_args.agent_args.close()
+        logging.info("All jobs are finished. Closing model servers...")
+        SERVERS.release(server_keys)
         logging.info("Experiment finished.")
 
 
@@ -0,0 +1,161 @@
+"""Shared lifecycle of the model servers used by the agents of a study.
+
+Experiments of a study share a few agent configurations, and agent configurations often share
+the same model (e.g. one self-hosted server for several agents). `ModelServers` keeps one entry per
+unique model configuration:
+
+- `acquire` prepares the servers that are not running yet, concurrently, and waits until their
+  readiness probe (`server_ready` of the model args, when defined) succeeds.
+- `release` decrements the reference count of each server and closes the ones no longer used.
+
+`SERVERS` is shared by the whole process, so that servers prepared ahead of several studies
+(e.g. `SERVERS.acquire(agent_args_list)`) are reused by each of them and only closed by the last
+release.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agentlab.experiments.args import config_hash
+
+logger = logging.getLogger(__name__)
+
+
+def server_key(agent_args) -> str:
+    """Identify the model server of an agent by its model configuration.
+
+    Agents without chat_model_args are identified by their own configuration.
+    """
+    model_args = getattr(agent_args, "chat_model_args", None)
+    if model_args is not None:
+        return config_hash(model_args)
+    return config_hash(agent_args)
+
+
+class ModelServers:
+    """Reference-counted registry of prepared model servers.
+
+    Args:
+        max_workers: int
+            Maximum number of servers prepared concurrently.
+        ready_timeout: float
+            Maximum time in seconds to wait for the readiness probe of a server. After that, a
+            warning is logged and the experiments start anyway.
+        probe_interval: float
+            Seconds between two readiness probes.
+    """
+
+    def __init__(self, max_workers: int = 8, ready_timeout: float = 600, probe_interval: float = 5):
+        self.max_workers = max_workers
+        self.ready_timeout = ready_timeout
+        self.probe_interval = probe_interval
+        self._agents = {}  # key -> agent_args used to prepare and close the server
+        self._ref_counts = {}
+        self._ready = {}  # key -> Event set once the server is prepared
+        self._lock = threading.Lock()
+
+    def acquire(self, agent_args_list: list) -> list[str]:
+        """Take a reference on the server of each agent, preparing new servers concurrently.
+
+        Args:
+            agent_args_list: list[AgentArgs]
+                One entry per user of a server, e.g. the agent of each experiment.
+
+        Returns:
+            list[str]: The server keys, to give back to `release`.
+
+        Raises:
+            Exception: The first error raised while preparing a server. References taken by
+                this call are released, closing the servers that were prepared.
+        """
+        keys = [server_key(agent_args) for agent_args in agent_args_list]
+        to_prepare = {}
+        with self._lock:
+            for key, agent_args in zip(keys, agent_args_list):
+                if key not in self._ref_counts:
+                    self._ref_counts[key] = 0
+                    self._agents[key] = agent_args
+                    self._ready[key] = threading.Event()
+                    to_prepare[key] = agent_args
+                self._ref_counts[key] += 1
+            others = [self._ready[key] for key in set(keys) if key not in to_prepare]
+
+        if to_prepare:
+            logger.info(f"Preparing {len(to_prepare)} model server(s)...")
+            try:
+                self._prepare_all(to_prepare)
+            except Exception:
+                self._set_ready(to_prepare)
+                self.release(keys)
+                raise
+            self._set_ready(to_prepare)
+
+        # servers being prepared by another thread
+        for ready in others:
+            ready.wait()
+        return keys
+
+    def release(self, keys: list[str]):
+        """Drop one reference per key, closing servers whose count reaches 0."""
+        to_close = []
+        with self._lock:
+            for key in keys:
+                if key not in self._ref_counts:
+                    continue
+                self._ref_counts[key] -= 1
+                if self._ref_counts[key] <= 0:
+                    del self._ref_counts[key]
+                    self._ready.pop(key).set()
+                    to_close.append(self._agents.pop(key))
+
+        for agent_args in to_close:
+            try:
+                agent_args.close()
+            except Exception as e:
+                logger.error(f"Error while closing the server of {_name(agent_args)}: {e}")
+
+    def _set_ready(self, keys):
+        with self._lock:
+            for key in keys:
+                self._ready[key].set()
+
+    def ref_count(self, agent_args) -> int:
+        return self._ref_counts.get(server_key(agent_args), 0)
+
+    def __len__(self):
+        return len(self._ref_counts)
+
+    def _prepare_all(self, to_prepare: dict):
+        n_workers = max(1, min(self.max_workers, len(to_prepare)))
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(self._prepare_one, agent) for agent in to_prepare.values()]
+            errors = [future.exception() for future in futures]
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise errors[0]
+
+    def _prepare_one(self, agent_args):
+        start = time.time()
+        agent_args.prepare()
+        model_args = getattr(agent_args, "chat_model_args", None)
+        probe = getattr(model_args, "server_ready", None)
+        if probe is None:
+            return
+        while not probe():
+            if time.time() - start > self.ready_timeout:
+                logger.warning(
+                    f"Server of {_name(agent_args)} is not ready after {self.ready_timeout}s. "
+                    "Starting the experiments anyway."
+                )
+                return
+            time.sleep(self.probe_interval)
+        logger.info(f"Server of {_name(agent_args)} ready in {time.time() - start:.0f}s.")
+
+
+def _name(agent_args) -> str:
+    return getattr(agent_args, "agent_name", type(agent_args).__name__)
+
+
+SERVERS = ModelServers()
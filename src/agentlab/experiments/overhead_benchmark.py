@@ -0,0 +1,389 @@
+"""Benchmark of the orchestration overhead of the experiment backends.
+
+The wall time of a study mixes the time spent in the environment and the LLM with the time spent
+by the framework: pickling `ExpArgs`, creating the directory of each experiment in `prepare()`,
+scheduling episodes on workers, saving step and summary info, and loading the results. This
+module runs studies of no-op episodes, with a fake environment and a fake LLM answering
+instantly, through the real `run_experiments` and `ExpArgs.run`, so that almost all of the wall
+time is overhead.
+
+Each configuration (backend, number of experiments, with or without dependencies) records:
+
+- wall_s: wall time of run_experiments.
+- episode_s: total time spent in the agent and the environment, from the summary info.
+- overhead_per_episode_ms: worker time not spent in episodes, per episode, i.e.
+  (wall_s * parallelism - episode_s) / n_experiments. It includes the time workers are idle
+  waiting for dependencies.
+- pickle_ms, prepare_ms: mean time to pickle an ExpArgs and to prepare its directory.
+- load_results_s: time to load the results of the study with `inspect_results.load_result_df`.
+
+With dependencies, experiments form n_jobs chains (each experiment depends on the one n_jobs
+before it). Only the ray backend runs them in parallel while respecting dependencies.
+
+Results are saved as JSON, and `compare_results` flags configurations that got slower than a
+baseline, e.g.:
+    agentlab-overhead-benchmark --sizes 10 100 --output overhead.json
+    agentlab-overhead-benchmark --sizes 10 100 --baseline overhead.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import pickle
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+import bgym
+import pandas as pd
+
+from agentlab.agents.agent_args import AgentArgs
+from agentlab.analyze import inspect_results
+from agentlab.experiments.launch_exp import run_experiments
+from agentlab.experiments.ray_runtime import RayRuntime
+from agentlab.llm.base_api import AbstractChatModel, BaseModelArgs
+from agentlab.llm.llm_utils import AIMessage
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("sequential", "joblib", "ray")
+SIZES = (10, 100, 10_000)
+
+
+class FakeChatModel(AbstractChatModel):
+    """Answers a fixed action, after an optional latency."""
+
+    def __init__(self, latency: float = 0.0, answer: str = "<action>\nnoop()\n</action>"):
+        self.latency = latency
+        self.answer = answer
+        self.n_calls = 0
+
+    def __call__(self, messages: list[dict]) -> dict:
+        if self.latency > 0:
+            time.sleep(self.latency)
+        self.n_calls += 1
+        return AIMessage(self.answer)
+
+    def get_stats(self):
+        return {"n_calls": self.n_calls}
+
+
+@dataclass
+class FakeModelArgs(BaseModelArgs):
+    model_name: str = "fake"
+    latency: float = 0.0
+
+    def make_model(self) -> FakeChatModel:
+        return FakeChatModel(self.latency)
+
+
+class NoopActionSet:
+    def to_python_code(self, action):
+        return action
+
+
+class NoopAgent(bgym.Agent):
+    """Sends a short prompt to the fake LLM at each step and returns its action."""
+
+    action_set = NoopActionSet()
+
+    def __init__(self, chat_model_args: FakeModelArgs):
+        self.chat_llm = chat_model_args.make_model()
+
+    def obs_preprocessor(self, obs: dict) -> dict:
+        return obs
+
+    def get_action(self, obs: dict) -> tuple[str, bgym.AgentInfo]:
+        messages = [{"role": "user", "content": f"Step {obs['step']}, choose an action."}]
+        answer = self.chat_llm(messages)
+        action = answer["content"].split("<action>")[1].split("</action>")[0].strip()
+        return action, bgym.AgentInfo(think="", stats=self.chat_llm.get_stats())
+
+
+@dataclass
+class NoopAgentArgs(AgentArgs):
+    agent_name: str = "NoopAgent"
+    chat_model_args: FakeModelArgs = None
+
+    def make_agent(self) -> NoopAgent:
+        return NoopAgent(self.chat_model_args or FakeModelArgs())
+
+
+class NoopChat:
+    def add_message(self, role, msg):
+        pass
+
+
+class NoopEnv:
+    """Episode of n_steps steps, each one returning a small observation instantly."""
+
+    def __init__(self, n_steps: int):
+        self.n_steps = n_steps
+        self.step_count = 0
+        self.chat = NoopChat()
+
+    @property
+    def unwrapped(self):
+        return self
+
+    def reset(self, seed=None):
+        self.step_count = 0
+        # no text in observations, they would be tokenized at each step
+        return {"step": 0}, {}
+
+    def step(self, action):
+        self.step_count += 1
+        obs = {"step": self.step_count}
+        terminated = self.step_count >= self.n_steps
+        now = time.time()
+        info = {"action_exec_start": now, "action_exec_stop": now, "action_exec_timeout": 0}
+        return obs, float(terminated), terminated, False, info
+
+    def close(self):
+        pass
+
+
+@dataclass
+class NoopEnvArgs(bgym.EnvArgs):
+    n_steps: int = 2
+
+    def make_env(self, action_mapping, exp_dir, exp_task_kwargs: dict = {}):
+        return NoopEnv(self.n_steps)
+
+
+class TimedExpArgs(bgym.ExpArgs):
+    """ExpArgs recording the time spent in prepare()."""
+
+    def prepare(self, exp_root):
+        start = time.perf_counter()
+        super().prepare(exp_root)
+        self.prepare_time = time.perf_counter() - start
+
+
+def make_exp_args_list(
+    n_experiments: int, dependencies: bool = False, n_chains: int = 1, n_steps: int = 2
+) -> list[bgym.ExpArgs]:
+    """No-op experiments, optionally forming n_chains chains of dependencies."""
+    agent_args = NoopAgentArgs(chat_model_args=FakeModelArgs())
+    exp_args_list = []
+    for i in range(n_experiments):
+        exp_args = TimedExpArgs(
+            agent_args=agent_args,
+            env_args=NoopEnvArgs(task_name=f"noop.task_{i}", task_seed=i, max_steps=n_steps + 1),
+            logging_level=logging.WARNING,
+            logging_level_stdout=logging.WARNING,
+        )
+        exp_args.env_args.n_steps = n_steps
+        exp_args.save_screenshot = False
+        exp_args.save_som = False
+        exp_args.make_id()
+        if dependencies and i >= n_chains:
+            exp_args.depends_on = (exp_args_list[i - n_chains].exp_id,)
+        exp_args_list.append(exp_args)
+    return exp_args_list
+
+
+def measure_overhead(
+    backend: str,
+    n_experiments: int,
+    dependencies: bool = False,
+    n_jobs: int = 4,
+    n_steps: int = 2,
+    ray_runtime: RayRuntime = None,
+) -> dict:
+    """Run a study of no-op experiments and measure the time spent in each phase.
+
+    Returns:
+        dict: The measures of this configuration, see the module docstring.
+    """
+    exp_args_list = make_exp_args_list(
+        n_experiments, dependencies=dependencies, n_chains=n_jobs, n_steps=n_steps
+    )
+
+    start = time.perf_counter()
+    for exp_args in exp_args_list:
+        pickle.dumps(exp_args)
+    pickle_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as study_dir:
+        start = time.perf_counter()
+        run_experiments(
+            n_jobs,
+            exp_args_list,
+            study_dir,
+            parallel_backend=backend,
+            ray_runtime=ray_runtime,
+        )
+        wall_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result_df = inspect_results.load_result_df(study_dir, progress_fn=None)
+        load_results_s = time.perf_counter() - start
+
+    episode_s = 0.0
+    for key in ("stats.cum_step_elapsed", "stats.cum_agent_elapsed"):
+        if result_df is not None and key in result_df:
+            episode_s += float(result_df[key].sum())
+    n_errors = 0 if result_df is None else int(result_df["err_msg"].notna().sum())
+    parallelism = 1 if backend == "sequential" else n_jobs
+
+    return {
+        "backend": backend,
+        "n_experiments": n_experiments,
+        "dependencies": dependencies,
+        "n_jobs": n_jobs,
+        "n_steps": n_steps,
+        "wall_s": wall_s,
+        "episode_s": episode_s,
+        "overhead_per_episode_ms": (wall_s * parallelism - episode_s) / n_experiments * 1000,
+        "pickle_ms": pickle_s / n_experiments * 1000,
+        "prepare_ms": sum(getattr(e, "prepare_time", 0) for e in exp_args_list)
+        / n_experiments
+        * 1000,
+        "load_results_s": load_results_s,
+        "n_errors": n_errors,
+    }
+
+
+def run_benchmark(
+    backends=BACKENDS,
+    sizes=SIZES,
+    dependencies=(False, True),
+    n_jobs: int = 4,
+    n_steps: int = 2,
+    warmup: bool = True,
+) -> pd.DataFrame:
+    """Measure the overhead of each backend, number of experiments and dependency setting.
+
+    The ray runtime is started once for all ray configurations, its start time is reported in
+    the ray_start_s column. With warmup, n_jobs experiments are run and discarded before measuring
+    each backend, so that the first configuration doesn't include the start of the workers.
+    """
+    records = []
+    ray_runtime, ray_start_s = None, None
+    try:
+        for backend in backends:
+            if backend == "ray":
+                ray_runtime = RayRuntime(num_cpus=n_jobs, reserve_resources=False)
+                start = time.perf_counter()
+                ray_runtime.start(n_jobs)
+                ray_start_s = time.perf_counter() - start
+            if warmup:
+                measure_overhead(backend, n_jobs, n_jobs=n_jobs, ray_runtime=ray_runtime)
+            for n_experiments in sizes:
+                for with_dependencies in dependencies:
+                    logger.info(
+                        f"Measuring {backend} with {n_experiments} experiments "
+                        f"({'with' if with_dependencies else 'without'} dependencies)."
+                    )
+                    record = measure_overhead(
+                        backend,
+                        n_experiments,
+                        dependencies=with_dependencies,
+                        n_jobs=n_jobs,
+                        n_steps=n_steps,
+                        ray_runtime=ray_runtime,
+                    )
+                    record["ray_start_s"] = ray_start_s if backend == "ray" else None
+                    records.append(record)
+    finally:
+        if ray_runtime is not None:
+            ray_runtime.shutdown()
+    return pd.DataFrame(records)
+
+
+def environment_info() -> dict:
+    """Context of a benchmark run, to compare results from the same machine only."""
+    import agentlab
+
+    return {
+        "date": datetime.now().strftime("%Y-%m-%d_%H-%M-%S"),
+        "agentlab_version": agentlab.__version__,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save_results(results: pd.DataFrame, path: str):
+    with open(path, "w") as f:
+        json.dump({"info": environment_info(), "results": results.to_dict("records")}, f, indent=2)
+
+
+def load_results(path: str) -> pd.DataFrame:
+    with open(path, "r") as f:
+        return pd.DataFrame(json.load(f)["results"])
+
+
+def compare_results(
+    baseline: pd.DataFrame,
+    current: pd.DataFrame,
+    metric: str = "overhead_per_episode_ms",
+    threshold: float = 1.2,
+) -> pd.DataFrame:
+    """Compare a metric of each configuration with a baseline.
+
+    Returns:
+        pd.DataFrame: One row per configuration present in both, with the baseline and current
+            values, their ratio and a regression column (ratio above threshold).
+    """
+    keys = ["backend", "n_experiments", "dependencies", "n_jobs"]
+    merged = baseline[keys + [metric]].merge(
+        current[keys + [metric]], on=keys, suffixes=("_baseline", "_current")
+    )
+    merged["ratio"] = merged[f"{metric}_current"] / merged[f"{metric}_baseline"]
+    merged["regression"] = merged["ratio"] > threshold
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the orchestration overhead of the experiment backends."
+    )
+    parser.add_argument("--backends", type=str, nargs="+", default=list(BACKENDS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument(
+        "--dependencies",
+        type=str,
+        choices=["with", "without", "both"],
+        default="both",
+        help="Run the experiments with dependencies, without, or both.",
+    )
+    parser.add_argument("--n_jobs", type=int, default=4)
+    parser.add_argument("--n_steps", type=int, default=2, help="Steps per episode.")
+    parser.add_argument("--output", type=str, default=None, help="JSON file to save results to.")
+    parser.add_argument(
+        "--baseline", type=str, default=None, help="JSON results to compare with, exit 1 if slower."
+    )
+    parser.add_argument("--threshold", type=float, default=1.2)
+    parser.add_argument(
+        "--no_warmup", action="store_true", help="Include the start of the workers in the results."
+    )
+    args = parser.parse_args()
+
+    dependencies = {"with": (True,), "without": (False,), "both": (False, True)}[args.dependencies]
+    results = run_benchmark(
+        backends=args.backends,
+        sizes=args.sizes,
+        dependencies=dependencies,
+        n_jobs=args.n_jobs,
+        n_steps=args.n_steps,
+        warmup=not args.no_warmup,
+    )
+    print(results.to_string(index=False))
+    if args.output is not None:
+        save_results(results, args.output)
+
+    if args.baseline is not None:
+        comparison = compare_results(load_results(args.baseline), results, threshold=args.threshold)
+        print(comparison.to_string(index=False))
+        if comparison["regression"].any():
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Ray runtime shared by several runs of experiments.
+
+By default, `run_experiments` starts a local ray runtime with n_jobs CPUs and shuts it down when
+the experiments are done. A study relaunching incomplete experiments, or `SequentialStudies`
+running one study after the other, pay for the start of ray and of its workers each time.
+
+`RayRuntime` keeps the runtime alive across runs (`keep_alive=True`), or connects to an existing
+cluster (`address="auto"` or "ray://<head_node>:10001"). The CPUs of each run are reserved with a
+placement group, so that concurrent studies sharing the runtime don't oversubscribe it. A run
+waits until its reservation can be satisfied. `ParallelStudies` starts a local runtime once in the
+main process, and the sub-studies of its worker processes connect to it (see `for_workers`).
+
+Usage:
+    runtime = RayRuntime()  # or RayRuntime(address="auto") for an existing cluster
+    for study in studies:
+        study.ray_runtime = runtime
+        study.run(n_jobs=16)
+    runtime.shutdown()
+"""
+
+import copy
+import logging
+import math
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class RayRuntime:
+    """Start or connect to a ray runtime once, and reserve resources for each run.
+
+    Args:
+        address: str
+            Address of an existing ray cluster, e.g. "auto" or "ray://<head_node>:10001". If
+            None, a local runtime is started.
+        num_cpus: int
+            Number of CPUs of the local runtime. Defaults to all CPUs when keep_alive is True,
+            otherwise to the n_jobs of the run.
+        keep_alive: bool
+            If True, the runtime is kept between runs, until `shutdown` is called or the process
+            exits. Runtimes that were not started by this object are never shut down.
+        reserve_resources: bool
+            If True, each run reserves n_jobs bundles of cpus_per_job CPUs in a placement group,
+            and its episodes only run on them.
+        cpus_per_job: float
+            CPUs reserved for each episode.
+        strategy: str
+            Placement strategy of the bundles, e.g. "PACK" or "SPREAD" for a multi-node cluster.
+        reservation_timeout: float
+            Maximum time in seconds to wait for a reservation. None to wait forever.
+        init_kwargs: dict
+            Extra arguments for ray.init.
+    """
+
+    def __init__(
+        self,
+        address: str = None,
+        num_cpus: int = None,
+        keep_alive: bool = True,
+        reserve_resources: bool = True,
+        cpus_per_job: float = 1,
+        strategy: str = "PACK",
+        reservation_timeout: float = None,
+        init_kwargs: dict = None,
+    ):
+        self.address = address
+        self.num_cpus = num_cpus
+        self.keep_alive = keep_alive
+        self.reserve_resources = reserve_resources
+        self.cpus_per_job = cpus_per_job
+        self.strategy = strategy
+        self.reservation_timeout = reservation_timeout
+        self.init_kwargs = init_kwargs
+        # a runtime started by ray.init on this machine, it doesn't scale up
+        self._local = address is None
+        self._started = False
+
+    def start(self, n_jobs: int):
+        """Start or connect to the runtime, unless ray is already initialized."""
+        import ray
+
+        if ray.is_initialized():
+            return
+        kwargs = dict(self.init_kwargs or {})
+        if self.address is not None:
+            kwargs["address"] = self.address
+        elif self.num_cpus is not None:
+            kwargs["num_cpus"] = self.num_cpus
+        elif not self.keep_alive:
+            kwargs["num_cpus"] = n_jobs
+        ray.init(**kwargs)
+        self._started = True
+
+    def for_workers(self) -> "RayRuntime":
+        """Copy of this started runtime, connecting to it from other processes.
+
+        A local runtime pickled into worker processes would start a runtime of its own, with all
+        the CPUs of the machine, in each of them. The copy connects to the runtime started by
+        this object instead, and never shuts it down.
+        """
+        import ray
+
+        runtime = copy.copy(self)
+        runtime.address = ray.get_runtime_context().gcs_address
+        runtime.num_cpus = None
+        runtime._started = False
+        return runtime
+
+    def stop(self):
+        """End of a run, shuts down the runtime unless keep_alive."""
+        if not self.keep_alive:
+            self.shutdown()
+
+    def shutdown(self):
+        """Shut down the runtime if it was started by this object."""
+        import ray
+
+        if self._started:
+            ray.shutdown()
+            self._started = False
+
+    @contextmanager
+    def reserve(self, n_jobs: int):
+        """Reserve resources for a run of n_jobs concurrent episodes.
+
+        Yields:
+            tuple[dict, int]: Ray options for the tasks of the run, and the number of episodes
+                that can run concurrently. The options are empty when not reserving resources.
+        """
+        if not self.reserve_resources:
+            yield {}, n_jobs
+            return
+
+        import ray
+        from ray.util.placement_group import placement_group, remove_placement_group
+        from ray.util.scheduling_strategies import PlacementGroupSchedulingStrategy
+
+        if self._local:
+            # a local runtime doesn't scale up, a larger reservation would never be ready
+            n_cpus = ray.cluster_resources().get("CPU", 0)
+            max_jobs = max(1, int(n_cpus // self.cpus_per_job))
+            if n_jobs > max_jobs:
+                logger.warning(
+                    f"Only {n_cpus} CPUs in the ray runtime, reducing n_jobs to {max_jobs}."
+                )
+                n_jobs = max_jobs
+
+        bundles = [{"CPU": self.cpus_per_job} for _ in range(n_jobs)]
+        group = placement_group(bundles, strategy=self.strategy)
+        try:
+            self._wait_for(group, n_jobs)
+            options = {
+                "num_cpus": self.cpus_per_job,
+                "scheduling_strategy": PlacementGroupSchedulingStrategy(
+                    placement_group=group, placement_group_capture_child_tasks=True
+                ),
+            }
+            yield options, n_jobs
+        finally:
+            remove_placement_group(group)
+
+    def _wait_for(self, group, n_jobs: int):
+        start = time.time()
+        while True:
+            timeout = 60
+            if self.reservation_timeout is not None:
+                remaining = self.reservation_timeout - (time.time() - start)
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"Could not reserve {n_jobs} x {self.cpus_per_job} CPUs within "
+                        f"{self.reservation_timeout}s."
+                    )
+                timeout = min(timeout, math.ceil(remaining))  # ray waits whole seconds
+            if group.wait(timeout_seconds=timeout):
+                return
+            logger.warning(
+                f"Waiting for {n_jobs} x {self.cpus_per_job} CPUs to be available "
+                f"({time.time() - start:.0f}s). Other runs are using the ray runtime."
+            )
@@ -1,8 +1,8 @@
-import csv
 import logging
 import os
 import platform
 from datetime import datetime
+from functools import lru_cache
 from importlib import metadata
 from pathlib import Path
 
@@ -13,6 +13,7 @@ from git.config import GitConfigParser
 
 import agentlab
 from agentlab.experiments.exp_utils import RESULTS_DIR
+from agentlab.experiments.journal import JournalStore
 
 
 def _get_repo(module):
@@ -121,7 +122,98 @@ def _get_git_username(repo: Repo) -> str:
     return os.environ.get("GIT_AUTHOR_NAME") or os.environ.get("GIT_COMMITTER_NAME")
 
 
-def _get_git_info(module, changes_white_list=()) -> tuple[str, list[tuple[str, Path]]]:
+# Files that are often modified during experiments but do not affect reproducibility
+CHANGES_WHITE_LIST = (
+    "*/reproducibility_script.py",
+    "*reproducibility_journal.csv",
+    "*reproducibility_journal.sqlite*",
+    "*main.py",
+    "*inspect_results.ipynb",
+)
+
+# Snapshots of the git state, reused as long as the files they depend on keep the same mtime.
+# key -> (paths, mtimes of paths, value). Shared by all the studies of the process, see
+# `cache_snapshot` to share it with other processes.
+_CACHE = {}
+
+
+def clear_cache():
+    """Forget the cached git state, it will be read again by the next call."""
+    _CACHE.clear()
+
+
+def cache_snapshot() -> dict:
+    """Picklable copy of the cache, to be given to `load_cache` in another process."""
+    return dict(_CACHE)
+
+
+def load_cache(snapshot: dict):
+    """Reuse the cache of another process. Entries are still validated before being used."""
+    if snapshot:
+        _CACHE.update(snapshot)
+
+
+def _mtimes(paths: list[Path]) -> tuple:
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def _cache_get(key):
+    entry = _CACHE.get(key)
+    if entry is None:
+        return None
+    paths, mtimes, value = entry
+    if _mtimes(paths) != mtimes:
+        return None
+    return value
+
+
+def _exclude_pathspecs(repo: Repo, ignore_paths) -> tuple[str, ...]:
+    """Git pathspecs excluding ignore_paths that are inside the repository."""
+    root = Path(repo.working_tree_dir).resolve()
+    pathspecs = []
+    for path in ignore_paths or ():
+        path = Path(path).expanduser()
+        if path.is_absolute():
+            try:
+                path = path.resolve().relative_to(root)
+            except ValueError:  # outside of the repository
+                continue
+        if str(path) != ".":
+            pathspecs.append(f":(exclude){path.as_posix()}")
+    return tuple(sorted(pathspecs))
+
+
+def _state_paths(repo: Repo, changes_white_list=()) -> list[Path]:
+    """Files whose mtime changes when the result of `_read_git_info` may change.
+
+    i.e. the HEAD, index and refs of the repository, tracked files and their directories (a
+    directory changes when a file is added or removed). White listed files are skipped.
+    """
+    root = Path(repo.working_tree_dir)
+    git_dir, common_dir = Path(repo.git_dir), Path(repo.common_dir)
+    paths = [git_dir / "HEAD", git_dir / "index", common_dir / "packed-refs"]
+    try:
+        paths.append(common_dir / repo.head.ref.path)
+    except TypeError:  # detached HEAD
+        pass
+
+    tracked = [Path(file) for file in repo.git.ls_files("-z").split("\0") if file]
+    paths.extend(sorted({root} | {root / file.parent for file in tracked}))
+    for file in tracked:
+        if not any(file.match(pattern) for pattern in changes_white_list):
+            paths.append(root / file)
+    return paths
+
+
+def _get_git_info(
+    module, changes_white_list=(), ignore_paths=()
+) -> tuple[str, list[tuple[str, Path]]]:
     """
     Retrieve comprehensive git information for the given module.
 
@@ -129,9 +221,14 @@ def _get_git_info(module, changes_white_list=()) -> tuple[str, list[tuple[str, P
     module and returns the current commit hash and a comprehensive list of all
     files that contribute to the repository's state.
 
+    The result is cached, and reused as long as the git metadata, tracked files, previously
+    modified files and the directories of untracked files keep the same mtime.
+
     Args:
         module: The Python module object to check for git information.
         changes_white_list: A list of file paths to ignore when checking for changes.
+        ignore_paths: Directories (absolute or relative to the repository root) skipped when
+            scanning for untracked files, e.g. result directories.
 
     Returns:
         tuple: A tuple containing two elements:
@@ -144,36 +241,85 @@ def _get_git_info(module, changes_white_list=()) -> tuple[str, list[tuple[str, P
 
     try:
         repo = _get_repo(module)
+    except InvalidGitRepositoryError:
+        return None, []
+
+    excludes = _exclude_pathspecs(repo, ignore_paths)
+    key = ("git_info", repo.working_tree_dir, tuple(changes_white_list), excludes)
+    git_info = _cache_get(key)
+    if git_info is not None:
+        return git_info
+
+    # mtimes are read before the git state, a change in between only causes a cache miss. Except
+    # for the index, that git refreshes while reading the state.
+    paths = _state_paths(repo, changes_white_list)
+    mtimes = _mtimes(paths)
+    git_info = _read_git_info(repo, changes_white_list, excludes)
+    index_path = Path(repo.git_dir) / "index"
+    mtimes = tuple(
+        after if path == index_path else before
+        for path, before, after in zip(paths, mtimes, _mtimes(paths))
+    )
+
+    root = Path(repo.working_tree_dir)
+    modified_paths = [root / file for _, file in git_info[1]]
+    # a file added in an untracked directory only changes the mtime of that directory
+    untracked_dirs = {
+        root / parent
+        for status, file in git_info[1]
+        if status == "??"
+        for parent in file.parents
+        if parent != Path(".")
+    }
+    modified_paths.extend(sorted(untracked_dirs - set(paths)))
+    _CACHE[key] = (paths + modified_paths, mtimes + _mtimes(modified_paths), git_info)
+    return git_info
+
 
-        git_hash = repo.head.object.hexsha
+def _read_git_info(repo: Repo, changes_white_list=(), excludes=()):
+    git_hash = repo.head.object.hexsha
 
-        modified_files = []
+    modified_files = []
 
-        # Staged changes
-        staged_changes = repo.index.diff(repo.head.commit)
-        for change in staged_changes:
-            modified_files.append((change.change_type, Path(change.a_path)))
+    # Staged changes
+    staged_changes = repo.index.diff(repo.head.commit)
+    for change in staged_changes:
+        modified_files.append((change.change_type, Path(change.a_path)))
 
-        # Unstaged changes
-        unstaged_changes = repo.index.diff(None)
-        for change in unstaged_changes:
-            modified_files.append((change.change_type, Path(change.a_path)))
+    # Unstaged changes
+    unstaged_changes = repo.index.diff(None)
+    for change in unstaged_changes:
+        modified_files.append((change.change_type, Path(change.a_path)))
 
-        # Untracked files
-        untracked_files = repo.untracked_files
-        for file in untracked_files:
+    # Untracked files, git doesn't walk the excluded directories
+    untracked_files = repo.git.ls_files(
+        "--others", "--exclude-standard", "-z", "--", ".", *excludes
+    )
+    for file in untracked_files.split("\0"):
+        if file:
             modified_files.append(("??", Path(file)))
 
-        # wildcard matching from white list
-        modified_files_filtered = []
-        for status, file in modified_files:
-            if any(file.match(pattern) for pattern in changes_white_list):
-                continue
-            modified_files_filtered.append((status, file))
+    # wildcard matching from white list
+    modified_files_filtered = []
+    for status, file in modified_files:
+        if any(file.match(pattern) for pattern in changes_white_list):
+            continue
+        modified_files_filtered.append((status, file))
 
-        return git_hash, modified_files_filtered
-    except InvalidGitRepositoryError:
-        return None, []
+    return git_hash, modified_files_filtered
+
+
+def _get_cached_git_username(repo: Repo) -> str:
+    """`_get_git_username` may query the GitHub API, keep it for the whole process."""
+    key = ("git_user", repo.working_tree_dir if repo is not None else None)
+    if key not in _CACHE:
+        _CACHE[key] = ([], (), _get_git_username(repo))
+    return _CACHE[key][2]
+
+
+@lru_cache
+def _package_version(name: str) -> str:
+    return metadata.distribution(name).version
 
 
 def get_reproducibility_info(
@@ -181,17 +327,16 @@ def get_reproducibility_info(
     benchmark: bgym.Benchmark,
     study_id: str = "",
     comment=None,
-    changes_white_list=(  # Files that are often modified during experiments but do not affect reproducibility
-        "*/reproducibility_script.py",
-        "*reproducibility_journal.csv",
-        "*main.py",
-        "*inspect_results.ipynb",
-    ),
+    changes_white_list=CHANGES_WHITE_LIST,
     ignore_changes=False,
     allow_bypass_benchmark_version=False,
+    ignore_paths=None,
 ):
     """
     Retrieve a dict of information that could influence the reproducibility of an experiment.
+
+    The git state of agentlab and browsergym is cached, see `_get_git_info`. ignore_paths are
+    skipped when scanning for untracked files, in addition to RESULTS_DIR.
     """
     from browsergym import core
 
@@ -206,7 +351,7 @@ def get_reproducibility_info(
         repo = None
 
     info = {
-        "git_user": _get_git_username(repo),
+        "git_user": _get_cached_git_username(repo),
         "agent_names": agent_names,
         "benchmark": benchmark.name,
         "study_id": study_id,
@@ -215,11 +360,13 @@ def get_reproducibility_info(
         "date": datetime.now().strftime("%Y-%m-%d_%H-%M-%S"),
         "os": f"{platform.system()} ({platform.version()})",
         "python_version": platform.python_version(),
-        "playwright_version": metadata.distribution("playwright").version,
+        "playwright_version": _package_version("playwright"),
     }
 
+    ignore_paths = [RESULTS_DIR, *(ignore_paths or ())]
+
     def add_git_info(module_name, module):
-        git_hash, modified_files = _get_git_info(module, changes_white_list)
+        git_hash, modified_files = _get_git_info(module, changes_white_list, ignore_paths)
 
         modified_files_str = "\n".join([f"  {status}: {file}" for status, file in modified_files])
 
@@ -300,16 +447,6 @@ def _verify_report(report_df: pd.DataFrame, agent_names=list[str], strict_reprod
     return report_df
 
 
-def _get_csv_headers(file_path: str) -> list[str]:
-    with open(file_path, "r", newline="") as file:
-        reader = csv.reader(file)
-        try:
-            headers = next(reader)
-        except StopIteration:
-            headers = None
-    return headers
-
-
 def _add_result_to_info(info: dict, report_df: pd.DataFrame):
     """Extracts the results from the report and adds them to the info dict inplace"""
 
@@ -320,10 +457,8 @@ def _add_result_to_info(info: dict, report_df: pd.DataFrame):
         info[key] = value
 
 
-def append_to_journal(
-    info, report_df: pd.DataFrame, journal_path=None, strict_reproducibility=True
-):
-    """Append the info and results to the reproducibility journal."""
+def get_journal(journal_path=None) -> JournalStore:
+    """The reproducibility journal, to query past results. See `JournalStore`."""
     if journal_path is None:
         try:
             _get_repo(agentlab)  # if not based on git clone, this will raise an error
@@ -336,8 +471,19 @@ def append_to_journal(
                 "To add to the journal, git clone agentlab and use `pip install -e .`"
             )
             journal_path = RESULTS_DIR / "reproducibility_journal.csv"
+    return JournalStore(journal_path)
+
+
+def append_to_journal(
+    info, report_df: pd.DataFrame, journal_path=None, strict_reproducibility=True
+):
+    """Append the info and results to the reproducibility journal.
+
+    The rows of all agents are appended atomically, see `JournalStore`.
+    """
+    journal = get_journal(journal_path)
 
-    logging.info(f"Appending to journal {journal_path}")
+    logging.info(f"Appending to journal {journal.csv_path}")
 
     if len(report_df) != len(info["agent_names"]):
         raise ValueError(
@@ -349,25 +495,15 @@ def append_to_journal(
     )
 
     rows = []
-    headers = None
-    if journal_path.exists():
-        headers = _get_csv_headers(journal_path)
-
-    if headers is None:  # first creation
-        headers = list(info.keys())
-        headers[headers.index("agent_names")] = "agent_name"
-        rows.append(headers)
-
     for agent_name in info["agent_names"]:
-        info_copy = info.copy()
-        del info_copy["agent_names"]
-        info_copy["agent_name"] = agent_name
+        info_copy = {}
+        for key, value in info.items():  # agent_name takes the place of agent_names
+            if key == "agent_names":
+                info_copy["agent_name"] = agent_name
+            else:
+                info_copy[key] = value
 
         _add_result_to_info(info_copy, report_df)
+        rows.append(info_copy)
 
-        rows.append([str(info_copy[key]) for key in headers])
-
-    with open(journal_path, "a", newline="") as file:
-        writer = csv.writer(file)
-        for row in rows:
-            writer.writerow(row)
+    journal.append(rows)
@@ -0,0 +1,277 @@
+"""Reuse completed episodes across studies.
+
+Sweeps are often relaunched with most (agent config, task, seed) combinations already evaluated by
+earlier studies on the same code. Each completed episode is identified by a content hash of:
+
+- the agent configuration (`AgentArgs`, including flags and chat model args),
+- the environment configuration (`EnvArgs`, including task name and seed),
+- the code versions from the reproducibility info (git hashes and package versions).
+
+Completed episodes are registered in a global `EpisodeIndex` under RESULTS_DIR. Before running,
+a study looks up each of its experiments and links (or copies) matching episodes into its own
+directory instead of running them again. Reused episodes contain a `reused_from.txt` file pointing
+to the original.
+
+Episodes are never reused nor registered when the code has local modifications, or when the task
+seed is not set, since the hash would not identify the episode. Use `reuse_results=False` in
+`make_study` (or `strict_reproducibility=True` when running) to evaluate everything from scratch.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+from contextlib import closing, contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from browsergym.experiments.loop import ExpArgs, yield_all_exp_results
+
+from agentlab.experiments.args import config_hash
+from agentlab.experiments.exp_utils import RESULTS_DIR
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_NAME = "episode_index.sqlite"
+REUSED_FROM_FILE_NAME = "reused_from.txt"
+
+# Fields that don't affect the outcome of an episode.
+AGENT_FIELDS_EXCLUDED = ("agent_name",)
+ENV_FIELDS_EXCLUDED = ("headless",)
+
+# Entries of the reproducibility info identifying the code that produced an episode.
+CODE_KEYS = (
+    "benchmark_version",
+    "playwright_version",
+    "agentlab_version",
+    "agentlab_git_hash",
+    "browsergym_version",
+    "browsergym_git_hash",
+)
+
+
+def agent_hash(agent_args) -> str:
+    """Content hash of an agent configuration, ignoring its name."""
+    return config_hash(agent_args, exclude=AGENT_FIELDS_EXCLUDED)
+
+
+def env_hash(env_args) -> str:
+    """Content hash of an environment configuration, ignoring headless mode."""
+    return config_hash(env_args, exclude=ENV_FIELDS_EXCLUDED)
+
+
+def code_hash(reproducibility_info: dict) -> str | None:
+    """Content hash of the code versions in the reproducibility info.
+
+    Returns:
+        str | None: The hash, or None if a module has local modifications, in which case the git
+            hashes don't identify the code.
+    """
+    if reproducibility_info is None:
+        return None
+    for key, value in reproducibility_info.items():
+        if key.endswith("__local_modifications") and value:
+            return None
+    return config_hash({key: reproducibility_info.get(key) for key in CODE_KEYS})
+
+
+def episode_key(exp_args: ExpArgs, reproducibility_info: dict) -> str | None:
+    """Key identifying the outcome of an experiment in the `EpisodeIndex`.
+
+    Returns:
+        str | None: The key, or None if the episode can't be identified, i.e. the seed is not set
+            or the code has local modifications.
+    """
+    if exp_args.env_args.task_seed is None:
+        return None
+    code = code_hash(reproducibility_info)
+    if code is None:
+        return None
+    parts = (agent_hash(exp_args.agent_args), env_hash(exp_args.env_args), code)
+    return hashlib.sha256(":".join(parts).encode("utf-8")).hexdigest()
+
+
+class EpisodeIndex:
+    """Index of completed episodes, shared by all studies.
+
+    Backed by a SQLite file, so that several studies can register episodes concurrently.
+
+    Args:
+        path: str | Path
+            Path to the index file. Defaults to RESULTS_DIR / "episode_index.sqlite".
+    """
+
+    def __init__(self, path: str | Path = None):
+        self.path = Path(path) if path is not None else RESULTS_DIR / INDEX_FILE_NAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS episodes (
+                    key TEXT PRIMARY KEY,
+                    exp_dir TEXT NOT NULL,
+                    task_name TEXT,
+                    agent_name TEXT,
+                    date TEXT
+                )""")
+
+    @contextmanager
+    def _connect(self):
+        """Connection committing on success and closed on exit."""
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            with conn:
+                yield conn
+
+    def add(self, key: str, exp_dir: str | Path, task_name: str = None, agent_name: str = None):
+        """Register a completed episode. The first episode registered for a key is kept."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO episodes VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    str(Path(exp_dir).resolve()),
+                    task_name,
+                    agent_name,
+                    datetime.now().strftime("%Y-%m-%d_%H-%M-%S"),
+                ),
+            )
+
+    def lookup(self, key: str) -> Path | None:
+        """Directory of the completed episode for key, or None.
+
+        Entries whose directory was deleted since they were registered are removed.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT exp_dir FROM episodes WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            exp_dir = Path(row[0])
+            if not (exp_dir / "summary_info.json").exists():
+                conn.execute("DELETE FROM episodes WHERE key = ?", (key,))
+                return None
+        return exp_dir
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM episodes").fetchone()[0]
+
+
+def register_completed_episodes(
+    study_dir: str | Path, reproducibility_info: dict, index: EpisodeIndex = None
+) -> int:
+    """Add the completed episodes (status "done") of a study to the index.
+
+    Args:
+        study_dir: str | Path
+            Directory of the study.
+        reproducibility_info: dict
+            Reproducibility info of the study, see `Study.reproducibility_info`.
+        index: EpisodeIndex
+            The index to update. Defaults to the global index.
+
+    Returns:
+        int: Number of episodes registered.
+    """
+    if code_hash(reproducibility_info) is None:
+        logger.info("Not registering episodes for reuse since the code has local modifications.")
+        return 0
+
+    if index is None:
+        index = EpisodeIndex()
+    n_registered = 0
+    for exp_result in yield_all_exp_results(study_dir, progress_fn=None):
+        if exp_result.status != "done":
+            continue
+        exp_args = exp_result.exp_args
+        key = episode_key(exp_args, reproducibility_info)
+        if key is None:
+            continue
+        index.add(
+            key,
+            exp_result.exp_dir,
+            task_name=exp_args.env_args.task_name,
+            agent_name=exp_args.agent_args.agent_name,
+        )
+        n_registered += 1
+    return n_registered
+
+
+def reuse_completed_episodes(
+    exp_args_list: list[ExpArgs],
+    reproducibility_info: dict,
+    study_dir: str | Path,
+    index: EpisodeIndex = None,
+    link: bool = True,
+) -> int:
+    """Fill the study directory with matching episodes of previous studies.
+
+    Each reused experiment is prepared in study_dir as usual, then the files of the original
+    episode (except exp_args.pkl) are added to its directory. The experiment becomes a dummy, as
+    with `find_incomplete`, so that it is skipped while preserving the task dependencies.
+
+    Args:
+        exp_args_list: list[ExpArgs]
+            The experiments of the study. Reused ones are modified in place.
+        reproducibility_info: dict
+            Reproducibility info of the study, see `Study.reproducibility_info`.
+        study_dir: str | Path
+            Directory of the study.
+        index: EpisodeIndex
+            The index to look up. Defaults to the global index.
+        link: bool
+            If True, files are hard linked when possible, otherwise they are copied.
+
+    Returns:
+        int: Number of reused episodes.
+    """
+    from agentlab.experiments.launch_exp import noop
+
+    if code_hash(reproducibility_info) is None:
+        logger.info("Not reusing previous episodes since the code has local modifications.")
+        return 0
+
+    if index is None:
+        index = EpisodeIndex()
+    n_reused = 0
+    for exp_args in exp_args_list:
+        if getattr(exp_args, "is_dummy", False):
+            continue
+        key = episode_key(exp_args, reproducibility_info)
+        if key is None:
+            continue
+        source_dir = index.lookup(key)
+        if source_dir is None:
+            continue
+
+        exp_args.prepare(exp_root=study_dir)
+        _copy_episode(source_dir, exp_args.exp_dir, link=link)
+        (exp_args.exp_dir / REUSED_FROM_FILE_NAME).write_text(str(source_dir))
+
+        exp_args.is_dummy = True
+        exp_args.status = "done"
+        exp_args.run = noop
+        exp_args.prepare = noop
+        n_reused += 1
+
+    if n_reused:
+        logger.info(f"Reused {n_reused} / {len(exp_args_list)} episodes from previous studies.")
+    return n_reused
+
+
+def _copy_episode(source_dir: Path, target_dir: Path, link: bool = True):
+    """Copy all files of an episode except its exp_args.pkl."""
+    copy_function = _link_or_copy if link else shutil.copy2
+    shutil.copytree(
+        source_dir,
+        target_dir,
+        ignore=shutil.ignore_patterns("exp_args.pkl", REUSED_FROM_FILE_NAME),
+        copy_function=copy_function,
+        dirs_exist_ok=True,
+    )
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:  # e.g. different file systems
+        shutil.copy2(src, dst)
+    return dst
@@ -0,0 +1,297 @@
+"""Order experiments by their expected duration.
+
+Episodes of a benchmark can have very different durations. Submitting them in list order often
+leaves a few long episodes running at the end while the other workers are idle. Using the
+duration of the same tasks in previous studies, we submit the longest episodes first (LPT
+scheduling) and estimate the makespan of the study for a given number of jobs.
+"""
+
+import heapq
+import logging
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from bgym import ExpArgs
+
+from agentlab.analyze import inspect_results
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STEP_DURATION = 10  # seconds, used when there is no history at all
+DEFAULT_MAX_STEPS = 30  # used when env_args.max_steps is not set
+
+
+def load_episode_records(study_dirs: list[Path] | Path) -> pd.DataFrame:
+    """Load the duration and LLM usage of past episodes.
+
+    The duration of an episode is the sum of the time spent in the environment and in the agent,
+    as recorded in summary_info.json (`stats.cum_step_elapsed` and `stats.cum_agent_elapsed`).
+    Token usage and cost come from the `stats.cum_*` fields written by the LLMTracker. Episodes
+    without summary info (e.g. crashed) or without any step are skipped.
+
+    Args:
+        study_dirs: list[Path] | Path
+            Directories of previous studies. They are searched recursively.
+
+    Returns:
+        pd.DataFrame: One row per episode with columns task_name, agent_name, n_steps, duration,
+            input_tokens, output_tokens and cost. Missing usage stats are NaN.
+    """
+    if isinstance(study_dirs, (str, Path)):
+        study_dirs = [study_dirs]
+
+    records = []
+    for study_dir in study_dirs:
+        result_df = inspect_results.load_result_df(study_dir, progress_fn=None, set_index=False)
+        if result_df is None:
+            continue
+        records.append(
+            pd.DataFrame(
+                {
+                    "task_name": result_df[inspect_results.TASK_KEY],
+                    "agent_name": result_df.get(inspect_results.AGENT_NAME_KEY),
+                    "n_steps": _numeric_column(result_df, "n_steps"),
+                    "duration": _numeric_column(result_df, "stats.cum_step_elapsed")
+                    + _numeric_column(result_df, "stats.cum_agent_elapsed"),
+                    "input_tokens": _numeric_column(result_df, "stats.cum_input_tokens"),
+                    "output_tokens": _numeric_column(result_df, "stats.cum_output_tokens"),
+                    "cost": _numeric_column(result_df, "stats.cum_cost"),
+                }
+            )
+        )
+
+    columns = ["task_name", "agent_name", "n_steps", "duration"]
+    columns += ["input_tokens", "output_tokens", "cost"]
+    if not records:
+        return pd.DataFrame(columns=columns)
+    records = pd.concat(records, ignore_index=True)
+    valid = (records["n_steps"] > 0) & (records["duration"] > 0) & np.isfinite(records["duration"])
+    return records[valid].reset_index(drop=True)
+
+
+def _numeric_column(result_df: pd.DataFrame, key: str) -> pd.Series:
+    if key not in result_df:
+        return pd.Series(np.nan, index=result_df.index)
+    return pd.to_numeric(result_df[key], errors="coerce")
+
+
+def load_task_durations(study_dirs: list[Path] | Path) -> dict[str, list[float]]:
+    """Load the duration of past episodes, grouped by task name.
+
+    See `load_episode_records` for how durations are computed.
+
+    Args:
+        study_dirs: list[Path] | Path
+            Directories of previous studies. They are searched recursively.
+
+    Returns:
+        dict[str, list[float]]: The durations in seconds, keyed by task name.
+    """
+    return durations_by_task(load_episode_records(study_dirs))
+
+
+def durations_by_task(records: pd.DataFrame) -> dict[str, list[float]]:
+    """Group the durations of `load_episode_records` by task name."""
+    return {
+        task_name: group.tolist() for task_name, group in records.groupby("task_name")["duration"]
+    }
+
+
+def expected_durations(
+    exp_args_list: list[ExpArgs],
+    task_durations: dict[str, list[float]] = None,
+    step_duration: float = None,
+) -> list[float]:
+    """Estimate the duration of each experiment.
+
+    Uses the median duration of the task in `task_durations` when available. Otherwise, falls back
+    to `env_args.max_steps * step_duration`. Dummy experiments (already completed when relaunching)
+    have a duration of 0.
+
+    Args:
+        exp_args_list: list[ExpArgs]
+            The experiments to estimate.
+        task_durations: dict[str, list[float]]
+            Durations of past episodes, keyed by task name. See `load_task_durations`.
+        step_duration: float
+            Duration of a step in seconds for the fallback. If None, it is estimated from
+            `task_durations` assuming episodes used all their steps, or DEFAULT_STEP_DURATION if
+            there is no history.
+
+    Returns:
+        list[float]: The expected duration in seconds of each experiment, in the same order.
+    """
+    task_durations = task_durations or {}
+    if step_duration is None:
+        step_duration = _estimate_step_duration(exp_args_list, task_durations)
+
+    durations = []
+    for exp_args in exp_args_list:
+        if getattr(exp_args, "is_dummy", False):
+            durations.append(0.0)
+            continue
+        history = task_durations.get(exp_args.env_args.task_name)
+        if history:
+            durations.append(float(np.median(history)))
+        else:
+            max_steps = exp_args.env_args.max_steps or DEFAULT_MAX_STEPS
+            durations.append(max_steps * step_duration)
+    return durations
+
+
+def _estimate_step_duration(exp_args_list, task_durations):
+    """Median of duration / max_steps over the tasks that have history."""
+    ratios = []
+    for exp_args in exp_args_list:
+        history = task_durations.get(exp_args.env_args.task_name)
+        max_steps = exp_args.env_args.max_steps
+        if history and max_steps:
+            ratios.append(np.median(history) / max_steps)
+    if not ratios:
+        return DEFAULT_STEP_DURATION
+    return float(np.median(ratios))
+
+
+def order_longest_first(
+    exp_args_list: list[ExpArgs], durations: list[float] = None
+) -> list[ExpArgs]:
+    """Sort experiments longest first, while keeping dependencies before their dependents.
+
+    This is a topological sort where, among the experiments whose dependencies are already
+    placed, the longest one comes first. Without dependencies, it is a plain LPT ordering. The
+    order is stable for experiments of equal duration.
+
+    Args:
+        exp_args_list: list[ExpArgs]
+            The experiments to order.
+        durations: list[float]
+            The expected duration of each experiment. Defaults to `expected_durations` without
+            history.
+
+    Returns:
+        list[ExpArgs]: A new list with the experiments in submission order.
+
+    Raises:
+        ValueError: If the dependency graph has a cycle.
+    """
+    if durations is None:
+        durations = expected_durations(exp_args_list)
+    return [exp_args_list[i] for i in longest_first_indices(exp_args_list, durations)]
+
+
+def longest_first_indices(exp_args_list: list[ExpArgs], durations: list[float]) -> list[int]:
+    """Same as `order_longest_first`, but returns the permutation as a list of indices."""
+    index = {exp_args.exp_id: i for i, exp_args in enumerate(exp_args_list)}
+    dependents = defaultdict(list)
+    n_pending = []
+    for i, exp_args in enumerate(exp_args_list):
+        deps = [index[dep] for dep in (exp_args.depends_on or ()) if dep in index]
+        n_pending.append(len(deps))
+        for dep in deps:
+            dependents[dep].append(i)
+
+    ready = [(-durations[i], i) for i, n in enumerate(n_pending) if n == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        _, i = heapq.heappop(ready)
+        order.append(i)
+        for j in dependents[i]:
+            n_pending[j] -= 1
+            if n_pending[j] == 0:
+                heapq.heappush(ready, (-durations[j], j))
+
+    if len(order) != len(exp_args_list):
+        raise ValueError("The dependency graph has a cycle.")
+    return order
+
+
+def estimate_makespan(
+    exp_args_list: list[ExpArgs], durations: list[float], n_jobs: int = 1
+) -> float:
+    """Estimate the wall time of running the experiments in the given order on n_jobs workers.
+
+    Simulates list scheduling: each experiment, in order, starts on the first free worker once
+    all its dependencies are finished. Experiments listed before one of their dependencies are
+    moved after it, keeping the list order otherwise.
+
+    Args:
+        exp_args_list: list[ExpArgs]
+            The experiments in submission order.
+        durations: list[float]
+            The expected duration of each experiment.
+        n_jobs: int
+            Number of parallel workers.
+
+    Returns:
+        float: The estimated makespan in seconds.
+
+    Raises:
+        ValueError: If the dependency graph has a cycle.
+    """
+    # stable topological order: with decreasing pseudo-durations, ties are broken by list index
+    order = longest_first_indices(exp_args_list, [-float(i) for i in range(len(exp_args_list))])
+
+    workers = [0.0] * max(1, n_jobs)
+    end_times = {}
+    makespan = 0.0
+    for i in order:
+        exp_args, duration = exp_args_list[i], durations[i]
+        ready_time = max(
+            (end_times.get(dep, 0.0) for dep in (exp_args.depends_on or ())), default=0.0
+        )
+        end_time = max(heapq.heappop(workers), ready_time) + duration
+        heapq.heappush(workers, end_time)
+        end_times[exp_args.exp_id] = end_time
+        makespan = max(makespan, end_time)
+
+    return makespan
+
+
+def schedule_longest_first(
+    exp_args_list: list[ExpArgs],
+    n_jobs: int = 1,
+    history_dirs: list[Path] | Path = None,
+    task_durations: dict[str, list[float]] = None,
+) -> tuple[list[ExpArgs], float]:
+    """Order experiments longest first using the history of previous studies.
+
+    Args:
+        exp_args_list: list[ExpArgs]
+            The experiments to order.
+        n_jobs: int
+            Number of parallel workers, used for the makespan estimate.
+        history_dirs: list[Path] | Path
+            Directories of previous studies to load durations from.
+        task_durations: dict[str, list[float]]
+            Already loaded durations, merged with the ones from history_dirs.
+
+    Returns:
+        tuple[list[ExpArgs], float]: The ordered experiments and the estimated makespan in
+            seconds.
+    """
+    task_durations = _merge_durations(task_durations, history_dirs)
+    durations = expected_durations(exp_args_list, task_durations)
+
+    order = longest_first_indices(exp_args_list, durations)
+    ordered = [exp_args_list[i] for i in order]
+    makespan = estimate_makespan(ordered, [durations[i] for i in order], n_jobs)
+
+    n_known = sum(exp_args.env_args.task_name in task_durations for exp_args in exp_args_list)
+    logger.info(
+        f"Ordered {len(exp_args_list)} experiments longest first ({n_known} with history). "
+        f"Estimated makespan with {n_jobs} jobs: {makespan / 60:.1f} min."
+    )
+    return ordered, makespan
+
+
+def _merge_durations(task_durations, history_dirs):
+    merged = defaultdict(list)
+    for key, values in (task_durations or {}).items():
+        merged[key].extend(values)
+    if history_dirs:
+        for key, values in load_task_durations(history_dirs).items():
+            merged[key].extend(values)
+    return dict(merged)
@@ -0,0 +1,354 @@
+"""Offline simulation of study scheduling, replaying recorded episode durations.
+
+Comparing backends and scheduling policies on real studies costs LLM budget and hours of wall
+time. Instead, `load_study_trace` extracts the duration and dependencies of each episode of a
+finished study, and `simulate` replays them with a discrete-event simulation for any n_jobs and
+policy:
+
+- "ray": ready tasks start in submission order, as with the ray backend.
+- "lpt": ready tasks start longest first (see `scheduling.order_longest_first`).
+- "critical_path": ready tasks start by decreasing length of the longest chain of tasks
+  depending on them, including themselves.
+
+Each policy can also ignore dependencies. To benchmark the real executors end-to-end without a
+browser or an LLM, `replay` runs `run_experiments` on `MockedExpArgs` stand-ins that sleep for a
+scaled version of the recorded durations.
+
+Example:
+    tasks = load_study_trace(study_dir)
+    print(compare_policies(tasks, n_jobs_list=[4, 8, 16]))
+"""
+
+import heapq
+import logging
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from browsergym.experiments.loop import yield_all_exp_results
+
+from agentlab.experiments import graph_analysis
+from agentlab.experiments.exp_utils import MockedExpArgs
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("ray", "lpt", "critical_path")
+
+
+@dataclass
+class SimulatedTask:
+    """An episode as seen by the scheduler: a duration and dependencies.
+
+    Attributes:
+        exp_id: str
+            Unique id of the episode, referred to by depends_on.
+        duration: float
+            Duration in seconds.
+        depends_on: tuple[str]
+            exp_id of the episodes that must finish before this one starts.
+        name: str
+            Name for reports, e.g. the task name.
+    """
+
+    exp_id: str
+    duration: float
+    depends_on: tuple = ()
+    name: str = None
+
+
+@dataclass
+class SimulationResult:
+    """Outcome of a simulation.
+
+    Attributes:
+        policy: str
+            The scheduling policy.
+        n_jobs: int
+            Number of workers.
+        makespan: float
+            Time at which the last task finishes, in seconds.
+        utilization: float
+            Fraction of the worker time spent running tasks.
+        schedule: pd.DataFrame
+            One row per task with exp_id, name, worker, ready, start and end times.
+        timeline: pd.DataFrame
+            Number of running and queued (ready but not started) tasks after each event.
+    """
+
+    policy: str
+    n_jobs: int
+    makespan: float
+    utilization: float
+    schedule: pd.DataFrame = field(repr=False)
+    timeline: pd.DataFrame = field(repr=False)
+
+
+def load_study_trace(study_dir: str | Path) -> list[SimulatedTask]:
+    """Load the duration and dependencies of the episodes of a finished study.
+
+    The duration of an episode is `stats.cum_step_elapsed + stats.cum_agent_elapsed` from its
+    summary_info. Episodes without summary info get the median duration of the others.
+
+    Args:
+        study_dir: str | Path
+            Directory of the study.
+
+    Returns:
+        list[SimulatedTask]: The episodes, in their original submission order.
+    """
+    exp_results = list(yield_all_exp_results(study_dir, progress_fn=None))
+    exp_results.sort(key=lambda exp_result: exp_result.exp_args.order or 0)
+
+    tasks = []
+    for i, exp_result in enumerate(exp_results):
+        exp_args = exp_result.exp_args
+        summary_info = {}
+        try:
+            summary_info = exp_result.summary_info
+        except FileNotFoundError:
+            pass
+        duration = summary_info.get("stats.cum_step_elapsed", np.nan) + summary_info.get(
+            "stats.cum_agent_elapsed", np.nan
+        )
+        tasks.append(
+            SimulatedTask(
+                exp_id=exp_args.exp_id or str(i),
+                duration=duration,
+                depends_on=tuple(exp_args.depends_on or ()),
+                name=exp_args.env_args.task_name,
+            )
+        )
+
+    known = [task.duration for task in tasks if np.isfinite(task.duration)]
+    default_duration = float(np.median(known)) if known else 0.0
+    for task in tasks:
+        if not np.isfinite(task.duration):
+            task.duration = default_duration
+    return tasks
+
+
+def tasks_from_exp_args(exp_args_list, durations: list[float]) -> list[SimulatedTask]:
+    """Make simulated tasks from a planned study, e.g. with `scheduling.expected_durations`."""
+    return [
+        SimulatedTask(
+            exp_id=exp_args.exp_id or str(i),
+            duration=duration,
+            depends_on=tuple(exp_args.depends_on or ()),
+            name=exp_args.env_args.task_name,
+        )
+        for i, (exp_args, duration) in enumerate(zip(exp_args_list, durations))
+    ]
+
+
+def simulate(
+    tasks: list[SimulatedTask],
+    n_jobs: int,
+    policy: str = "ray",
+    ignore_dependencies: bool = False,
+) -> SimulationResult:
+    """Simulate the execution of tasks on n_jobs workers.
+
+    Whenever a worker is free, it starts the ready task (all dependencies finished) with the
+    highest priority according to the policy. Ties are broken by submission order.
+
+    Args:
+        tasks: list[SimulatedTask]
+            The tasks, in submission order.
+        n_jobs: int
+            Number of workers.
+        policy: str
+            One of "ray", "lpt" or "critical_path".
+        ignore_dependencies: bool
+            If True, all tasks are ready from the start.
+
+    Returns:
+        SimulationResult: The makespan, utilization, schedule and timeline.
+
+    Raises:
+        ValueError: If the policy is unknown or the dependency graph has a cycle.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy {policy}, expected one of {POLICIES}.")
+
+    dep_graph = {
+        task.exp_id: [] if ignore_dependencies else list(task.depends_on) for task in tasks
+    }
+    successors = graph_analysis.successor_index(dep_graph)
+    graph_analysis.topological_order(dep_graph)  # raises on cycles
+    priorities = _priorities(tasks, policy, dep_graph, successors)
+    index = {task.exp_id: i for i, task in enumerate(tasks)}
+
+    n_pending = [sum(dep in index for dep in dep_graph[task.exp_id]) for task in tasks]
+    ready = [(priorities[i], i) for i, n in enumerate(n_pending) if n == 0]
+    heapq.heapify(ready)
+    ready_times = [0.0] * len(tasks)
+    free_workers = list(range(max(1, n_jobs)))
+    running = []  # heap of (end_time, task index, worker)
+    schedule = []
+    timeline = []
+    now = 0.0
+
+    while ready or running:
+        while ready and free_workers:
+            _, i = heapq.heappop(ready)
+            worker = heapq.heappop(free_workers)
+            heapq.heappush(running, (now + tasks[i].duration, i, worker))
+            schedule.append((i, worker, ready_times[i], now, now + tasks[i].duration))
+        timeline.append((now, len(running), len(ready)))
+
+        now, i, worker = heapq.heappop(running)
+        finished = [(i, worker)]
+        while running and running[0][0] == now:
+            _, i, worker = heapq.heappop(running)
+            finished.append((i, worker))
+
+        for i, worker in finished:
+            heapq.heappush(free_workers, worker)
+            for succ in successors[tasks[i].exp_id]:
+                j = index[succ]
+                n_pending[j] -= 1
+                if n_pending[j] == 0:
+                    ready_times[j] = now
+                    heapq.heappush(ready, (priorities[j], j))
+
+    timeline.append((now, 0, 0))
+    makespan = now
+    busy_time = sum(task.duration for task in tasks)
+    utilization = busy_time / (makespan * max(1, n_jobs)) if makespan > 0 else 1.0
+
+    schedule = pd.DataFrame(
+        [
+            dict(
+                exp_id=tasks[i].exp_id,
+                name=tasks[i].name,
+                worker=worker,
+                ready=ready_time,
+                start=start,
+                end=end,
+            )
+            for i, worker, ready_time, start, end in schedule
+        ],
+        columns=["exp_id", "name", "worker", "ready", "start", "end"],
+    )
+    timeline = pd.DataFrame(timeline, columns=["time", "n_running", "n_queued"])
+    return SimulationResult(policy, n_jobs, makespan, utilization, schedule, timeline)
+
+
+def _priorities(tasks, policy, dep_graph, successors) -> list[tuple]:
+    """Priority of each task, lower is started first."""
+    if policy == "ray":
+        return [(i,) for i in range(len(tasks))]
+    if policy == "lpt":
+        return [(-task.duration, i) for i, task in enumerate(tasks)]
+
+    # critical_path: longest chain of tasks from this task to the end of the graph
+    durations = {task.exp_id: task.duration for task in tasks}
+    bottom_level = {}
+    for node in reversed(graph_analysis.topological_order(dep_graph)):
+        tail = max((bottom_level[succ] for succ in successors[node]), default=0.0)
+        bottom_level[node] = durations[node] + tail
+    return [(-bottom_level[task.exp_id], i) for i, task in enumerate(tasks)]
+
+
+def compare_policies(
+    tasks: list[SimulatedTask],
+    n_jobs_list: list[int],
+    policies: list[str] = POLICIES,
+    include_ignore_dependencies: bool = True,
+) -> pd.DataFrame:
+    """Simulate every combination of n_jobs and policy.
+
+    Args:
+        tasks: list[SimulatedTask]
+            The tasks, in submission order.
+        n_jobs_list: list[int]
+            Numbers of workers to simulate.
+        policies: list[str]
+            The policies to compare.
+        include_ignore_dependencies: bool
+            Also simulate each policy with dependencies ignored.
+
+    Returns:
+        pd.DataFrame: makespan (in hours) and utilization, indexed by n_jobs, policy and
+            ignore_dependencies.
+    """
+    rows = []
+    ignore_options = (False, True) if include_ignore_dependencies else (False,)
+    for n_jobs in n_jobs_list:
+        for policy in policies:
+            for ignore_dependencies in ignore_options:
+                result = simulate(tasks, n_jobs, policy, ignore_dependencies=ignore_dependencies)
+                rows.append(
+                    dict(
+                        n_jobs=n_jobs,
+                        policy=policy,
+                        ignore_dependencies=ignore_dependencies,
+                        makespan_h=result.makespan / 3600,
+                        utilization=result.utilization,
+                    )
+                )
+    return pd.DataFrame(rows).set_index(["n_jobs", "policy", "ignore_dependencies"])
+
+
+def make_mocked_exp_args(tasks: list[SimulatedTask], time_scale: float = 0.01) -> list:
+    """Make MockedExpArgs stand-ins sleeping for the scaled duration of each task.
+
+    Args:
+        tasks: list[SimulatedTask]
+            The tasks to mock.
+        time_scale: float
+            Multiplier applied to durations, e.g. 0.01 replays 1h of episodes in 36s.
+
+    Returns:
+        list[MockedExpArgs]: The stand-ins, in the same order.
+    """
+    return [
+        MockedExpArgs(
+            exp_id=task.exp_id,
+            depends_on=list(task.depends_on),
+            task_time=task.duration * time_scale,
+        )
+        for task in tasks
+    ]
+
+
+def replay(
+    tasks: list[SimulatedTask],
+    n_jobs: int,
+    parallel_backend: str = "ray",
+    time_scale: float = 0.01,
+    ignore_dependencies: bool = False,
+) -> float:
+    """Run the tasks through the real executor with MockedExpArgs stand-ins.
+
+    Args:
+        tasks: list[SimulatedTask]
+            The tasks, in submission order.
+        n_jobs: int
+            Number of parallel jobs.
+        parallel_backend: str
+            Backend passed to `run_experiments`.
+        time_scale: float
+            Multiplier applied to durations, see `make_mocked_exp_args`.
+        ignore_dependencies: bool
+            If True, the stand-ins have no dependencies.
+
+    Returns:
+        float: The measured makespan, rescaled to the original time unit. Compare it with
+            `simulate` to measure the overhead of the executor.
+    """
+    from agentlab.experiments.launch_exp import run_experiments
+
+    exp_args_list = make_mocked_exp_args(tasks, time_scale=time_scale)
+    if ignore_dependencies:
+        for exp_args in exp_args_list:
+            exp_args.depends_on = []
+
+    with tempfile.TemporaryDirectory() as study_dir:
+        start = time.time()
+        run_experiments(n_jobs, exp_args_list, study_dir, parallel_backend=parallel_backend)
+        elapsed = time.time() - start
+    return elapsed / time_scale
@@ -0,0 +1,262 @@
+"""Step-level deadlines enforced inside the worker running an episode.
+
+The episode timeout of the ray backend (`max_steps * avg_step_timeout`) only catches a hung
+episode after hours, and cancelling the ray task loses its logs. `StepWatchdog` gives each phase
+of a step its own deadline:
+
+- get_action: the agent choosing an action (mostly LLM calls).
+- action_execution: the environment executing the action in the browser.
+- env_step: resetting the environment, and the rest of a step (waiting for the page and
+  extracting the observation).
+
+Deadlines are enforced with SIGALRM in the main thread of the worker. When a phase exceeds its
+deadline, a `StepTimeoutError` is raised in it. If the code of the phase swallows the exception,
+it is raised again every `grace` seconds, and again when the phase returns. Code catching every
+exception in an unbounded loop can't be interrupted this way, retry loops have to be bounded. The episode loop
+then ends the episode like for any other exception: steps are saved and the summary info
+records the error, with a "timeout" entry naming the phase.
+
+Usage:
+    study.step_deadlines = StepDeadlines(get_action=300, action_execution=60, env_step=120)
+"""
+
+import json
+import logging
+import signal
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StepDeadlines:
+    """Maximum duration in seconds of each phase of a step. None disables a phase.
+
+    Attributes:
+        get_action: float
+            Deadline for agent.get_action.
+        action_execution: float
+            Deadline for the execution of the action in the browser.
+        env_step: float
+            Deadline for env.reset, and for env.step excluding the action execution.
+        grace: float
+            Interval in seconds at which the timeout is raised again if it was caught.
+    """
+
+    get_action: float = 300
+    action_execution: float = 60
+    env_step: float = 120
+    grace: float = 5
+
+
+class StepTimeoutError(Exception):
+    """A phase of a step exceeded its deadline."""
+
+    def __init__(self, phase: str, seconds: float, step: int = None):
+        self.phase = phase
+        self.seconds = seconds
+        self.step = step
+        super().__init__(f"{phase} exceeded its deadline of {seconds}s at step {step}.")
+
+
+class StepWatchdog:
+    """Enforce the deadlines of `StepDeadlines` on an agent and an environment.
+
+    Args:
+        deadlines: StepDeadlines
+            The deadline of each phase.
+    """
+
+    def __init__(self, deadlines: StepDeadlines):
+        self.deadlines = deadlines
+        self.step = 0
+        self.timed_out = None  # the StepTimeoutError of the first phase exceeding its deadline
+        self._stack = []  # (phase, absolute deadline) of the active phases, innermost last
+        self._installed = False
+
+    @property
+    def supported(self) -> bool:
+        """SIGALRM is only available on Unix and in the main thread."""
+        return sys.platform != "win32" and threading.current_thread() is threading.main_thread()
+
+    @contextmanager
+    def installed(self):
+        """Install the SIGALRM handler for the duration of the episode."""
+        if not self.supported:
+            logger.warning("Step deadlines need SIGALRM in the main thread. Not enforcing them.")
+            yield self
+            return
+
+        previous_handler = signal.signal(signal.SIGALRM, self._on_alarm)
+        self._installed = True
+        try:
+            yield self
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+            self._installed = False
+            self._stack = []
+
+    def enter(self, phase: str) -> int:
+        """Start a phase. Returns the depth to give to `exit`."""
+        seconds = getattr(self.deadlines, phase)
+        deadline = time.monotonic() + seconds if seconds is not None else None
+        self._stack.append((phase, deadline))
+        self._arm()
+        return len(self._stack) - 1
+
+    def exit(self, depth: int):
+        """End the phase started at depth, and any phase nested in it."""
+        del self._stack[depth:]
+        self._arm()
+
+    @contextmanager
+    def phase(self, phase: str):
+        """Run a block of code with the deadline of phase."""
+        depth = self.enter(phase)
+        try:
+            yield
+        except Exception as e:
+            # the timeout may have been turned into another exception by the phase
+            if self.timed_out is not None and not isinstance(e, StepTimeoutError):
+                raise self._new_timeout() from e
+            raise
+        finally:
+            self.exit(depth)
+        self.raise_if_timed_out()
+
+    def raise_if_timed_out(self):
+        """Raise the timeout again in case it was caught inside a phase."""
+        if self.timed_out is not None:
+            raise self._new_timeout()
+
+    def watch_agent(self, agent):
+        """Wrap agent.get_action with the get_action deadline."""
+        get_action = agent.get_action
+
+        def watched_get_action(*args, **kwargs):
+            with self.phase("get_action"):
+                return get_action(*args, **kwargs)
+
+        agent.get_action = watched_get_action
+        return agent
+
+    def watch_env(self, env):
+        """Wrap env.reset and env.step with the env_step deadline.
+
+        The action execution is delimited by the pre_step and post_step methods of browsergym's
+        BrowserEnv, when available.
+        """
+        reset, step = env.reset, env.step
+
+        def watched_reset(*args, **kwargs):
+            with self.phase("env_step"):
+                return reset(*args, **kwargs)
+
+        def watched_step(*args, **kwargs):
+            self.step += 1
+            with self.phase("env_step"):
+                return step(*args, **kwargs)
+
+        env.reset = watched_reset
+        env.step = watched_step
+
+        unwrapped = getattr(env, "unwrapped", env)
+        if hasattr(unwrapped, "pre_step") and hasattr(unwrapped, "post_step"):
+            pre_step, post_step = unwrapped.pre_step, unwrapped.post_step
+            depth = []
+
+            def watched_pre_step(*args, **kwargs):
+                result = pre_step(*args, **kwargs)
+                depth.append(self.enter("action_execution"))
+                return result
+
+            def watched_post_step(*args, **kwargs):
+                if depth:
+                    self.exit(depth.pop())
+                return post_step(*args, **kwargs)
+
+            unwrapped.pre_step = watched_pre_step
+            unwrapped.post_step = watched_post_step
+        return env
+
+    def _earliest(self):
+        """The active phase with the earliest deadline, and its deadline."""
+        active = [(deadline, phase) for phase, deadline in self._stack if deadline is not None]
+        if not active:
+            return None, None
+        deadline, phase = min(active)
+        return phase, deadline
+
+    def _arm(self):
+        """Set the timer to the earliest deadline of the active phases."""
+        if not self._installed:
+            return
+        _, deadline = self._earliest()
+        if deadline is None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        else:
+            # setitimer(0) would disable the timer, fire right away instead
+            signal.setitimer(signal.ITIMER_REAL, max(deadline - time.monotonic(), 1e-3))
+
+    def _on_alarm(self, signum, frame):
+        phase, _ = self._earliest()
+        if phase is None:
+            return
+        if self.timed_out is None:
+            self.timed_out = StepTimeoutError(phase, getattr(self.deadlines, phase), self.step)
+            logger.warning(str(self.timed_out))
+        # raise again later if the exception is swallowed by the phase
+        signal.setitimer(signal.ITIMER_REAL, self.deadlines.grace)
+        raise self._new_timeout()
+
+    def _new_timeout(self) -> StepTimeoutError:
+        # a fresh exception each time, re-raising the same one would grow its traceback
+        timeout = self.timed_out
+        return StepTimeoutError(timeout.phase, timeout.seconds, timeout.step)
+
+
+@contextmanager
+def watch_episode(exp_args, deadlines: StepDeadlines):
+    """Enforce step deadlines on the agent and environment created by exp_args.run().
+
+    On timeout, "timeout" is added to the summary info of the episode with the phase that
+    exceeded its deadline.
+    """
+    watchdog = StepWatchdog(deadlines)
+    agent_args, env_args = exp_args.agent_args, exp_args.env_args
+    make_agent, make_env = agent_args.make_agent, env_args.make_env
+
+    def make_watched_agent(*args, **kwargs):
+        return watchdog.watch_agent(make_agent(*args, **kwargs))
+
+    def make_watched_env(*args, **kwargs):
+        return watchdog.watch_env(make_env(*args, **kwargs))
+
+    agent_args.make_agent = make_watched_agent
+    env_args.make_env = make_watched_env
+    try:
+        with watchdog.installed():
+            yield watchdog
+    finally:
+        vars(agent_args).pop("make_agent", None)
+        vars(env_args).pop("make_env", None)
+
+    if watchdog.timed_out is not None and exp_args.exp_dir is not None:
+        _record_timeout(exp_args.exp_dir, watchdog.timed_out)
+
+
+def _record_timeout(exp_dir, timeout: StepTimeoutError):
+    summary_path = exp_dir / "summary_info.json"
+    if not summary_path.exists():
+        return
+    with open(summary_path, "r") as f:
+        summary_info = json.load(f)
+    summary_info["timeout"] = timeout.phase
+    summary_info["timeout_step"] = timeout.step
+    with open(summary_path, "w") as f:
+        json.dump(summary_info, f, indent=4)
@@ -6,6 +6,7 @@ import pickle
 import uuid
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 
@@ -16,9 +17,14 @@ from slugify import slugify
 from agentlab.agents.agent_args import AgentArgs
 from agentlab.analyze import inspect_results
 from agentlab.experiments import reproducibility_util as repro
+from agentlab.experiments import result_reuse
+from agentlab.experiments import scheduling
+from agentlab.experiments.adaptive_concurrency import AdaptiveConcurrency
 from agentlab.experiments.exp_utils import RESULTS_DIR, add_dependencies
 from agentlab.experiments.launch_exp import find_incomplete, non_dummy_count, run_experiments
 from agentlab.experiments.multi_server import BaseServer, WebArenaInstanceVars
+from agentlab.experiments.ray_runtime import RayRuntime
+from agentlab.experiments.step_watchdog import StepDeadlines
 from multiprocessing import Pool, Manager, Queue
 
 logger = logging.getLogger(__name__)
@@ -32,6 +38,8 @@ def make_study(
     comment=None,
     ignore_dependencies=False,
     parallel_servers=None,
+    reuse_results=True,
+    ray_runtime: RayRuntime = None,
 ):
     """Run a list of agents on a benchmark.
 
@@ -67,6 +75,13 @@ def make_study(
             dispatch agent_args on a pool of servers in parallel. If len(agent_args) >
             len(parallel_servers), the servers will be reused for next evaluation (with a reset) as
             soon as it is done.
+        reuse_results: bool
+            If True, episodes already completed by previous studies with the same agent
+            configuration, task, seed and code version are linked into the study instead of being
+            run again. See `result_reuse`. Set to False for a fully independent evaluation.
+        ray_runtime: RayRuntime
+            If not None, the ray runtime shared by the runs of the study, or of all its
+            sub-studies. See `ray_runtime`.
 
     Returns:
         Study | SequentialStudies | ParallelStudies object.
@@ -96,12 +111,15 @@ def make_study(
                     suffix=suffix,
                     comment=comment,
                     ignore_dependencies=ignore_dependencies,
+                    reuse_results=reuse_results,
                 )
             )
         if parallel_servers is not None:
-            return ParallelStudies(studies, parallel_servers=parallel_servers)
+            return ParallelStudies(
+                studies, ray_runtime=ray_runtime, parallel_servers=parallel_servers
+            )
         else:
-            return SequentialStudies(studies)
+            return SequentialStudies(studies, ray_runtime=ray_runtime)
     else:
         return Study(
             agent_args,
@@ -110,6 +128,8 @@ def make_study(
             suffix=suffix,
             comment=comment,
             ignore_dependencies=ignore_dependencies,
+            reuse_results=reuse_results,
+            ray_runtime=ray_runtime,
         )
 
 
@@ -207,6 +227,38 @@ class Study(AbstractStudy):
         demo_mode: bool
             If True, the experiments will be run in demo mode, which will record videos, and enable
             visual effects for actions.
+        speculative_execution: bool
+            If True, idle workers will run duplicates of straggling episodes (with no dependencies)
+            and keep the first attempt to finish. Only supported by the ray backend.
+        order_by_duration: bool
+            If True, experiments are submitted longest first (LPT scheduling), using the episode
+            durations found in duration_history. Tasks without history fall back to
+            env_args.max_steps. This reduces the time where only a few long episodes are running.
+        duration_history: list[Path]
+            Directories of previous studies used to estimate episode durations. Also used by
+            speculative_execution to detect stragglers.
+        adaptive_concurrency: AdaptiveConcurrency
+            If not None, the number of concurrent episodes is adjusted within
+            [adaptive_concurrency.min_jobs, n_jobs] based on host CPU and memory usage, and
+            workers leaking memory are restarted. Only supported by the ray backend.
+        reuse_results: bool
+            If True, episodes already completed by previous studies with the same agent
+            configuration, task, seed and code version are linked into the study instead of being
+            run again, and the completed episodes of this study are registered for future reuse.
+            Ignored when running with strict_reproducibility. Enabled by `make_study` by
+            default. See `result_reuse`.
+        step_deadlines: StepDeadlines
+            If not None, the agent's get_action, the action execution and the environment step
+            each have their own deadline, enforced inside the worker. A stalled step ends its
+            episode within its deadline, keeping the steps done so far. See `step_watchdog`.
+        repro_ignore_paths: list[Path]
+            Directories skipped when scanning the agentlab and browsergym repositories for
+            untracked files, e.g. large result directories. RESULTS_DIR is always skipped. Paths
+            are absolute or relative to the repository root.
+        ray_runtime: RayRuntime
+            If not None, the ray runtime is kept alive (or connected to an existing cluster)
+            across relaunches and studies sharing it, and each run reserves n_jobs CPUs in it.
+            See `ray_runtime`.
     """
 
     agent_args: list[AgentArgs] = None
@@ -221,6 +273,14 @@ class Study(AbstractStudy):
     ignore_dependencies: bool = False
     avg_step_timeout: int = 60
     demo_mode: bool = False
+    speculative_execution: bool = False
+    order_by_duration: bool = False
+    duration_history: list[Path] = None
+    adaptive_concurrency: AdaptiveConcurrency = None
+    reuse_results: bool = False
+    step_deadlines: StepDeadlines = None
+    repro_ignore_paths: list[Path] = None
+    ray_runtime: RayRuntime = None
 
     def __post_init__(self):
         """Initialize the study. Set the uuid, and generate the exp_args_list."""
@@ -284,6 +344,7 @@ class Study(AbstractStudy):
             ignore_changes=not strict_reproducibility,
             comment=comment,
             allow_bypass_benchmark_version=not strict_reproducibility,
+            ignore_paths=self.repro_ignore_paths,
         )
         if self.reproducibility_info is not None:
             repro.assert_compatible(
@@ -305,12 +366,20 @@ class Study(AbstractStudy):
         )
         self.save()
 
+        reuse_results = self.reuse_results and not strict_reproducibility
+        if reuse_results:
+            result_reuse.reuse_completed_episodes(
+                self.exp_args_list, self.reproducibility_info, self.dir
+            )
+
         n_exp = len(self.exp_args_list)
         last_error_count = None
 
         for i in range(n_relaunch):
             logger.info(f"Launching study {self.name} - trial {i + 1} / {n_relaunch}")
             self._run(n_jobs, parallel_backend, strict_reproducibility)
+            if reuse_results:
+                result_reuse.register_completed_episodes(self.dir, self.reproducibility_info)
 
             suffix = f"trial_{i + 1}_of_{n_relaunch}"
             _, summary_df, _ = self.get_results(suffix=suffix)
@@ -359,12 +428,27 @@ class Study(AbstractStudy):
         self.benchmark.prepare_backends()
         logger.info("Backends ready.")
 
+        task_durations = None
+        if self.duration_history:
+            task_durations = scheduling.load_task_durations(self.duration_history)
+
+        exp_args_list = self.exp_args_list
+        if self.order_by_duration:
+            exp_args_list, _ = scheduling.schedule_longest_first(
+                exp_args_list, n_jobs=n_jobs, task_durations=task_durations
+            )
+
         run_experiments(
             n_jobs,
-            self.exp_args_list,
+            exp_args_list,
             self.dir,
             parallel_backend=parallel_backend,
             avg_step_timeout=self.avg_step_timeout,
+            speculative_execution=self.speculative_execution,
+            task_durations=task_durations,
+            adaptive_concurrency=self.adaptive_concurrency,
+            step_deadlines=self.step_deadlines,
+            ray_runtime=self.ray_runtime,
         )
 
     def append_to_journal(self, strict_reproducibility=True):
@@ -390,6 +474,23 @@ class Study(AbstractStudy):
         for exp_args in self.exp_args_list:
             exp_args.env_args.max_steps = max_steps
 
+    def estimate_makespan(self, n_jobs=1):
+        """Estimate the wall time of the study in seconds for n_jobs.
+
+        Uses duration_history when available and assumes longest first submission if
+        order_by_duration is True, list order otherwise.
+        """
+        task_durations = None
+        if self.duration_history:
+            task_durations = scheduling.load_task_durations(self.duration_history)
+        if self.order_by_duration:
+            _, makespan = scheduling.schedule_longest_first(
+                self.exp_args_list, n_jobs=n_jobs, task_durations=task_durations
+            )
+            return makespan
+        durations = scheduling.expected_durations(self.exp_args_list, task_durations)
+        return scheduling.estimate_makespan(self.exp_args_list, durations, n_jobs)
+
     @staticmethod
     def load(dir: Path) -> "Study":
         dir = Path(dir)
@@ -446,9 +547,17 @@ class SequentialStudies(AbstractStudy):
     Sequential execution of multiple studies.
 
     This is required for e.g. WebArena, where a server reset is required between evaluations of each agent.
+
+    Args:
+        studies: list[Study]
+            The studies to run.
+        ray_runtime: RayRuntime
+            If not None, the ray runtime of the sub-studies that don't have their own. See
+            `ray_runtime`.
     """
 
     studies: list[Study]
+    ray_runtime: RayRuntime = None
 
     @property
     def name(self):
@@ -477,6 +586,8 @@ class SequentialStudies(AbstractStudy):
 
     def _run(self, n_jobs=1, parallel_backend="ray", strict_reproducibility=False, n_relaunch=3):
         for study in self.studies:
+            if study.ray_runtime is None:
+                study.ray_runtime = self.ray_runtime
             study.run(n_jobs, parallel_backend, strict_reproducibility, n_relaunch)
 
     def override_max_steps(self, max_steps):
@@ -487,6 +598,16 @@ class SequentialStudies(AbstractStudy):
         for study in self.studies:
             study.append_to_journal(strict_reproducibility=strict_reproducibility)
 
+    def _gather_reproducibility_info(self, strict_reproducibility=False) -> dict:
+        """Read the git state once for all sub-studies, before they run in other processes.
+
+        Returns:
+            dict: The reproducibility cache, to be loaded by each worker.
+        """
+        for study in self.studies:
+            study.set_reproducibility_info(strict_reproducibility, comment=study.comment)
+        return repro.cache_snapshot()
+
 
 def _init_worker(server_queue: Queue):
     """Run once at the initialization of the worker in the multiprocessing.Pool.
@@ -506,11 +627,52 @@ def _init_worker(server_queue: Queue):
     server_instance.init()
 
 
-def _run_study(study: Study, n_jobs, parallel_backend, strict_reproducibility, n_relaunch):
-    """Wrapper to run a study remotely."""
+def _run_study(
+    study: Study,
+    n_jobs,
+    parallel_backend,
+    strict_reproducibility,
+    n_relaunch,
+    repro_cache=None,
+    ray_runtime: RayRuntime = None,
+):
+    """Wrapper to run a study remotely.
+
+    ray_runtime, if not None, connects to the runtime of the main process. It replaces the runtime
+    of the study unless the study connects to a cluster of its own.
+    """
+    repro.load_cache(repro_cache)
+    if ray_runtime is not None and (study.ray_runtime is None or study.ray_runtime._local):
+        study.ray_runtime = ray_runtime
     study.run(n_jobs, parallel_backend, strict_reproducibility, n_relaunch)
 
 
+@contextmanager
+def _shared_ray_runtime(
+    studies: list[Study], ray_runtime: RayRuntime, n_jobs: int, parallel_backend: str
+):
+    """Start the local ray runtime of parallel sub-studies once, in the main process.
+
+    A local runtime pickled into each worker process would start a runtime with all the CPUs of
+    the machine in each of them.
+
+    Yields:
+        RayRuntime: The runtime of the sub-studies, connecting to the one of the main process if
+            it is local. None if neither the studies nor their sub-studies have one.
+    """
+    if ray_runtime is None:
+        runtimes = [s.ray_runtime for s in studies if s.ray_runtime is not None]
+        ray_runtime = next((r for r in runtimes if r._local), None)
+    if parallel_backend != "ray" or ray_runtime is None or not ray_runtime._local:
+        yield ray_runtime
+        return
+    ray_runtime.start(n_jobs)
+    try:
+        yield ray_runtime.for_workers()
+    finally:
+        ray_runtime.stop()
+
+
 @dataclass
 class ParallelStudies(SequentialStudies):
     parallel_servers: list[BaseServer] | int = None
@@ -530,21 +692,36 @@ class ParallelStudies(SequentialStudies):
         for server in parallel_servers:
             server_queue.put(server)
 
-        with ProcessPoolExecutor(
-            max_workers=len(parallel_servers), initializer=_init_worker, initargs=(server_queue,)
-        ) as executor:
-            # Create list of arguments for each study
-            study_args = [
-                (study, n_jobs, parallel_backend, strict_reproducibility, n_relaunch)
-                for study in self.studies
-            ]
+        repro_cache = self._gather_reproducibility_info(strict_reproducibility)
+        n_jobs_total = n_jobs * len(parallel_servers)
+        with _shared_ray_runtime(
+            self.studies, self.ray_runtime, n_jobs_total, parallel_backend
+        ) as runtime:
+            with ProcessPoolExecutor(
+                max_workers=len(parallel_servers),
+                initializer=_init_worker,
+                initargs=(server_queue,),
+            ) as executor:
+                # Create list of arguments for each study
+                study_args = [
+                    (
+                        study,
+                        n_jobs,
+                        parallel_backend,
+                        strict_reproducibility,
+                        n_relaunch,
+                        repro_cache,
+                        runtime,
+                    )
+                    for study in self.studies
+                ]
 
-            # Submit all tasks and wait for completion
-            futures = [executor.submit(_run_study, *args) for args in study_args]
+                # Submit all tasks and wait for completion
+                futures = [executor.submit(_run_study, *args) for args in study_args]
 
-            # Wait for all futures to complete and raise any exceptions
-            for future in futures:
-                future.result()
+                # Wait for all futures to complete and raise any exceptions
+                for future in futures:
+                    future.result()
 
 
 @dataclass
@@ -567,11 +744,25 @@ class ParallelStudies_alt(SequentialStudies):
         for server in parallel_servers:
             server_queue.put(server)
 
-        with Pool(len(parallel_servers), initializer=_init_worker, initargs=(server_queue,)) as p:
+        repro_cache = self._gather_reproducibility_info(strict_reproducibility)
+        n_jobs_total = n_jobs * len(parallel_servers)
+        with _shared_ray_runtime(
+            self.studies, self.ray_runtime, n_jobs_total, parallel_backend
+        ) as runtime, Pool(
+            len(parallel_servers), initializer=_init_worker, initargs=(server_queue,)
+        ) as p:
             p.starmap(
                 _run_study,
                 [
-                    (study, n_jobs, parallel_backend, strict_reproducibility, n_relaunch)
+                    (
+                        study,
+                        n_jobs,
+                        parallel_backend,
+                        strict_reproducibility,
+                        n_relaunch,
+                        repro_cache,
+                        runtime,
+                    )
                     for study in self.studies
                 ],
             )
@@ -0,0 +1,323 @@
+"""Successive halving search over agent configurations.
+
+Evaluating every sampled configuration (e.g. from `args.iter_sweep` on `RANDOM_SEARCH_AGENT`) on
+the full benchmark spends most of the budget on clearly bad configurations. Successive halving
+evaluates all configurations on a small subset of the episodes of the benchmark, promotes the top
+1/eta of them to a larger subset, and repeats until the remaining configurations are evaluated on
+the full benchmark.
+
+Episodes are ordered once, cycling over the tasks in random order before moving to the next seed
+of each task. Rung r uses the first n_r episodes, so each rung adds more tasks, then more seeds.
+Promoted configurations keep their episodes from previous rungs and only run the new ones. Each
+rung is a regular `Study` with all its configurations, so it runs in parallel through the usual
+backends.
+
+Example:
+    configs = list(iter_sweep(RANDOM_SEARCH_AGENT, n_samples=27, seed=0, independent=True))
+    search = SuccessiveHalving(configs, "miniwob", eta=3)
+    leaderboard = search.run(n_jobs=16)
+    print(search.report())
+"""
+
+import copy
+import json
+import logging
+import math
+import random
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+import bgym
+import numpy as np
+import pandas as pd
+from browsergym.experiments.loop import yield_all_exp_results
+
+from agentlab.agents.agent_args import AgentArgs
+from agentlab.experiments.exp_utils import RESULTS_DIR
+from agentlab.experiments.study import Study
+
+logger = logging.getLogger(__name__)
+
+RECORD_COLUMNS = ["config_id", "rung", "task_name", "task_seed", "reward", "status", "cost"]
+
+
+@dataclass
+class SuccessiveHalving:
+    """Multi-fidelity search driver running one `Study` per rung.
+
+    Attributes:
+        agent_args: list[AgentArgs]
+            The configurations to compare.
+        benchmark: bgym.Benchmark | str
+            The benchmark. The last rung uses all its episodes.
+        eta: int
+            Only the top 1/eta configurations of a rung are promoted to the next one.
+        n_rungs: int
+            Number of rungs. Defaults to 1 + floor(log_eta(len(agent_args))), so that about one
+            configuration reaches the full benchmark.
+        min_episodes: int
+            Minimum number of episodes per configuration in the first rung.
+        seed: int
+            Seed for the order of the tasks.
+        dir: Path
+            Directory of the search. Each rung is saved as a study in a sub-directory. If None, a
+            directory is created in RESULTS_DIR.
+        suffix: str
+            A suffix to add to the name of the search.
+        ignore_dependencies: bool
+            Passed to the study of each rung.
+        logging_level: int
+            The logging level for individual jobs.
+        logging_level_stdout: int
+            The logging level for the stdout of the main script.
+    """
+
+    agent_args: list[AgentArgs] = None
+    benchmark: bgym.Benchmark | str = None
+    eta: int = 3
+    n_rungs: int = None
+    min_episodes: int = 1
+    seed: int = 0
+    dir: Path = None
+    suffix: str = ""
+    ignore_dependencies: bool = False
+    logging_level: int = logging.DEBUG
+    logging_level_stdout: int = logging.WARNING
+    records: pd.DataFrame = field(default=None, repr=False)
+    promoted: list[list[int]] = field(default=None, repr=False)
+
+    def __post_init__(self):
+        if self.eta < 2:
+            raise ValueError(f"eta must be at least 2, got {self.eta}.")
+        if isinstance(self.benchmark, str):
+            self.benchmark = bgym.DEFAULT_BENCHMARKS[self.benchmark.lower()]()
+        if isinstance(self.dir, str):
+            self.dir = Path(self.dir)
+        if self.n_rungs is None:
+            self.n_rungs = 1 + int(math.floor(math.log(len(self.agent_args), self.eta) + 1e-9))
+        self.episodes = interleave_episodes(self.benchmark.env_args_list, seed=self.seed)
+        self.rung_sizes = rung_sizes(len(self.episodes), self.n_rungs, self.eta, self.min_episodes)
+
+    @property
+    def name(self):
+        suffix = f"_{self.suffix}" if self.suffix else ""
+        return f"successive_halving_{len(self.agent_args)}_configs_on_{self.benchmark.name}{suffix}"
+
+    def run(
+        self, n_jobs=1, parallel_backend="ray", strict_reproducibility=False, n_relaunch=3
+    ) -> pd.DataFrame:
+        """Run all rungs and return the leaderboard. See `Study.run` for the arguments."""
+        if self.dir is None:
+            dir_name = f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{self.name}"
+            self.dir = RESULTS_DIR / dir_name
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+        records = []
+        config_ids = list(range(len(self.agent_args)))
+        self.promoted = []
+        n_done = 0
+        for rung, n_episodes in enumerate(self.rung_sizes):
+            self.promoted.append(config_ids)
+            logger.info(
+                f"Rung {rung + 1} / {len(self.rung_sizes)}: {len(config_ids)} configurations on "
+                f"{n_episodes} episodes."
+            )
+            new_episodes = self.episodes[n_done:n_episodes]
+            if new_episodes:
+                run_kwargs = dict(
+                    n_jobs=n_jobs,
+                    parallel_backend=parallel_backend,
+                    strict_reproducibility=strict_reproducibility,
+                    n_relaunch=n_relaunch,
+                )
+                records.append(self._run_rung(rung, config_ids, new_episodes, run_kwargs))
+            n_done = n_episodes
+
+            self.records = pd.concat(records, ignore_index=True)
+            if rung < len(self.rung_sizes) - 1:
+                n_keep = max(1, math.ceil(len(config_ids) / self.eta))
+                config_ids = top_configs(self.records, config_ids, n_keep)
+
+        leaderboard = self.leaderboard()
+        leaderboard.to_csv(self.dir / "leaderboard.csv")
+        (self.dir / "budget.json").write_text(json.dumps(self.budget(), indent=2))
+        logger.info("\n" + self.report())
+        return leaderboard
+
+    def _run_rung(self, rung, config_ids, env_args_list, run_kwargs) -> pd.DataFrame:
+        """Run the configurations on the episodes with a study, and return their records."""
+        benchmark = _sub_benchmark(self.benchmark, env_args_list, name_suffix=f"rung_{rung}")
+        # Study sets the benchmark on its agent args, which may share sub-objects between configs
+        study = Study(
+            [copy.deepcopy(self.agent_args[config_id]) for config_id in config_ids],
+            benchmark,
+            dir=self.dir / f"rung_{rung}",
+            suffix=f"rung_{rung}",
+            ignore_dependencies=self.ignore_dependencies,
+            logging_level=self.logging_level,
+            logging_level_stdout=self.logging_level_stdout,
+        )
+        study.run(**run_kwargs)
+        return load_rung_records(study.dir, config_ids, len(env_args_list), rung)
+
+    def leaderboard(self) -> pd.DataFrame:
+        """Configurations sorted by the last rung they reached, then by mean reward."""
+        names = {i: agent_args.agent_name for i, agent_args in enumerate(self.agent_args)}
+        return leaderboard(self.records, names)
+
+    def budget(self) -> dict:
+        """Episodes and cost spent, compared with evaluating all configurations fully."""
+        return budget_report(self.records, len(self.agent_args), len(self.episodes))
+
+    def report(self) -> str:
+        budget = self.budget()
+        lines = [
+            f"Successive halving: {len(self.agent_args)} configurations, eta={self.eta}, "
+            f"episodes per rung: {self.rung_sizes}.",
+            f"Ran {budget['episodes_run']} / {budget['episodes_full']} episodes "
+            f"({100 * budget['saved_fraction']:.0f}% saved).",
+        ]
+        if budget["cost_run"] > 0:
+            lines.append(
+                f"Cost: ${budget['cost_run']:.2f} instead of about ${budget['cost_full']:.2f}."
+            )
+        lines.append(str(self.leaderboard()))
+        return "\n".join(lines)
+
+
+def interleave_episodes(env_args_list: list, seed: int = 0) -> list:
+    """Order episodes to cycle over all tasks before repeating a task with another seed.
+
+    Tasks are shuffled with the given seed, and the seeds of each task keep their original
+    order. A prefix of the result therefore covers as many tasks as possible.
+    """
+    by_task = {}
+    for env_args in env_args_list:
+        by_task.setdefault(env_args.task_name, []).append(env_args)
+    task_names = list(by_task)
+    random.Random(seed).shuffle(task_names)
+
+    episodes = []
+    for i in range(max((len(seeds) for seeds in by_task.values()), default=0)):
+        for task_name in task_names:
+            if i < len(by_task[task_name]):
+                episodes.append(by_task[task_name][i])
+    return episodes
+
+
+def rung_sizes(n_episodes: int, n_rungs: int, eta: int, min_episodes: int = 1) -> list[int]:
+    """Number of episodes per configuration in each rung, growing by eta up to n_episodes.
+
+    Rungs that would not add episodes are dropped.
+    """
+    sizes = []
+    for rung in range(n_rungs):
+        size = math.ceil(n_episodes / eta ** (n_rungs - 1 - rung))
+        size = min(n_episodes, max(min_episodes, size))
+        if not sizes or size > sizes[-1]:
+            sizes.append(size)
+    return sizes
+
+
+def top_configs(records: pd.DataFrame, config_ids: list[int], n_keep: int) -> list[int]:
+    """The n_keep configurations with the highest mean reward. Ties keep the original order."""
+    scores = _mean_rewards(records)
+    ranked = sorted(config_ids, key=lambda config_id: (-scores.get(config_id, 0.0), config_id))
+    return sorted(ranked[:n_keep])
+
+
+def load_rung_records(study_dir, config_ids: list[int], n_episodes: int, rung: int):
+    """One record per episode of a rung study.
+
+    Experiments of a study are ordered by agent, then by episode, so the configuration of an
+    episode is found from `exp_args.order`. Episodes that errored or did not complete get a
+    reward of 0.
+    """
+    records = []
+    for exp_result in yield_all_exp_results(study_dir, progress_fn=None):
+        exp_args = exp_result.exp_args
+        try:
+            summary_info = exp_result.summary_info
+        except FileNotFoundError:
+            summary_info = {}
+        status = exp_result.status
+        reward = summary_info.get("cum_reward") if status == "done" else None
+        records.append(
+            dict(
+                config_id=config_ids[exp_args.order // n_episodes],
+                rung=rung,
+                task_name=exp_args.env_args.task_name,
+                task_seed=exp_args.env_args.task_seed,
+                reward=float(reward or 0.0),
+                status=status,
+                cost=float(summary_info.get("stats.cum_cost", 0.0) or 0.0),
+            )
+        )
+    return pd.DataFrame(records, columns=RECORD_COLUMNS)
+
+
+def leaderboard(records: pd.DataFrame, names: dict[int, str] = None) -> pd.DataFrame:
+    """Aggregate episode records per configuration.
+
+    Returns:
+        pd.DataFrame: indexed by config_id with agent_name, rung (last rung reached),
+            n_episodes, mean_reward, std_err, n_errors and cost, best configurations first.
+    """
+    names = names or {}
+    rows = []
+    for config_id, group in records.groupby("config_id"):
+        rewards = group["reward"].to_numpy()
+        rows.append(
+            dict(
+                config_id=config_id,
+                agent_name=names.get(config_id),
+                rung=int(group["rung"].max()),
+                n_episodes=len(group),
+                mean_reward=float(rewards.mean()),
+                std_err=(
+                    float(rewards.std(ddof=1) / np.sqrt(len(rewards)))
+                    if len(rewards) > 1
+                    else np.nan
+                ),
+                n_errors=int((group["status"] != "done").sum()),
+                cost=float(group["cost"].sum()),
+            )
+        )
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    df = df.sort_values(["rung", "mean_reward", "config_id"], ascending=[False, False, True])
+    return df.set_index("config_id")
+
+
+def budget_report(records: pd.DataFrame, n_configs: int, n_episodes: int) -> dict:
+    """Episodes and cost spent by the search, compared with a full evaluation of all configs."""
+    episodes_run = len(records)
+    episodes_full = n_configs * n_episodes
+    cost_run = float(records["cost"].sum()) if episodes_run else 0.0
+    cost_per_episode = cost_run / episodes_run if episodes_run else 0.0
+    return dict(
+        episodes_run=episodes_run,
+        episodes_full=episodes_full,
+        saved_fraction=1 - episodes_run / episodes_full if episodes_full else 0.0,
+        cost_run=cost_run,
+        cost_full=cost_per_episode * episodes_full,
+    )
+
+
+def _mean_rewards(records: pd.DataFrame) -> dict[int, float]:
+    return records.groupby("config_id")["reward"].mean().to_dict()
+
+
+def _sub_benchmark(benchmark: bgym.Benchmark, env_args_list: list, name_suffix: str):
+    """Copy of the benchmark restricted to some episodes. The name keeps the original prefix."""
+    return bgym.Benchmark(
+        name=f"{benchmark.name}_{name_suffix}",
+        high_level_action_set_args=benchmark.high_level_action_set_args,
+        is_multi_tab=benchmark.is_multi_tab,
+        supports_parallel_seeds=benchmark.supports_parallel_seeds,
+        backends=benchmark.backends,
+        env_args_list=copy.deepcopy(env_args_list),
+        task_metadata=benchmark.task_metadata,
+    )
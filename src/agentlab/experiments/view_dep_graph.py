@@ -8,6 +8,8 @@ import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
 
+from agentlab.experiments.graph_analysis import successor_index
+
 
 def clean_dict(dependency_dict: dict[str, list[str]]) -> dict[str, list[str]]:
     new_dep = {}
@@ -158,6 +160,7 @@ def compress_sequential_chains(dep_dict: dict[str, list[str]]) -> dict[str, list
     """
     # Convert to integers for easier processing
     int_dict = {int(k): [int(x) for x in v] for k, v in dep_dict.items()}
+    n_successors = {node: len(succ) for node, succ in successor_index(int_dict).items()}
 
     # Find chains
     chains = []
@@ -187,7 +190,7 @@ def compress_sequential_chains(dep_dict: dict[str, list[str]]) -> dict[str, list
         is_consecutive = node == last_node + 1
         has_single_dep = len(int_dict[node]) == 1
         deps_on_last = has_single_dep and int_dict[node][0] == last_node
-        last_has_single_successor = sum(1 for k, v in int_dict.items() if last_node in v) == 1
+        last_has_single_successor = n_successors[last_node] == 1
 
         if is_consecutive and deps_on_last and last_has_single_successor:
             current_chain.append(node)
@@ -204,7 +207,7 @@ def compress_sequential_chains(dep_dict: dict[str, list[str]]) -> dict[str, list
 
     # Create compressed dictionary
     compressed_dict = {}
-    processed_nodes = set()
+    node_to_chain = {}
 
     # Add compressed chains
     for chain in chains:
@@ -212,29 +215,17 @@ def compress_sequential_chains(dep_dict: dict[str, list[str]]) -> dict[str, list
         # Find dependencies of first node in chain
         deps = int_dict[chain[0]]
         compressed_dict[chain_name] = [str(d) for d in deps]
-        processed_nodes.update(chain)
+        for node in chain:
+            node_to_chain[node] = chain_name
 
     # Add remaining non-chain nodes
     for node in nodes:
-        if node not in processed_nodes:
+        if node not in node_to_chain:
             compressed_dict[str(node)] = [str(d) for d in int_dict[node]]
 
     # Update dependencies to use compressed names
     for k in compressed_dict:
-        deps = compressed_dict[k]
-        new_deps = []
-        for dep in deps:
-            dep_int = int(dep)
-            # Find if this dependency is part of a chain
-            chain_found = False
-            for chain in chains:
-                if dep_int in chain:
-                    new_deps.append(f"{chain[0]}-{chain[-1]}")
-                    chain_found = True
-                    break
-            if not chain_found:
-                new_deps.append(dep)
-        compressed_dict[k] = new_deps
+        compressed_dict[k] = [node_to_chain.get(int(dep), dep) for dep in compressed_dict[k]]
 
     return compressed_dict
 
@@ -308,18 +299,19 @@ def compress_chains(G):
     return G_compressed
 
 
-# benchmark = bgym.DEFAULT_BENCHMARKS["webarena"]()
-benchmark = bgym.DEFAULT_BENCHMARKS["visualwebarena"]()
+if __name__ == "__main__":
+    # benchmark = bgym.DEFAULT_BENCHMARKS["webarena"]()
+    benchmark = bgym.DEFAULT_BENCHMARKS["visualwebarena"]()
 
-dep_graph = benchmark.dependency_graph_over_tasks()
-dep_graph = clean_dict(dep_graph)
+    dep_graph = benchmark.dependency_graph_over_tasks()
+    dep_graph = clean_dict(dep_graph)
 
-dep_graph = compress_sequential_chains(dep_graph)
-graph = dict_to_networkx(dep_graph)
+    dep_graph = compress_sequential_chains(dep_graph)
+    graph = dict_to_networkx(dep_graph)
 
-# graph = compress_chains(graph)
+    # graph = compress_chains(graph)
 
-components = nx.weakly_connected_components(graph)
-components = [graph.subgraph(component).copy() for component in components]
-plot_components_grid(components)
-plt.show()
+    components = nx.weakly_connected_components(graph)
+    components = [graph.subgraph(component).copy() for component in components]
+    plot_components_grid(components)
+    plt.show()
@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 
@@ -11,6 +12,53 @@ class AbstractChatModel(ABC):
         return {}
 
 
+class AsyncChatModel(AbstractChatModel):
+    """Chat model that can also be queried from coroutines, to overlap the latency of queries.
+
+    The default `acall` runs `__call__` in a worker thread. Subclasses with an async client
+    override it. In both cases, the tokens and cost of the query are added to the tracker that
+    was active when `acall` was called.
+    """
+
+    async def acall(self, messages: list[dict], **kwargs) -> dict:
+        from agentlab.llm import tracking
+
+        parent_tracker = tracking.get_tracker()
+
+        def call():
+            with tracking.set_tracker() as tracker:
+                return self(messages, **kwargs), tracker
+
+        answer, tracker = await asyncio.to_thread(call)
+        if parent_tracker is not None:
+            parent_tracker.add_tracker(tracker)
+        return answer
+
+    async def abatch(
+        self, messages_list: list[list[dict]], max_concurrency: int = None, **kwargs
+    ) -> list:
+        """Query the model concurrently for each list of messages.
+
+        Args:
+            messages_list: list[list[dict]]
+                The prompts to send.
+            max_concurrency: int
+                Maximum number of queries in flight, None for no limit.
+            **kwargs:
+                Passed to acall, e.g. n_samples or temperature.
+
+        Returns:
+            list: The answers, in the order of messages_list.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or len(messages_list) or 1)
+
+        async def call(messages):
+            async with semaphore:
+                return await self.acall(messages, **kwargs)
+
+        return await asyncio.gather(*(call(messages) for messages in messages_list))
+
+
 @dataclass
 class BaseModelArgs(ABC):
     """Base class for all model arguments."""
@@ -21,6 +69,8 @@ class BaseModelArgs(ABC):
     max_new_tokens: int = None
     temperature: float = 0.1
     vision_support: bool = False
+    # stream completions and stop them once the answer can be parsed, if the model supports it
+    stream: bool = False
 
     @abstractmethod
     def make_model(self) -> AbstractChatModel:
@@ -31,3 +81,7 @@ class BaseModelArgs(ABC):
 
     def close_server(self):
         pass
+
+    def server_ready(self) -> bool:
+        """Readiness probe, polled after prepare_server until it returns True."""
+        return True
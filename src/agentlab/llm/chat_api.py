@@ -1,19 +1,27 @@
+import asyncio
 import logging
 import os
 import re
 import time
 from dataclasses import dataclass
 from functools import partial
+from types import SimpleNamespace
 from typing import Optional
 
 import openai
+import requests
 from huggingface_hub import InferenceClient
-from openai import AzureOpenAI, OpenAI
+from openai import AsyncAzureOpenAI, AsyncOpenAI, AzureOpenAI, OpenAI
 
+import agentlab.llm.response_cache as response_cache
 import agentlab.llm.tracking as tracking
-from agentlab.llm.base_api import AbstractChatModel, BaseModelArgs
+import agentlab.llm.hedging as hedging
+from agentlab.llm.base_api import AbstractChatModel, AsyncChatModel, BaseModelArgs
+from agentlab.llm.hedging import HedgePolicy
+from agentlab.llm.http_clients import LoopClients, get_client
 from agentlab.llm.huggingface_utils import HFBaseChatModel
-from agentlab.llm.llm_utils import AIMessage, Discussion
+from agentlab.llm.llm_utils import AIMessage, Discussion, IncrementalTagParser, estimate_tokens
+from agentlab.llm.retry_policy import RetryPolicy, RetryState
 
 
 def make_system_message(content: str) -> dict:
@@ -82,11 +90,16 @@ class OpenRouterModelArgs(BaseModelArgs):
     """Serializable object for instantiating a generic chat model with an OpenAI
     model."""
 
+    # duplicate slow queries, see agentlab.llm.hedging
+    hedge_policy: HedgePolicy = None
+
     def make_model(self):
         return OpenRouterChatModel(
             model_name=self.model_name,
             temperature=self.temperature,
             max_tokens=self.max_new_tokens,
+            stream=self.stream,
+            hedge_policy=self.hedge_policy,
         )
 
 
@@ -95,11 +108,16 @@ class OpenAIModelArgs(BaseModelArgs):
     """Serializable object for instantiating a generic chat model with an OpenAI
     model."""
 
+    # duplicate slow queries, see agentlab.llm.hedging
+    hedge_policy: HedgePolicy = None
+
     def make_model(self):
         return OpenAIChatModel(
             model_name=self.model_name,
             temperature=self.temperature,
             max_tokens=self.max_new_tokens,
+            stream=self.stream,
+            hedge_policy=self.hedge_policy,
         )
 
 
@@ -108,6 +126,11 @@ class AzureModelArgs(BaseModelArgs):
     """Serializable object for instantiating a generic chat model with an Azure model."""
 
     deployment_name: str = None
+    # the Azure resource, AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY if None
+    endpoint: str = None
+    api_key_env_var: str = None
+    # duplicate slow queries, see agentlab.llm.hedging
+    hedge_policy: HedgePolicy = None
 
     def make_model(self):
         return AzureChatModel(
@@ -115,6 +138,10 @@ class AzureModelArgs(BaseModelArgs):
             temperature=self.temperature,
             max_tokens=self.max_new_tokens,
             deployment_name=self.deployment_name,
+            endpoint=self.endpoint,
+            api_key_env_var=self.api_key_env_var,
+            stream=self.stream,
+            hedge_policy=self.hedge_policy,
         )
 
 
@@ -124,11 +151,23 @@ class SelfHostedModelArgs(BaseModelArgs):
 
     model_url: str = None
     token: str = None
+    # "huggingface" for the text generation route of TGI, "openai" for the OpenAI-compatible
+    # /v1/chat/completions route of vLLM or TGI
     backend: str = "huggingface"
     n_retry_server: int = 4
 
     def make_model(self):
-        if self.backend == "huggingface":
+        if self.backend == "openai":
+            return SelfHostedChatModel(
+                model_name=self.model_name,
+                model_url=self.model_url or os.environ["AGENTLAB_MODEL_URL"],
+                token=self.token or os.environ.get("AGENTLAB_MODEL_TOKEN"),
+                temperature=self.temperature,
+                max_tokens=self.max_new_tokens,
+                max_retry=self.n_retry_server,
+                stream=self.stream,
+            )
+        elif self.backend == "huggingface":
             # currently only huggingface tgi servers are supported
             if self.model_url is None:
                 self.model_url = os.environ["AGENTLAB_MODEL_URL"]
@@ -146,6 +185,20 @@ class SelfHostedModelArgs(BaseModelArgs):
         else:
             raise ValueError(f"Backend {self.backend} is not supported")
 
+    def server_ready(self) -> bool:
+        """Query the health route of the server, gateways answer 5xx while it is starting."""
+        model_url = self.model_url or os.environ.get("AGENTLAB_MODEL_URL")
+        if model_url is None:
+            return True
+        token = self.token or os.environ.get("AGENTLAB_MODEL_TOKEN")
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        server_url = re.sub(r"/v1/?$", "", model_url.rstrip("/"))
+        try:
+            response = requests.get(f"{server_url}/health", headers=headers, timeout=5)
+        except requests.RequestException:
+            return False
+        return response.status_code not in (502, 503, 504)
+
 
 @dataclass
 class ChatModelArgs(BaseModelArgs):
@@ -180,39 +233,114 @@ class ChatModelArgs(BaseModelArgs):
         pass
 
 
-def _extract_wait_time(error_message, min_retry_wait_time=60):
-    """Extract the wait time from an OpenAI RateLimitError message."""
-    match = re.search(r"try again in (\d+(\.\d+)?)s", error_message)
-    if match:
-        return max(min_retry_wait_time, float(match.group(1)))
-    return min_retry_wait_time
-
-
 class RetryError(Exception):
     pass
 
 
-def handle_error(error, itr, min_retry_wait_time, max_retry):
-    if not isinstance(error, openai.OpenAIError):
-        raise error
-    logging.warning(
-        f"Failed to get a response from the API: \n{error}\n" f"Retrying... ({itr+1}/{max_retry})"
+def _retry_error(state: RetryState, error: Exception) -> RetryError:
+    return RetryError(
+        f"Failed to get a response from the API after {state.attempts} attempts "
+        f"({state.error_types[-1]} error)\n"
+        f"Last error: {error}"
     )
-    wait_time = _extract_wait_time(
-        error.args[0],
-        min_retry_wait_time=min_retry_wait_time,
+
+
+def _log_retry(state: RetryState, error: Exception, wait_time: float):
+    logging.warning(
+        f"Attempt {state.attempts}/{state.policy.max_retry} failed with a "
+        f"{state.error_types[-1]} error, retrying in {wait_time:.1f}s: {error}"
     )
-    logging.info(f"Waiting for {wait_time} seconds")
-    time.sleep(wait_time)
-    error_type = error.args[0]
-    return error_type
 
 
 class OpenRouterError(openai.OpenAIError):
     pass
 
 
-class ChatModel(AbstractChatModel):
+def _get_cached_tokens(usage) -> int:
+    """Input tokens read from the prompt cache of the provider, included in prompt_tokens."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
+
+
+def _make_answer(contents: list[str], n_samples: int):
+    if n_samples == 1:
+        return AIMessage(contents[0])
+    else:
+        return [AIMessage(content) for content in contents]
+
+
+def _messages_text(messages) -> str:
+    """Text of the messages, images are ignored."""
+    texts = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            texts.append(content)
+        else:
+            texts.extend(part["text"] for part in content if part["type"] == "text")
+    return "\n".join(texts)
+
+
+class _StreamedCompletion:
+    """Accumulates the chunks of a streamed completion until the required tags are closed."""
+
+    def __init__(self, stop_tags: list[str] = None):
+        self.parser = IncrementalTagParser(stop_tags) if stop_tags else None
+        self.start = time.perf_counter()
+        self.chunks = []
+        self.usage = None
+        self.time_to_first_token = None
+        self.time_to_action = None
+        self.stopped_early = False
+
+    def add(self, chunk) -> bool:
+        """Add a chunk, returns True when the answer can be parsed and the stream stopped."""
+        if getattr(chunk, "usage", None) is not None:
+            self.usage = chunk.usage
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            return False
+        content = chunk.choices[0].delta.content
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self.start
+        self.chunks.append(content)
+        if self.parser is not None and self.parser.feed(content):
+            self.time_to_action = time.perf_counter() - self.start
+            self.stopped_early = True
+            return True
+        return False
+
+    def to_completion(self, messages, model_name: str):
+        """Completion object with the content and usage of the stream.
+
+        A stream that was stopped doesn't report its usage: the output tokens are estimated by
+        the number of chunks (one token each for OpenAI) and the input tokens with a local
+        tokenizer, see `estimate_tokens`.
+        """
+        if self.time_to_action is None:
+            self.time_to_action = time.perf_counter() - self.start
+        usage = self.usage
+        if usage is None:
+            usage = SimpleNamespace(
+                prompt_tokens=estimate_tokens(_messages_text(messages), model=model_name),
+                completion_tokens=len(self.chunks),
+                prompt_tokens_details=None,
+            )
+        message = SimpleNamespace(content="".join(self.chunks))
+        return SimpleNamespace(usage=usage, choices=[SimpleNamespace(message=message)])
+
+    def stats(self) -> dict:
+        return {
+            "time_to_first_token": self.time_to_first_token,
+            "time_to_action": self.time_to_action,
+            "stream_stopped_early": int(self.stopped_early),
+        }
+
+
+# async counterparts of the clients, used by ChatModel.acall
+ASYNC_CLIENT_CLASSES = {OpenAI: AsyncOpenAI, AzureOpenAI: AsyncAzureOpenAI}
+
+
+class ChatModel(AsyncChatModel):
     def __init__(
         self,
         model_name,
@@ -225,6 +353,11 @@ class ChatModel(AbstractChatModel):
         client_class=OpenAI,
         client_args=None,
         pricing_func=None,
+        async_client_class=None,
+        shared_client=True,
+        stream=False,
+        retry_policy: RetryPolicy = None,
+        hedge_policy: HedgePolicy = None,
     ):
         assert max_retry > 0, "max_retry should be greater than 0"
 
@@ -233,6 +366,20 @@ class ChatModel(AbstractChatModel):
         self.max_tokens = max_tokens
         self.max_retry = max_retry
         self.min_retry_wait_time = min_retry_wait_time
+        # waits depend on the error: the API hint for rate limits, a short backoff for 5xx errors
+        self.retry_policy = retry_policy or RetryPolicy(
+            max_retry=max_retry,
+            base_delay=min(1.0, min_retry_wait_time),
+            rate_limit_delay=min_retry_wait_time,
+            max_delay=max(60.0, min_retry_wait_time),
+        )
+        self.retry_wait = 0.0
+        # duplicate queries slower than a quantile of the latencies of the model
+        self.hedge_policy = hedge_policy
+        self._alternate_model = None
+        # single-sample queries are streamed, and stopped once the stop_tags are closed
+        self.stream = stream
+        self.stream_stats = {}
 
         # Get the API key from the environment variable if not provided
         if api_key_env_var:
@@ -245,77 +392,308 @@ class ChatModel(AbstractChatModel):
             try:
                 self.input_cost = float(pricings[model_name]["prompt"])
                 self.output_cost = float(pricings[model_name]["completion"])
+                # "input_cache_read" for OpenRouter, same as uncached tokens if unknown
+                self.cached_input_cost = float(
+                    pricings[model_name].get(
+                        "cached_prompt",
+                        pricings[model_name].get("input_cache_read", self.input_cost),
+                    )
+                )
             except KeyError:
                 logging.warning(
                     f"Model {model_name} not found in the pricing information, prices are set to 0. Maybe try upgrading langchain_community."
                 )
                 self.input_cost = 0.0
                 self.output_cost = 0.0
+                self.cached_input_cost = 0.0
         else:
             self.input_cost = 0.0
             self.output_cost = 0.0
+            self.cached_input_cost = 0.0
+
+        client_args = dict(client_args or {})
+        # retries are handled by the retry policy, not doubled by the client's own retries
+        client_args.setdefault("max_retries", 0)
+        self.client_args = client_args
+        # shared clients come from the registry of the process, and reuse its open connections
+        self.shared_client = shared_client
+        if shared_client:
+            self.client = get_client(client_class, api_key=api_key, **client_args)
+        else:
+            self.client = client_class(
+                api_key=api_key,
+                **client_args,
+            )
 
-        client_args = client_args or {}
-        self.client = client_class(
-            api_key=api_key,
-            **client_args,
-        )
+        # async clients are bound to the event loop they are used in, one is created per loop
+        self.async_client_class = async_client_class or ASYNC_CLIENT_CLASSES.get(client_class)
+        self._async_clients = LoopClients()
 
-    def __call__(self, messages: list[dict], n_samples: int = 1, temperature: float = None) -> dict:
+    def __call__(
+        self,
+        messages: list[dict],
+        n_samples: int = 1,
+        temperature: float = None,
+        stop_tags: list[str] = None,
+    ) -> dict:
+        """Query the model, retrying on API errors.
+
+        Args:
+            messages: The messages of the prompt, in OpenAI format.
+            n_samples: Number of answers to sample.
+            temperature: Overrides the temperature of the model.
+            stop_tags: With stream=True, the generation is stopped as soon as all these tags are
+                closed in the answer, e.g. ["think", "action"].
+        """
         # Initialize retry tracking attributes
         self.retries = 0
         self.success = False
         self.error_types = []
+        self.retry_wait = 0.0
+        self.stream_stats = {}
+
+        if self.hedge_policy is not None and self.async_client_class is not None:
+            # racing two queries needs the async client, run in an event loop of the process
+            return hedging.run_sync(
+                self._acall(messages, n_samples, temperature, stop_tags, tracking.get_tracker())
+            )
+
+        tracker = tracking.get_tracker()
+        temperature = temperature if temperature is not None else self.temperature
+        cache_key, cached = self._lookup_cache(messages, n_samples, temperature, stop_tags, tracker)
+        if cached is not None:
+            self.success = True
+            return _make_answer(cached, n_samples)
 
+        state = RetryState(self.retry_policy)
+        self.error_types = state.error_types
         completion = None
-        e = None
-        for itr in range(self.max_retry):
+        while completion is None:
             self.retries += 1
-            temperature = temperature if temperature is not None else self.temperature
+            start = time.monotonic()
             try:
-                completion = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages,
-                    n=n_samples,
-                    temperature=temperature,
-                    max_tokens=self.max_tokens,
-                )
-
-                if completion.usage is None:
-                    raise OpenRouterError(
-                        "The completion object does not contain usage information. This is likely a bug in the OpenRouter API."
+                if self.stream and n_samples == 1:
+                    completion = self._create_streamed(messages, temperature, stop_tags)
+                else:
+                    completion = self.client.chat.completions.create(
+                        **self._completion_args(messages, n_samples, temperature)
                     )
+                self._check_completion(completion)
+                hedging.record_latency(self.model_name, time.monotonic() - start)
+            except openai.OpenAIError as e:
+                completion = None
+                wait_time = state.next_wait(e)
+                self.retry_wait = state.total_wait
+                if wait_time is None:
+                    raise _retry_error(state, e) from e
+                _log_retry(state, e, wait_time)
+                time.sleep(wait_time)
+        self.success = True
+
+        return self._process_completion(completion, n_samples, tracker, cache_key)
+
+    async def acall(
+        self,
+        messages: list[dict],
+        n_samples: int = 1,
+        temperature: float = None,
+        stop_tags: list[str] = None,
+    ) -> dict:
+        """Coroutine version of __call__, with the same retries, pricing and tracking."""
+        if self.async_client_class is None:
+            return await super().acall(
+                messages, n_samples=n_samples, temperature=temperature, stop_tags=stop_tags
+            )
+
+        return await self._acall(
+            messages, n_samples, temperature, stop_tags, tracking.get_tracker()
+        )
+
+    async def _acall(self, messages, n_samples, temperature, stop_tags, tracker):
+        # concurrent calls share the model, the retry attributes are set once the call is done
+        temperature = temperature if temperature is not None else self.temperature
+        cache_key, cached = self._lookup_cache(messages, n_samples, temperature, stop_tags, tracker)
+        if cached is not None:
+            self.retries, self.success, self.error_types, self.retry_wait = 0, True, [], 0.0
+            return _make_answer(cached, n_samples)
+
+        if self.hedge_policy is None:
+            completion = await self._acomplete(messages, n_samples, temperature, stop_tags)
+            return self._process_completion(completion, n_samples, tracker, cache_key)
+        return await self._ahedged_call(
+            messages, n_samples, temperature, stop_tags, tracker, cache_key
+        )
+
+    def _lookup_cache(self, messages, n_samples, temperature, stop_tags, tracker):
+        # a stream stopped at stop_tags has a truncated answer, it is cached under its own key
+        stop_tags = stop_tags if self.stream and n_samples == 1 else None
+        return response_cache.lookup(
+            self.model_name,
+            messages,
+            temperature,
+            n_samples,
+            self.max_tokens,
+            tracker,
+            stop_tags=stop_tags,
+        )
+
+    async def _ahedged_call(self, messages, n_samples, temperature, stop_tags, tracker, cache_key):
+        policy = self.hedge_policy
+        alternate = self._get_alternate_model()
+        state = hedging.get_hedge_state(self.model_name)
+        delay = state.histogram.quantile(policy.quantile, policy.min_samples)
+
+        def make_hedge():
+            if not state.budget_allows(policy.max_extra_cost_ratio):
+                return None
+            return alternate._acomplete(messages, n_samples, temperature, stop_tags)
 
-                self.success = True
-                break
+        start = time.monotonic()
+        completion, hedged, hedge_won = await hedging.first_of(
+            self._acomplete(messages, n_samples, temperature, stop_tags), delay, make_hedge
+        )
+        if hedge_won:
+            # the cancelled query took at least this long, leaving it out would lower the quantile
+            hedging.record_latency(self.model_name, time.monotonic() - start)
+        winner, loser = (alternate, self) if hedge_won else (self, alternate)
+
+        query_tracker = tracking.LLMTracker()
+        answer = winner._process_completion(completion, n_samples, query_tracker, cache_key)
+        if hedged:
+            # the prompt of the cancelled query is billed, its output tokens are unknown
+            hedge_cost = completion.usage.prompt_tokens * loser.input_cost
+            query_tracker(completion.usage.prompt_tokens, 0, hedge_cost)
+            query_tracker.record_hedge(1, hedge_cost)
+        state.tracker.add_tracker(query_tracker)
+        if tracker is not None:
+            tracker.add_tracker(query_tracker)
+        return answer
+
+    def _get_alternate_model(self):
+        """The model receiving the duplicates, made from the args of the policy on first use."""
+        if self.hedge_policy.alternate is None:
+            return self
+        if self._alternate_model is None:
+            self._alternate_model = self.hedge_policy.alternate.make_model()
+        return self._alternate_model
+
+    async def _acomplete(self, messages, n_samples, temperature, stop_tags):
+        state = RetryState(self.retry_policy)
+        completion = None
+        while completion is None:
+            start = time.monotonic()
+            try:
+                if self.stream and n_samples == 1:
+                    completion = await self._acreate_streamed(messages, temperature, stop_tags)
+                else:
+                    completion = await self._get_async_client().chat.completions.create(
+                        **self._completion_args(messages, n_samples, temperature)
+                    )
+                self._check_completion(completion)
+                hedging.record_latency(self.model_name, time.monotonic() - start)
             except openai.OpenAIError as e:
-                error_type = handle_error(e, itr, self.min_retry_wait_time, self.max_retry)
-                self.error_types.append(error_type)
+                completion = None
+                wait_time = state.next_wait(e)
+                if wait_time is None:
+                    self._set_retry_stats(state, success=False)
+                    raise _retry_error(state, e) from e
+                _log_retry(state, e, wait_time)
+                await asyncio.sleep(wait_time)
+
+        self._set_retry_stats(state, success=True)
+        return completion
+
+    def _set_retry_stats(self, state: RetryState, success: bool):
+        self.retries = state.attempts + int(success)
+        self.success = success
+        self.error_types = state.error_types
+        self.retry_wait = state.total_wait
+
+    def _get_async_client(self):
+        if self.shared_client:
+            return get_client(self.async_client_class, api_key=self.api_key, **self.client_args)
+        clients = self._async_clients.clients(asyncio.get_running_loop())
+        if "client" not in clients:
+            clients["client"] = self.async_client_class(api_key=self.api_key, **self.client_args)
+        return clients["client"]
+
+    def _create_streamed(self, messages, temperature, stop_tags):
+        streamed = _StreamedCompletion(stop_tags)
+        stream = self.client.chat.completions.create(
+            **self._completion_args(messages, 1, temperature), **self._stream_args()
+        )
+        try:
+            for chunk in stream:
+                if streamed.add(chunk):
+                    break
+        finally:
+            # closing the connection stops the generation on the server
+            stream.close()
+        self.stream_stats = streamed.stats()
+        return streamed.to_completion(messages, self.model_name)
+
+    async def _acreate_streamed(self, messages, temperature, stop_tags):
+        streamed = _StreamedCompletion(stop_tags)
+        stream = await self._get_async_client().chat.completions.create(
+            **self._completion_args(messages, 1, temperature), **self._stream_args()
+        )
+        try:
+            async for chunk in stream:
+                if streamed.add(chunk):
+                    break
+        finally:
+            await stream.close()
+        self.stream_stats = streamed.stats()
+        return streamed.to_completion(messages, self.model_name)
+
+    def _stream_args(self) -> dict:
+        args = {"stream": True}
+        if "azure_endpoint" not in self.client_args:
+            # usage of the stream, in its last chunk (not supported by older Azure API versions)
+            args["stream_options"] = {"include_usage": True}
+        return args
+
+    def _completion_args(self, messages, n_samples, temperature) -> dict:
+        return dict(
+            model=self.model_name,
+            messages=messages,
+            n=n_samples,
+            temperature=temperature if temperature is not None else self.temperature,
+            max_tokens=self.max_tokens,
+        )
 
-        if not completion:
-            raise RetryError(
-                f"Failed to get a response from the API after {self.max_retry} retries\n"
-                f"Last error: {error_type}"
+    @staticmethod
+    def _check_completion(completion):
+        if completion.usage is None:
+            raise OpenRouterError(
+                "The completion object does not contain usage information. This is likely a bug in the OpenRouter API."
             )
 
+    def _process_completion(
+        self, completion, n_samples, tracker: tracking.LLMTracker = None, cache_key: str = None
+    ):
         input_tokens = completion.usage.prompt_tokens
         output_tokens = completion.usage.completion_tokens
-        cost = input_tokens * self.input_cost + output_tokens * self.output_cost
+        cached_tokens = _get_cached_tokens(completion.usage)
+        cost = (
+            (input_tokens - cached_tokens) * self.input_cost
+            + cached_tokens * self.cached_input_cost
+            + output_tokens * self.output_cost
+        )
 
-        if hasattr(tracking.TRACKER, "instance") and isinstance(
-            tracking.TRACKER.instance, tracking.LLMTracker
-        ):
-            tracking.TRACKER.instance(input_tokens, output_tokens, cost)
+        if tracker is not None:
+            tracker(input_tokens, output_tokens, cost, cached_tokens)
 
-        if n_samples == 1:
-            return AIMessage(completion.choices[0].message.content)
-        else:
-            return [AIMessage(c.message.content) for c in completion.choices]
+        contents = [c.message.content for c in completion.choices]
+        response_cache.store(cache_key, contents)
+        return _make_answer(contents, n_samples)
 
     def get_stats(self):
         return {
             "n_retry_llm": self.retries,
+            "retry_wait_llm": self.retry_wait,
             # "busted_retry_llm": int(not self.success), # not logged if it occurs anyways
+            **self.stream_stats,
         }
 
 
@@ -328,6 +706,8 @@ class OpenAIChatModel(ChatModel):
         max_tokens=100,
         max_retry=4,
         min_retry_wait_time=60,
+        stream=False,
+        hedge_policy: HedgePolicy = None,
     ):
         super().__init__(
             model_name=model_name,
@@ -339,6 +719,8 @@ class OpenAIChatModel(ChatModel):
             api_key_env_var="OPENAI_API_KEY",
             client_class=OpenAI,
             pricing_func=tracking.get_pricing_openai,
+            stream=stream,
+            hedge_policy=hedge_policy,
         )
 
 
@@ -351,6 +733,8 @@ class OpenRouterChatModel(ChatModel):
         max_tokens=100,
         max_retry=4,
         min_retry_wait_time=60,
+        stream=False,
+        hedge_policy: HedgePolicy = None,
     ):
         client_args = {
             "base_url": "https://openrouter.ai/api/v1",
@@ -366,6 +750,45 @@ class OpenRouterChatModel(ChatModel):
             client_class=OpenAI,
             client_args=client_args,
             pricing_func=tracking.get_pricing_openrouter,
+            stream=stream,
+            hedge_policy=hedge_policy,
+        )
+
+
+class SelfHostedChatModel(ChatModel):
+    """Model served by vLLM or TGI, queried through their OpenAI-compatible API.
+
+    The server applies the chat template of the model and reports the usage of the queries. The
+    client comes from the registry of the process, its connections are reused across episodes.
+    """
+
+    def __init__(
+        self,
+        model_name,
+        model_url,
+        token=None,
+        temperature=0.5,
+        max_tokens=100,
+        max_retry=4,
+        min_retry_wait_time=5,
+        stream=False,
+        hedge_policy: HedgePolicy = None,
+    ):
+        base_url = model_url.rstrip("/")
+        if not base_url.endswith("/v1"):
+            base_url += "/v1"
+        super().__init__(
+            model_name=model_name,
+            # servers started without an API key accept any
+            api_key=token or "EMPTY",
+            temperature=temperature,
+            max_tokens=max_tokens,
+            max_retry=max_retry,
+            min_retry_wait_time=min_retry_wait_time,
+            client_class=OpenAI,
+            client_args={"base_url": base_url},
+            stream=stream,
+            hedge_policy=hedge_policy,
         )
 
 
@@ -379,10 +802,14 @@ class AzureChatModel(ChatModel):
         max_tokens=100,
         max_retry=4,
         min_retry_wait_time=60,
+        stream=False,
+        hedge_policy: HedgePolicy = None,
+        endpoint=None,
+        api_key_env_var=None,
     ):
-        api_key = api_key or os.getenv("AZURE_OPENAI_API_KEY")
-        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        assert endpoint, "AZURE_OPENAI_ENDPOINT has to be defined in the environment"
+        api_key = api_key or os.getenv(api_key_env_var or "AZURE_OPENAI_API_KEY")
+        endpoint = endpoint or os.getenv("AZURE_OPENAI_ENDPOINT")
+        assert endpoint, "endpoint or AZURE_OPENAI_ENDPOINT has to be defined"
 
         client_args = {
             "azure_deployment": deployment_name,
@@ -399,6 +826,8 @@ class AzureChatModel(ChatModel):
             client_class=AzureOpenAI,
             client_args=client_args,
             pricing_func=tracking.get_pricing_openai,
+            stream=stream,
+            hedge_policy=hedge_policy,
         )
 
 
@@ -412,11 +841,13 @@ class HuggingFaceURLChatModel(HFBaseChatModel):
         temperature: Optional[int] = 1e-1,
         max_new_tokens: Optional[int] = 512,
         n_retry_server: Optional[int] = 4,
+        max_parallel_samples: int = 8,
     ):
-        super().__init__(model_name, base_model_name, n_retry_server)
+        super().__init__(model_name, base_model_name, n_retry_server, max_parallel_samples)
         if temperature < 1e-3:
             logging.warning("Models might behave weirdly when temperature is too low.")
         self.temperature = temperature
+        self.max_new_tokens = max_new_tokens
 
         if token is None:
             token = os.environ["TGI_TOKEN"]
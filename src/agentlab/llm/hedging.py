@@ -0,0 +1,173 @@
+"""Hedged queries, to cut the tail latency of LLM APIs.
+
+The latency of API queries has a long tail: a few queries take several times the median, and an
+episode of 30 steps waits on each of them. With a `HedgePolicy`, `ChatModel` keeps a rolling
+histogram of the latencies of each model. When no response has arrived after a quantile of this
+histogram (e.g. the p90), a duplicate query is sent to the same or an alternate deployment. The
+first answer is used and the other query is cancelled.
+
+Duplicates cost money: the prompt of the losing query is billed, and its cost is recorded as
+`hedge_cost` by the trackers. Hedging stops when the extra spend of a model exceeds
+`max_extra_cost_ratio` of its total spend in the process.
+
+Usage:
+    model = OpenAIChatModel("gpt-4o-mini", hedge_policy=HedgePolicy(quantile=0.9))
+"""
+
+import asyncio
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+import numpy as np
+
+from agentlab.llm.base_api import BaseModelArgs
+from agentlab.llm.tracking import LLMTracker
+
+
+@dataclass
+class HedgePolicy:
+    """When to send a duplicate query.
+
+    Args:
+        quantile: float
+            Quantile of the latencies of the model after which the duplicate is sent.
+        min_samples: int
+            Minimum number of latencies observed before hedging.
+        max_extra_cost_ratio: float
+            Maximum extra spend of the duplicates, as a fraction of the total spend of the model.
+        alternate: BaseModelArgs
+            Args of the deployment receiving the duplicates, the same model if None. Its model is
+            made on the first duplicate, and must support `acall` with an async client.
+    """
+
+    quantile: float = 0.9
+    min_samples: int = 20
+    max_extra_cost_ratio: float = 0.1
+    alternate: BaseModelArgs = None
+
+
+class LatencyHistogram:
+    """The last latencies of a model, in seconds."""
+
+    def __init__(self, window: int = 500):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def quantile(self, q: float, min_samples: int = 1) -> float | None:
+        """Quantile q of the latencies, None if fewer than min_samples were observed."""
+        with self._lock:
+            latencies = list(self._latencies)
+        if len(latencies) < max(min_samples, 1):
+            return None
+        return float(np.quantile(latencies, q))
+
+    def __len__(self):
+        return len(self._latencies)
+
+
+class HedgeState:
+    """Latencies and spend of a model, shared by its chat models in the process."""
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.tracker = LLMTracker()
+
+    def budget_allows(self, max_extra_cost_ratio: float) -> bool:
+        return self.tracker.hedge_cost <= max_extra_cost_ratio * self.tracker.cost
+
+
+_STATES: dict[str, HedgeState] = {}
+_STATES_LOCK = threading.Lock()
+
+
+def get_hedge_state(model_name: str) -> HedgeState:
+    with _STATES_LOCK:
+        if model_name not in _STATES:
+            _STATES[model_name] = HedgeState()
+        return _STATES[model_name]
+
+
+def record_latency(model_name: str, latency: float):
+    get_hedge_state(model_name).histogram.add(latency)
+
+
+async def first_of(
+    primary: Awaitable,
+    delay: float | None,
+    make_hedge: Callable[[], Awaitable | None],
+) -> tuple[Any, bool, bool]:
+    """Await primary, racing it with a duplicate if it is not done after delay.
+
+    Args:
+        primary: Awaitable
+            The query.
+        delay: float
+            Time in seconds after which the duplicate is sent, None to never send it.
+        make_hedge: Callable
+            Returns the duplicate query, or None to keep waiting on primary only.
+
+    Returns:
+        tuple: The first successful result, whether a duplicate was sent, and whether the
+            duplicate won. If both fail, the error of the first one to fail is raised.
+    """
+    primary = asyncio.ensure_future(primary)
+    tasks = [primary]
+    try:
+        if delay is not None:
+            await asyncio.wait(tasks, timeout=delay)
+        hedge = make_hedge() if delay is not None and not primary.done() else None
+        if hedge is None:
+            return await primary, False, False
+
+        tasks.append(asyncio.ensure_future(hedge))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=tasks.index):
+                if task.exception() is None:
+                    return task.result(), True, task is not primary
+                error = error or task.exception()
+        raise error
+    finally:
+        # the loser is cancelled, which closes its connection
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class _LoopThread:
+    """Event loop running in a daemon thread, for hedged queries of synchronous callers.
+
+    The loop lives as long as the process, so that its async clients keep their connections.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+
+    def run(self, coroutine):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                threading.Thread(
+                    target=self._loop.run_forever, name="agentlab-hedging", daemon=True
+                ).start()
+            loop = self._loop
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+_LOOP_THREAD = _LoopThread()
+
+
+def run_sync(coroutine):
+    """Run coroutine in the hedging event loop, blocking until it is done."""
+    return _LOOP_THREAD.run(coroutine)
@@ -0,0 +1,198 @@
+"""Process-wide registry of API clients, shared by all the chat models of a worker.
+
+Agents build a new chat model at each episode, and each `OpenAI` client has its own connection
+pool: every episode started with new TCP/TLS handshakes, and the pools of previous episodes were
+left open. `ClientRegistry` returns one client per (provider, base_url, api key hash), with a
+connection pool whose keep-alive outlives the time between two steps of an agent (httpx closes
+idle connections after 5s by default).
+
+Async clients are bound to their event loop, they are shared within an event loop only, and
+dropped once their loop is closed.
+
+Usage:
+    client = get_client(OpenAI, api_key=api_key, base_url="https://openrouter.ai/api/v1")
+    get_client_stats()  # {"clients": 1, "client_reuses": 0, "requests": 0, ...}
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+
+import httpx
+import openai
+
+
+def _api_key_hash(api_key: str | None) -> str | None:
+    if api_key is None:
+        return None
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+class LoopClients:
+    """Async clients of each event loop.
+
+    The open connections of an async client hold a reference to its loop, so a loop would never
+    expire as the key of a weak dictionary. Loops are kept by id instead, and the clients of
+    closed loops are dropped when clients are requested for another loop.
+    """
+
+    def __init__(self):
+        self._loops = {}
+
+    def clients(self, loop: asyncio.AbstractEventLoop) -> dict:
+        """The clients of loop, by key."""
+        for loop_id, (other_loop, _) in list(self._loops.items()):
+            if other_loop.is_closed():
+                # their connections are closed when the clients are collected
+                del self._loops[loop_id]
+        return self._loops.setdefault(id(loop), (loop, {}))[1]
+
+    def close(self):
+        """Close the clients whose loop is still open, and drop all the clients."""
+        for loop, clients in self._loops.values():
+            if loop.is_closed():
+                continue
+            for client in clients.values():
+                if loop.is_running():
+                    asyncio.run_coroutine_threadsafe(client.close(), loop)
+                else:
+                    loop.run_until_complete(client.close())
+        self._loops = {}
+
+    def __len__(self):
+        return len(self._loops)
+
+
+class ClientRegistry:
+    """Shared API clients with tuned keep-alive connection pools.
+
+    Args:
+        max_connections: int
+            Maximum number of connections of each client.
+        max_keepalive_connections: int
+            Maximum number of idle connections kept open by each client.
+        keepalive_expiry: float
+            Time in seconds after which idle connections are closed.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 120,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._clients = {}
+        self._async_clients = LoopClients()
+        self._stats = {"clients": 0, "client_reuses": 0, "requests": 0, "new_connections": 0}
+
+    def get(self, client_class: type, api_key: str = None, **client_args):
+        """Client of client_class for these arguments, created on first use.
+
+        Args:
+            client_class: type
+                e.g. OpenAI, AzureOpenAI or their async counterparts.
+            api_key: str
+                The API key, only its hash is kept in the key of the registry.
+            **client_args:
+                Other arguments of client_class, e.g. base_url. If http_client is given, the
+                client uses it instead of a pool of the registry.
+        """
+        is_async = issubclass(client_class, (openai.AsyncOpenAI, openai.AsyncAzureOpenAI))
+        key = (
+            client_class,
+            str(client_args.get("base_url") or client_args.get("azure_endpoint")),
+            _api_key_hash(api_key),
+            tuple(sorted((name, repr(value)) for name, value in client_args.items())),
+        )
+        with self._lock:
+            if os.getpid() != self._pid:
+                # connections can't be shared with the parent of a forked process
+                self._reset()
+            if is_async:
+                clients = self._async_clients.clients(asyncio.get_running_loop())
+            else:
+                clients = self._clients
+            client = clients.get(key)
+            if client is not None:
+                self._stats["client_reuses"] += 1
+                return client
+
+            if "http_client" not in client_args:
+                client_args["http_client"] = self._make_http_client(is_async)
+            client = client_class(api_key=api_key, **client_args)
+            clients[key] = client
+            self._stats["clients"] += 1
+            return client
+
+    def _make_http_client(self, is_async: bool):
+        def trace(event_name, info):
+            if event_name.endswith(("connect_tcp.complete", "connect_unix_socket.complete")):
+                self._count("new_connections")
+
+        if is_async:
+
+            async def atrace(event_name, info):
+                trace(event_name, info)
+
+            async def on_async_request(request):
+                self._count("requests")
+                request.extensions["trace"] = atrace
+
+            return openai.DefaultAsyncHttpxClient(
+                limits=self.limits, event_hooks={"request": [on_async_request]}
+            )
+
+        def on_request(request):
+            self._count("requests")
+            request.extensions["trace"] = trace
+
+        return openai.DefaultHttpxClient(limits=self.limits, event_hooks={"request": [on_request]})
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> dict:
+        """Counters of the registry.
+
+        Returns:
+            dict: clients created, clients reused, HTTP requests sent, connections opened, and
+                requests that reused an open connection.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["reused_connections"] = stats["requests"] - stats["new_connections"]
+        return stats
+
+    def close(self):
+        """Close the clients of this process and reset the counters."""
+        with self._lock:
+            clients = list(self._clients.values())
+            async_clients = self._async_clients
+            self._reset()
+        for client in clients:
+            client.close()
+        async_clients.close()
+
+
+REGISTRY = ClientRegistry()
+
+
+def get_client(client_class: type, api_key: str = None, **client_args):
+    """Shared client from the process-wide registry, see `ClientRegistry.get`."""
+    return REGISTRY.get(client_class, api_key=api_key, **client_args)
+
+
+def get_client_stats() -> dict:
+    return REGISTRY.stats()
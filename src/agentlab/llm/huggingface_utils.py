@@ -1,16 +1,18 @@
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, List, Optional, Union
 
 from pydantic import Field
 from transformers import AutoTokenizer, GPT2TokenizerFast
 
-from agentlab.llm.base_api import AbstractChatModel
+from agentlab.llm import response_cache, tracking
+from agentlab.llm.base_api import AsyncChatModel
 from agentlab.llm.llm_utils import AIMessage, Discussion
 from agentlab.llm.prompt_templates import PromptTemplate, get_prompt_template
 
 
-class HFBaseChatModel(AbstractChatModel):
+class HFBaseChatModel(AsyncChatModel):
     """
     Custom LLM Chatbot that can interface with HuggingFace models with support for multiple samples.
 
@@ -24,6 +26,7 @@ class HFBaseChatModel(AbstractChatModel):
         prompt_template (Any): Template for the prompt to be used for the model's input sequence.
         tokenizer (Any): The tokenizer to use for the model.
         n_retry_server (int): Number of times to retry on server failure.
+        max_parallel_samples (int): Maximum number of samples generated concurrently.
     """
 
     llm: Any = Field(description="The HuggingFaceHub model instance")
@@ -39,10 +42,16 @@ class HFBaseChatModel(AbstractChatModel):
         default=4,
         description="The number of times to retry the server if it fails to respond",
     )
+    max_parallel_samples: int = Field(
+        default=8,
+        description="The maximum number of samples generated concurrently",
+    )
 
-    def __init__(self, model_name, base_model_name, n_retry_server):
+    def __init__(self, model_name, base_model_name, n_retry_server, max_parallel_samples=8):
         super().__init__()
+        self.model_name = model_name
         self.n_retry_server = n_retry_server
+        self.max_parallel_samples = max_parallel_samples
 
         if base_model_name is None:
             self.tokenizer = AutoTokenizer.from_pretrained(model_name)
@@ -76,6 +85,19 @@ class HFBaseChatModel(AbstractChatModel):
         Raises:
             Exception: If the server fails to respond after n_retry_server attempts or if the chat template fails.
         """
+        temperature = temperature if temperature is not None else self.temperature
+        cache_key, cached = response_cache.lookup(
+            self.model_name,
+            messages,
+            temperature,
+            n_samples,
+            getattr(self, "max_new_tokens", None),
+            tracking.get_tracker(),
+        )
+        if cached is not None:
+            responses = [AIMessage(content) for content in cached]
+            return responses[0] if n_samples == 1 else responses
+
         if self.tokenizer:
             try:
                 if isinstance(messages, Discussion):
@@ -94,27 +116,35 @@ class HFBaseChatModel(AbstractChatModel):
         elif self.prompt_template:
             prompt = self.prompt_template.construct_prompt(messages)
 
-        responses = []
-        for _ in range(n_samples):
-            itr = 0
-            while True:
-                try:
-                    temperature = temperature if temperature is not None else self.temperature
-                    response = AIMessage(self.llm(prompt, temperature=temperature))
-                    responses.append(response)
-                    break
-                except Exception as e:
-                    if itr == self.n_retry_server - 1:
-                        raise e
-                    logging.warning(
-                        f"Failed to get a response from the server: \n{e}\n"
-                        f"Retrying... ({itr+1}/{self.n_retry_server})"
-                    )
-                    time.sleep(5)
-                    itr += 1
-
+        if n_samples == 1:
+            responses = [self._generate(prompt, temperature)]
+        else:
+            # TGI batches concurrent requests, the samples take about the time of one
+            n_workers = min(n_samples, self.max_parallel_samples)
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                responses = list(
+                    executor.map(lambda _: self._generate(prompt, temperature), range(n_samples))
+                )
+
+        response_cache.store(cache_key, [response["content"] for response in responses])
         return responses[0] if n_samples == 1 else responses
 
+    def _generate(self, prompt: str, temperature: float) -> AIMessage:
+        """Generate one sample, retrying on server failures."""
+        itr = 0
+        while True:
+            try:
+                return AIMessage(self.llm(prompt, temperature=temperature))
+            except Exception as e:
+                if itr == self.n_retry_server - 1:
+                    raise e
+                logging.warning(
+                    f"Failed to get a response from the server: \n{e}\n"
+                    f"Retrying... ({itr+1}/{self.n_retry_server})"
+                )
+                time.sleep(5)
+                itr += 1
+
     def _llm_type(self):
         return "huggingface"
 
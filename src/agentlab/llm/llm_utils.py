@@ -198,6 +198,23 @@ def count_tokens(text, model="openai/gpt-4"):
     return len(enc.encode(text))
 
 
+@cache
+def get_local_encoding(model_name: str):
+    """tiktoken encoding of an OpenAI model, None for other models. The HF hub is not queried."""
+    try:
+        return tiktoken.encoding_for_model(model_name.split("/")[-1])
+    except Exception:
+        return None
+
+
+def estimate_tokens(text: str, model: str = "gpt-4") -> int:
+    """Token count that never downloads a tokenizer, about 4 characters per token if unknown."""
+    encoding = get_local_encoding(model)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text))
+
+
 def json_parser(message):
     """Parse a json message for the retry function."""
 
@@ -361,6 +378,42 @@ def parse_html_tags(text, keys=(), optional_keys=(), merge_multiple=False):
     return content_dict, valid, retry_message
 
 
+class IncrementalTagParser:
+    """Detects when the tags required in an answer are closed, while the answer is streamed.
+
+    Each chunk is only scanned with the end of the previous text that can hold a partial tag, as
+    in extract_html_tags tags are matched case-sensitively.
+
+    Args:
+        required_tags (list[str]): The tags that have to be opened and closed, e.g. ["action"].
+    """
+
+    def __init__(self, required_tags):
+        # tag -> None until opened, then the position after the opening tag
+        self._pending = {tag: None for tag in required_tags}
+        self._overlap = max((len(tag) + 3 for tag in required_tags), default=0)
+        self.text = ""
+
+    @property
+    def done(self) -> bool:
+        return not self._pending
+
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk of the answer, returns True once all required tags are closed."""
+        start = max(0, len(self.text) - self._overlap)
+        self.text += chunk
+        for tag in list(self._pending):
+            content_start = self._pending[tag]
+            if content_start is None:
+                open_index = self.text.find(f"<{tag}>", start)
+                if open_index == -1:
+                    continue
+                content_start = self._pending[tag] = open_index + len(tag) + 2
+            if self.text.find(f"</{tag}>", max(start, content_start)) != -1:
+                del self._pending[tag]
+        return self.done
+
+
 def download_and_save_model(model_name: str, save_dir: str = "."):
     model = AutoModel.from_pretrained(model_name)
     model.save_pretrained(save_dir)
@@ -0,0 +1,386 @@
+"""Load balancing and failover across several endpoints of a model.
+
+A study pointed at a single deployment is capped by its quota, and stalls when it fails.
+`PooledModelArgs` wraps several model args, e.g. Azure deployments in different regions and an
+OpenRouter fallback, and `PooledChatModel` routes each query to one of them:
+
+- routing: "least_outstanding" sends the query to the endpoint with the fewest queries in flight
+  relative to its weight, "weighted" picks endpoints at random in proportion to their weights.
+- failover: a query failing with a rate limit, a server error, a timeout or a connection error is
+  sent to the next endpoint, for the errors of the openai client as well as those of requests and
+  huggingface_hub (e.g. TGI endpoints). Other errors, e.g. bad requests or authentication errors,
+  are raised without counting as failures of the endpoint.
+- circuit breaker: after `failure_threshold` consecutive failures, an endpoint receives no
+  queries for `cooldown` seconds, then a single trial query decides if it is used again.
+
+The state of the endpoints is shared by the pooled models of a process, so that the agents of a
+worker route around an endpoint that failed for one of them.
+
+Usage:
+    model_args = PooledModelArgs(
+        backends=[
+            AzureModelArgs(
+                model_name="gpt-4o",
+                deployment_name="gpt-4o",
+                endpoint="https://my-resource-eastus.openai.azure.com",
+                api_key_env_var="AZURE_OPENAI_API_KEY_EASTUS",
+            ),
+            AzureModelArgs(
+                model_name="gpt-4o",
+                deployment_name="gpt-4o",
+                endpoint="https://my-resource-westus.openai.azure.com",
+                api_key_env_var="AZURE_OPENAI_API_KEY_WESTUS",
+            ),
+            OpenRouterModelArgs(model_name="openai/gpt-4o"),
+        ],
+        weights=[1, 1, 0.2],
+    )
+"""
+
+import dataclasses
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+import requests
+
+from agentlab.llm.base_api import AbstractChatModel, AsyncChatModel, BaseModelArgs
+from agentlab.llm.retry_policy import RetryPolicy, RetryState, classify_error
+
+ROUTINGS = ("least_outstanding", "weighted")
+# the endpoint is at fault, other errors (bad requests, authentication, bugs) are raised
+FAILOVER_ERROR_TYPES = ("rate_limit", "server", "timeout", "connection")
+
+
+class AllEndpointsFailedError(Exception):
+    pass
+
+
+def _root_cause(error: Exception) -> Exception:
+    """Chat models raise their own error once their retries are exhausted, the API error is its cause."""
+    while error.__cause__ is not None:
+        error = error.__cause__
+    return error
+
+
+def _classify_http_error(error: Exception) -> str:
+    """`classify_error` for the errors of HTTP backends (e.g. TGI through huggingface_hub)."""
+    if isinstance(error, (requests.Timeout, TimeoutError)):
+        return "timeout"
+    if isinstance(error, (requests.ConnectionError, ConnectionError)):
+        return "connection"
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        # the errors of huggingface_hub are HTTPErrors
+        if error.response.status_code == 429:
+            return "rate_limit"
+        if error.response.status_code >= 500:
+            return "server"
+    return "fatal"
+
+
+def is_failover_error(error: Exception) -> bool:
+    """Whether another endpoint could answer a query that failed with error."""
+    error = _root_cause(error)
+    error_type = classify_error(error)
+    if error_type == "fatal":  # not an error of the openai client
+        error_type = _classify_http_error(error)
+    return error_type in FAILOVER_ERROR_TYPES
+
+
+class CircuitBreaker:
+    """Stops sending queries to a failing endpoint.
+
+    Args:
+        failure_threshold: int
+            Number of consecutive failures after which the circuit opens.
+        cooldown: float
+            Time in seconds during which an open circuit rejects queries, after which a single
+            trial query is let through (half-open).
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def allows(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+
+    def on_request(self):
+        if self.state == "half_open":
+            self.trial_in_flight = True
+
+    def on_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def on_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state == "closed":
+                self.trips += 1
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+
+class EndpointState:
+    """Queries in flight, circuit breaker and counters of an endpoint."""
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.outstanding = 0
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.total_latency = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "outstanding": self.outstanding,
+            "breaker_trips": self.breaker.trips,
+            "breaker_state": self.breaker.state,
+            "mean_latency": self.total_latency / self.successes if self.successes else None,
+        }
+
+
+_ENDPOINTS: dict[str, EndpointState] = {}
+_LOCK = threading.Lock()
+
+
+def _get_endpoint_state(name: str, failure_threshold: int, cooldown: float) -> EndpointState:
+    with _LOCK:
+        if name not in _ENDPOINTS:
+            _ENDPOINTS[name] = EndpointState(name, failure_threshold, cooldown)
+        return _ENDPOINTS[name]
+
+
+def _endpoint_name(model_args: BaseModelArgs) -> str:
+    """Identifies an endpoint by its model args, e.g. AzureModelArgs(gpt-4o@<resource>/gpt-4o)."""
+    location = (
+        getattr(model_args, "deployment_name", None)
+        or getattr(model_args, "model_url", None)
+        or getattr(model_args, "base_url", None)
+    )
+    # deployments of the same name in several Azure resources are different endpoints
+    resource = getattr(model_args, "endpoint", None)
+    if resource:
+        location = f"{resource.rstrip('/')}/{location}" if location else resource
+    name = f"{type(model_args).__name__}({model_args.model_name}"
+    return name + (f"@{location})" if location else ")")
+
+
+class PooledChatModel(AsyncChatModel):
+    """Chat model routing each query to one of several models.
+
+    Args:
+        models: list[AbstractChatModel]
+            The models of the endpoints.
+        names: list[str]
+            Names of the endpoints, endpoints with the same name share their state in the process.
+        weights: list[float]
+            Relative capacity of the endpoints, 1 for each by default.
+        routing: str
+            "least_outstanding" or "weighted".
+        failure_threshold: int
+            Consecutive failures after which an endpoint is put aside.
+        cooldown: float
+            Time in seconds an endpoint is put aside.
+        retry_policy: RetryPolicy
+            Waits between rounds, when every endpoint failed a query.
+    """
+
+    def __init__(
+        self,
+        models: list[AbstractChatModel],
+        names: list[str],
+        weights: list[float] = None,
+        routing: str = "least_outstanding",
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        retry_policy: RetryPolicy = None,
+    ):
+        assert models, "at least one model is required"
+        assert routing in ROUTINGS, f"routing should be one of {ROUTINGS}"
+        self.models = models
+        self.weights = weights or [1.0] * len(models)
+        assert len(self.weights) == len(models), "one weight per model is required"
+        self.routing = routing
+        self.retry_policy = retry_policy or RetryPolicy(max_retry=3)
+        self.endpoints = [_get_endpoint_state(n, failure_threshold, cooldown) for n in names]
+        # the agent passes stop_tags when its model streams
+        self.stream = any(getattr(model, "stream", False) for model in models)
+        self.last_model = None
+        self.n_failovers = 0
+
+    def __call__(self, messages: list[dict], **kwargs) -> dict:
+        """Query an endpoint, failing over to the others on rate limits and server errors.
+
+        Args:
+            messages: The messages of the prompt.
+            **kwargs: Passed to the model, e.g. n_samples or temperature.
+        """
+        self.n_failovers = 0
+        state = RetryState(self.retry_policy)
+        while True:
+            tried = set()
+            while (index := self._pick(tried)) is not None:
+                tried.add(index)
+                try:
+                    return self._query(index, messages, kwargs)
+                except Exception as error:
+                    if not is_failover_error(error):
+                        raise
+                    last_error = error
+                    self.n_failovers += 1
+                    logging.warning(
+                        f"Endpoint {self.endpoints[index].name} failed, failing over: {error}"
+                    )
+
+            # the rate limit hint of the last endpoint, or a backoff
+            wait_time = state.next_wait(_root_cause(last_error))
+            if wait_time is None:
+                raise AllEndpointsFailedError(
+                    f"All the endpoints failed after {state.attempts} rounds\n"
+                    f"Last error: {last_error}"
+                ) from last_error
+            time.sleep(wait_time)
+
+    def _pick(self, tried: set) -> int | None:
+        """Index of the next endpoint to query, None once the available ones were tried."""
+        with _LOCK:
+            candidates = [
+                i
+                for i, endpoint in enumerate(self.endpoints)
+                if i not in tried and endpoint.breaker.allows()
+            ]
+            if not candidates and not tried:
+                # every circuit is open: try the endpoint put aside for the longest time
+                candidates = [min(range(len(self.endpoints)), key=self._opened_at)]
+            if not candidates:
+                return None
+
+            if self.routing == "weighted":
+                index = random.choices(candidates, [self.weights[i] for i in candidates])[0]
+            else:
+                loads = {i: self.endpoints[i].outstanding / self.weights[i] for i in candidates}
+                least = min(loads.values())
+                index = random.choice([i for i in candidates if loads[i] == least])
+
+            endpoint = self.endpoints[index]
+            endpoint.breaker.on_request()
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return index
+
+    def _opened_at(self, index: int) -> float:
+        return self.endpoints[index].breaker.opened_at or 0.0
+
+    def _query(self, index: int, messages: list[dict], kwargs: dict) -> dict:
+        endpoint, model = self.endpoints[index], self.models[index]
+        if not getattr(model, "stream", False):
+            kwargs = {k: v for k, v in kwargs.items() if k != "stop_tags"}
+        self.last_model = model
+        start = time.monotonic()
+        try:
+            answer = model(messages, **kwargs)
+        except Exception as error:
+            with _LOCK:
+                endpoint.outstanding -= 1
+                if is_failover_error(error):
+                    endpoint.failures += 1
+                    endpoint.breaker.on_failure()
+                else:
+                    # the query was at fault, not the endpoint
+                    endpoint.breaker.trial_in_flight = False
+            raise
+        with _LOCK:
+            endpoint.outstanding -= 1
+            endpoint.successes += 1
+            endpoint.total_latency += time.monotonic() - start
+            endpoint.breaker.on_success()
+        return answer
+
+    def routing_stats(self) -> dict:
+        """Counters of each endpoint since the start of the process."""
+        with _LOCK:
+            return {endpoint.name: endpoint.stats() for endpoint in self.endpoints}
+
+    def get_stats(self):
+        stats = self.last_model.get_stats() if self.last_model is not None else {}
+        return {**stats, "n_failover_llm": self.n_failovers}
+
+
+@dataclass
+class PooledModelArgs(BaseModelArgs):
+    """Serializable object for instantiating a chat model balanced over several endpoints.
+
+    The token limits are the smallest of the backends, and vision is supported if all the
+    backends support it.
+    """
+
+    model_name: str = None
+    backends: list[BaseModelArgs] = None
+    weights: list[float] = None
+    routing: str = "least_outstanding"
+    failure_threshold: int = 3
+    cooldown: float = 30.0
+    # attempts of each backend before failing over, their own retries would delay the failover
+    backend_max_retry: int = 1
+
+    def __post_init__(self):
+        assert self.backends, "at least one backend is required"
+        if self.model_name is None:
+            self.model_name = "pooled-" + self.backends[0].model_name
+        for field in ("max_total_tokens", "max_input_tokens", "max_new_tokens"):
+            if getattr(self, field) is None:
+                values = [getattr(b, field) for b in self.backends if getattr(b, field) is not None]
+                setattr(self, field, min(values) if values else None)
+        self.vision_support = self.vision_support or all(b.vision_support for b in self.backends)
+
+    def make_model(self):
+        models = []
+        for backend in self.backends:
+            model = backend.make_model()
+            if isinstance(getattr(model, "retry_policy", None), RetryPolicy):
+                model.retry_policy = dataclasses.replace(
+                    model.retry_policy, max_retry=self.backend_max_retry
+                )
+            models.append(model)
+        return PooledChatModel(
+            models,
+            names=[_endpoint_name(backend) for backend in self.backends],
+            weights=self.weights,
+            routing=self.routing,
+            failure_threshold=self.failure_threshold,
+            cooldown=self.cooldown,
+        )
+
+    def prepare_server(self):
+        for backend in self.backends:
+            backend.prepare_server()
+
+    def close_server(self):
+        for backend in self.backends:
+            backend.close_server()
+
+    def server_ready(self) -> bool:
+        return any(backend.server_ready() for backend in self.backends)
@@ -0,0 +1,216 @@
+"""Persistent cache of LLM responses, shared by the processes of a machine.
+
+Reproduction runs, temperature-0 reruns, unit tests and prompt tests in xray send the same prompts
+again. When the cache is enabled, `ChatModel` and `HFBaseChatModel` look up the answers of a
+query before calling the model, and store them after. Queries are identified by a hash of the
+normalized messages, the model name, the temperature, the number of samples and max_tokens.
+
+The cache is a SQLite file. Writes are serialized by SQLite, so episodes running in parallel (ray
+or joblib workers) can share it. Entries expire after ttl seconds, and the least recently used
+entries are evicted above max_entries.
+
+The cache is opt-in, enabled with `enable_cache(path)` or the AGENTLAB_LLM_CACHE environment
+variable, which is inherited by workers. Hits and misses are counted by the active `LLMTracker`.
+
+Usage:
+    enable_cache("~/.agentlab_llm_cache.sqlite", ttl=7 * 24 * 3600)
+    study.run(...)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+CACHE_ENV_VAR = "AGENTLAB_LLM_CACHE"
+TTL_ENV_VAR = "AGENTLAB_LLM_CACHE_TTL"
+MAX_ENTRIES_ENV_VAR = "AGENTLAB_LLM_CACHE_MAX_ENTRIES"
+
+
+def _normalize_content(content):
+    """Content as a string, or a list of parts with adjacent texts merged (see BaseMessage.merge)."""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content:
+        if part["type"] == "text" and parts and parts[-1]["type"] == "text":
+            parts[-1] = {"type": "text", "text": parts[-1]["text"] + "\n" + part["text"]}
+        else:
+            parts.append(dict(part))
+    if len(parts) == 1 and parts[0]["type"] == "text":
+        return parts[0]["text"]
+    return parts
+
+
+def make_key(
+    model_name: str,
+    messages,
+    temperature: float,
+    n_samples: int,
+    max_tokens: int,
+    stop_tags: list[str] = None,
+) -> str:
+    """Hash identifying a query, messages being a list of dicts or a Discussion.
+
+    A streamed query stopped once stop_tags are closed gets a truncated answer, stop_tags are part
+    of its key.
+    """
+    query = {
+        "model_name": model_name,
+        "messages": [
+            {"role": message["role"], "content": _normalize_content(message["content"])}
+            for message in messages
+        ],
+        "temperature": temperature,
+        "n_samples": n_samples,
+        "max_tokens": max_tokens,
+    }
+    if stop_tags:
+        query["stop_tags"] = list(stop_tags)
+    return hashlib.sha256(json.dumps(query, sort_keys=True).encode()).hexdigest()
+
+
+class ResponseCache:
+    """LLM responses stored in SQLite, with TTL and LRU eviction.
+
+    Args:
+        path: str | Path
+            Path to the SQLite file.
+        ttl: float
+            Time in seconds after which entries expire. None to keep them forever.
+        max_entries: int
+            Maximum number of entries, the least recently used are evicted. None for no limit.
+    """
+
+    def __init__(self, path: str | Path, ttl: float = None, max_entries: int = None):
+        self.path = Path(path).expanduser()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, answers TEXT, created REAL, accessed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction, holding the database lock from the start."""
+        with closing(sqlite3.connect(self.path, timeout=60, isolation_level=None)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")  # readers don't wait for writers
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def get(self, key: str) -> list[str] | None:
+        """Contents of the cached answers, or None if missing or expired."""
+        now = time.time()
+        with closing(sqlite3.connect(self.path, timeout=60)) as conn:
+            row = conn.execute(
+                "SELECT answers, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+            return None
+        with self._transaction() as conn:
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, answers: list[str]):
+        """Store the contents of the answers of a query, and evict old entries."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, json.dumps(answers), now, now),
+            )
+            if self.ttl is not None:
+                conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            if self.max_entries is not None:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "  SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?"
+                    ")",
+                    (self.max_entries,),
+                )
+
+    def clear(self):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def __len__(self):
+        with closing(sqlite3.connect(self.path, timeout=60)) as conn:
+            return conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+_CACHES = {}
+
+
+def enable_cache(path: str | Path, ttl: float = None, max_entries: int = None):
+    """Enable the cache in this process and in the workers it starts."""
+    os.environ[CACHE_ENV_VAR] = str(Path(path).expanduser())
+    for env_var, value in ((TTL_ENV_VAR, ttl), (MAX_ENTRIES_ENV_VAR, max_entries)):
+        if value is None:
+            os.environ.pop(env_var, None)
+        else:
+            os.environ[env_var] = str(value)
+
+
+def disable_cache():
+    for env_var in (CACHE_ENV_VAR, TTL_ENV_VAR, MAX_ENTRIES_ENV_VAR):
+        os.environ.pop(env_var, None)
+
+
+def get_cache() -> ResponseCache | None:
+    """The cache configured by the environment, None if it is not enabled."""
+    path = os.environ.get(CACHE_ENV_VAR)
+    if not path:
+        return None
+    ttl = os.environ.get(TTL_ENV_VAR)
+    max_entries = os.environ.get(MAX_ENTRIES_ENV_VAR)
+    config = (
+        path,
+        float(ttl) if ttl else None,
+        int(max_entries) if max_entries else None,
+    )
+    if config not in _CACHES:
+        _CACHES[config] = ResponseCache(*config)
+    return _CACHES[config]
+
+
+def lookup(
+    model_name: str,
+    messages,
+    temperature: float,
+    n_samples: int,
+    max_tokens: int,
+    tracker=None,
+    stop_tags: list[str] = None,
+) -> tuple[str | None, list[str] | None]:
+    """Look up a query in the cache, if enabled, and count the hit or miss in tracker.
+
+    Returns:
+        tuple: The key of the query (None if the cache is disabled) and the contents of the cached
+            answers (None on a miss).
+    """
+    cache = get_cache()
+    if cache is None:
+        return None, None
+    key = make_key(model_name, messages, temperature, n_samples, max_tokens, stop_tags)
+    answers = cache.get(key)
+    if tracker is not None:
+        tracker.record_cache(hits=int(answers is not None), misses=int(answers is None))
+    return key, answers
+
+
+def store(key: str | None, answers: list[str]):
+    """Store the answers of a query looked up with `lookup`, unless the cache is disabled."""
+    if key is not None:
+        get_cache().put(key, answers)
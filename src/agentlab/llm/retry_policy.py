@@ -0,0 +1,216 @@
+"""Retry policy of the queries to LLM APIs.
+
+Errors are classified before deciding how long to wait:
+
+- rate_limit (429): wait for the time given by the Retry-After header of the response, or by the
+  x-ratelimit-reset header of the exhausted limit, or the "try again in Xs" hint of the message.
+  Without a hint, back off starting from `rate_limit_delay`. Hints are capped by `max_delay`,
+  unless a `deadline` bounds the total wait.
+- server (5xx), timeout, connection and other API errors: transient, back off from `base_delay`,
+  i.e. retry within seconds.
+- fatal (400, 401, 403, 404, 422): retrying won't help, the error is raised.
+
+Backoff uses decorrelated jitter: each wait is drawn uniformly between the base delay and three
+times the previous wait, capped by `max_delay`, so that workers hitting the same limit don't
+retry in lockstep. A total `deadline` bounds the time spent on a query, waits included.
+
+Usage:
+    state = RetryState(RetryPolicy(max_retry=4, deadline=300))
+    while True:
+        try:
+            return query()
+        except openai.OpenAIError as error:
+            wait_time = state.next_wait(error)
+            if wait_time is None:
+                raise
+            time.sleep(wait_time)
+"""
+
+import random
+import re
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+
+import openai
+
+FATAL_STATUS_CODES = (400, 401, 403, 404, 422)
+
+
+def classify_error(error: Exception) -> str:
+    """One of "rate_limit", "server", "timeout", "connection", "fatal" or "other"."""
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limit"
+    if isinstance(error, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection"
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code == 429:
+            return "rate_limit"
+        if error.status_code >= 500:
+            return "server"
+        if error.status_code in FATAL_STATUS_CODES:
+            return "fatal"
+    if not isinstance(error, openai.OpenAIError):
+        return "fatal"
+    return "other"
+
+
+def _parse_duration(value: str) -> float | None:
+    """Durations of the x-ratelimit-reset-* headers of OpenAI, e.g. "1s", "6m0s" or "20ms"."""
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    matches = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not matches:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * units[unit] for amount, unit in matches)
+
+
+def _parse_reset_time(value: str) -> float | None:
+    """x-ratelimit-reset, either a delay in seconds or a timestamp in seconds or milliseconds."""
+    try:
+        reset = float(value)
+    except ValueError:
+        return None
+    if reset > 1e12:
+        return reset / 1000 - time.time()
+    if reset > 1e9:
+        return reset - time.time()
+    return reset
+
+
+def _parse_retry_after(value: str) -> float | None:
+    """Retry-After, in seconds or as an HTTP date."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_exhausted(headers, remaining_header: str) -> bool:
+    try:
+        return float(headers.get(remaining_header)) <= 0
+    except (TypeError, ValueError):
+        return False
+
+
+def retry_after(error: Exception) -> float | None:
+    """Time to wait before retrying, as given by the response headers or the error message.
+
+    Retry-After is used when present. Otherwise, the x-ratelimit-reset-* headers give the time at
+    which a limit is fully restored, and they are sent for every limit: only the reset of a limit
+    with nothing remaining is used.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    wait = None
+    if headers.get("retry-after-ms") is not None:
+        try:
+            wait = float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if wait is None and headers.get("retry-after") is not None:
+        wait = _parse_retry_after(headers["retry-after"])
+    if wait is not None:
+        return max(0.0, wait)
+
+    waits = []
+    for limit in ("requests", "tokens"):
+        reset = headers.get(f"x-ratelimit-reset-{limit}")
+        if reset is not None and _is_exhausted(headers, f"x-ratelimit-remaining-{limit}"):
+            waits.append(_parse_duration(reset))
+    reset = headers.get("x-ratelimit-reset")
+    if reset is not None and _is_exhausted(headers, "x-ratelimit-remaining"):
+        waits.append(_parse_reset_time(reset))
+    waits = [wait for wait in waits if wait is not None]
+    if waits:
+        return max(0.0, max(waits))
+
+    message = error.args[0] if error.args and isinstance(error.args[0], str) else str(error)
+    match = re.search(r"try again in (\d+(?:\.\d+)?)(ms|s)", message)
+    if match:
+        return float(match.group(1)) * (0.001 if match.group(2) == "ms" else 1)
+    return None
+
+
+@dataclass
+class RetryPolicy:
+    """How to retry failed queries.
+
+    Args:
+        max_retry: int
+            Maximum number of attempts.
+        base_delay: float
+            Base delay in seconds of the backoff of transient errors.
+        max_delay: float
+            Maximum wait in seconds. Waits requested by the API are capped too, unless a deadline
+            is set.
+        rate_limit_delay: float
+            Base delay in seconds of rate limit errors without a hint of the time to wait.
+        deadline: float
+            Maximum time in seconds spent on a query, including waits. None for no limit.
+    """
+
+    max_retry: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    rate_limit_delay: float = 10.0
+    deadline: float = None
+
+
+class RetryState:
+    """Retries of a single query, following a RetryPolicy."""
+
+    def __init__(self, policy: RetryPolicy):
+        self.policy = policy
+        self.start = time.monotonic()
+        self.attempts = 0
+        self.total_wait = 0.0
+        self.error_types = []
+        self._previous_delay = None
+
+    def next_wait(self, error: Exception) -> float | None:
+        """Count a failed attempt, and return the time to wait before the next one.
+
+        Returns:
+            float | None: The wait in seconds, or None if the query should not be retried (fatal
+                error, no attempts left, or the deadline would be exceeded).
+        """
+        self.attempts += 1
+        error_type = classify_error(error)
+        self.error_types.append(error_type)
+        if error_type == "fatal" or self.attempts >= self.policy.max_retry:
+            return None
+
+        wait_time = retry_after(error) if error_type == "rate_limit" else None
+        if wait_time is None:
+            wait_time = self._backoff(error_type)
+        else:
+            # a little jitter, so that workers waiting on the same limit don't retry together
+            wait_time *= random.uniform(1.0, 1.1)
+            if self.policy.deadline is None:
+                wait_time = min(wait_time, self.policy.max_delay)
+
+        if self.policy.deadline is not None:
+            elapsed = time.monotonic() - self.start
+            if elapsed + wait_time > self.policy.deadline:
+                return None
+        self.total_wait += wait_time
+        return wait_time
+
+    def _backoff(self, error_type: str) -> float:
+        """Decorrelated jitter: uniform between the base delay and 3 times the previous wait."""
+        base = (
+            self.policy.rate_limit_delay if error_type == "rate_limit" else self.policy.base_delay
+        )
+        previous = self._previous_delay if self._previous_delay is not None else base
+        delay = min(max(self.policy.max_delay, base), random.uniform(base, previous * 3))
+        self._previous_delay = delay
+        return delay
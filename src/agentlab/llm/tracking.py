@@ -17,25 +17,65 @@ class LLMTracker:
         self.input_tokens_key = "input_tokens_" + suffix if suffix else "input_tokens"
         self.output_tokens_key = "output_tokens_" + suffix if suffix else "output_tokens"
         self.cost_key = "cost_" + suffix if suffix else "cost"
-
-    def __call__(self, input_tokens: int, output_tokens: int, cost: float):
+        # input tokens read from the prefix cache of the provider, included in input_tokens
+        self.cached_tokens = 0
+        self.cached_tokens_key = "cached_tokens_" + suffix if suffix else "cached_tokens"
+        # queries answered by the response cache, see agentlab.llm.response_cache
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_hits_key = "cache_hits_" + suffix if suffix else "cache_hits"
+        self.cache_misses_key = "cache_misses_" + suffix if suffix else "cache_misses"
+        # duplicate queries sent by hedging, see agentlab.llm.hedging, their cost is in cost
+        self.hedges = 0
+        self.hedge_cost = 0.0
+        self.hedges_key = "hedges_" + suffix if suffix else "hedges"
+        self.hedge_cost_key = "hedge_cost_" + suffix if suffix else "hedge_cost"
+
+    def __call__(self, input_tokens: int, output_tokens: int, cost: float, cached_tokens: int = 0):
         self.input_tokens += input_tokens
         self.output_tokens += output_tokens
         self.cost += cost
+        self.cached_tokens += cached_tokens
+
+    def record_cache(self, hits: int = 0, misses: int = 0):
+        self.cache_hits += hits
+        self.cache_misses += misses
+
+    def record_hedge(self, hedges: int = 0, hedge_cost: float = 0.0):
+        self.hedges += hedges
+        self.hedge_cost += hedge_cost
 
     @property
     def stats(self):
-        return {
+        stats = {
             self.input_tokens_key: self.input_tokens,
             self.output_tokens_key: self.output_tokens,
             self.cost_key: self.cost,
         }
+        # only reported when caching is used, by the provider or by the response cache
+        if self.cached_tokens:
+            stats[self.cached_tokens_key] = self.cached_tokens
+        if self.cache_hits or self.cache_misses:
+            stats[self.cache_hits_key] = self.cache_hits
+            stats[self.cache_misses_key] = self.cache_misses
+        if self.hedges:
+            stats[self.hedges_key] = self.hedges
+            stats[self.hedge_cost_key] = self.hedge_cost
+        return stats
 
     def add_tracker(self, tracker: "LLMTracker"):
-        self(tracker.input_tokens, tracker.output_tokens, tracker.cost)
+        self(tracker.input_tokens, tracker.output_tokens, tracker.cost, tracker.cached_tokens)
+        self.record_cache(tracker.cache_hits, tracker.cache_misses)
+        self.record_hedge(tracker.hedges, tracker.hedge_cost)
 
     def __repr__(self):
-        return f"LLMTracker(input_tokens={self.input_tokens}, output_tokens={self.output_tokens}, cost={self.cost})"
+        return f"LLMTracker(input_tokens={self.input_tokens}, output_tokens={self.output_tokens}, cached_tokens={self.cached_tokens}, cost={self.cost})"
+
+
+def get_tracker() -> LLMTracker | None:
+    """The active tracker of this thread, if any."""
+    instance = getattr(TRACKER, "instance", None)
+    return instance if isinstance(instance, LLMTracker) else None
 
 
 @contextmanager
@@ -98,4 +138,7 @@ def get_pricing_openai():
                 "prompt": cost_dict[prompt_key],
                 "completion": cost_dict[completion_key],
             }
+            # price of the input tokens read from the prompt cache, when known
+            if k + "-cached" in cost_dict:
+                res[k]["cached_prompt"] = cost_dict[k + "-cached"]
     return res
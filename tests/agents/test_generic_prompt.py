@@ -253,6 +253,37 @@ def test_main_prompt_elements_present():
             assert expected in prompt
 
 
+def test_cache_friendly_layout():
+    flags = deepcopy(ALL_TRUE_FLAGS)
+    flags.cache_friendly_layout = True
+
+    def make_prompt(n_steps):
+        return str(
+            MainPrompt(
+                action_set=flags.action.action_set.make_action_set(),
+                obs_history=OBS_HISTORY[: n_steps + 1],
+                actions=ACTIONS[:n_steps],
+                memories=MEMORIES[:n_steps],
+                thoughts=THOUGHTS[:n_steps],
+                previous_plan="1- think\n2- do it",
+                step=n_steps,
+                flags=flags,
+            ).prompt
+        )
+
+    prompts = [make_prompt(n_steps) for n_steps in range(3)]
+    for _, expected_prompts in FLAG_EXPECTED_PROMPT:
+        for expected in expected_prompts:
+            assert expected in prompts[2]
+
+    # the invariant blocks are at the start, identical at every step
+    goal_start = prompts[0].index("# Instructions")
+    assert prompts[0].index("# Action space") < goal_start
+    assert prompts[0].index("# Concrete Example") < goal_start
+    assert all(prompt[:goal_start] == prompts[0][:goal_start] for prompt in prompts)
+    assert prompts[2].index("# History of interaction") < prompts[2].index("Step 3.")
+
+
 if __name__ == "__main__":
     # for debugging
     test_shrinking_observation()
@@ -0,0 +1,108 @@
+import os
+from collections import namedtuple
+
+import pytest
+
+from agentlab.experiments import adaptive_concurrency
+from agentlab.experiments.adaptive_concurrency import GB, AdaptiveConcurrency, process_tree_rss
+
+Memory = namedtuple("Memory", ["percent", "total"])
+
+
+@pytest.fixture
+def host(monkeypatch):
+    """Fake host usage, modify the returned dict to change it."""
+    usage = {"memory_percent": 50.0, "cpu_percent": 50.0, "rss": 1 * GB}
+    monkeypatch.setattr(
+        adaptive_concurrency.psutil,
+        "virtual_memory",
+        lambda: Memory(percent=usage["memory_percent"], total=100 * GB),
+    )
+    monkeypatch.setattr(
+        adaptive_concurrency.psutil, "cpu_percent", lambda interval=None: usage["cpu_percent"]
+    )
+    monkeypatch.setattr(adaptive_concurrency, "process_tree_rss", lambda pid: usage["rss"])
+    return usage
+
+
+def test_increase_when_saturated(host):
+    controller = AdaptiveConcurrency(min_jobs=2, max_jobs=4, worker_memory_limit_gb=None)
+    controller.start(n_jobs=8)
+    assert controller.limit == 2
+
+    assert controller.update(busy_pids=[1]) == 2  # not saturated
+    assert controller.update(busy_pids=[1, 2]) == 3
+    assert controller.update(busy_pids=[1, 2, 3]) == 4
+    assert controller.update(busy_pids=[1, 2, 3, 4]) == 4  # max_jobs
+    assert len(controller.history) == 4
+
+
+def test_no_room_for_one_more(host):
+    controller = AdaptiveConcurrency(min_jobs=2, max_jobs=4, worker_memory_limit_gb=None)
+    controller.start(n_jobs=4)
+
+    host["memory_percent"] = 80
+    host["rss"] = 10 * GB  # one more episode would bring memory to 90%
+    assert controller.update(busy_pids=[1, 2]) == 2
+
+
+def test_decrease_under_pressure(host):
+    controller = AdaptiveConcurrency(min_jobs=1, initial_jobs=4, decrease_cooldown=0)
+    controller.start(n_jobs=4)
+    assert controller.limit == 4
+
+    host["memory_percent"] = 95
+    assert controller.update(busy_pids=[1, 2, 3]) == 2  # below the number of running episodes
+    assert controller.update(busy_pids=[1, 2]) == 1
+    assert controller.update(busy_pids=[1]) == 1  # min_jobs
+
+    host["memory_percent"] = 50
+    host["cpu_percent"] = 99
+    assert controller.update(busy_pids=[1]) == 1
+
+
+def test_decrease_once_per_cooldown(host, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(adaptive_concurrency.time, "monotonic", lambda: now[0])
+    controller = AdaptiveConcurrency(min_jobs=1, initial_jobs=8, decrease_cooldown=30)
+    controller.start(n_jobs=8)
+
+    host["memory_percent"] = 95
+    assert controller.update(busy_pids=[1, 2, 3, 4, 5, 6]) == 5
+    # usage stays high while the running episodes finish
+    now[0] = 10
+    assert controller.update(busy_pids=[1, 2, 3, 4, 5, 6]) == 5
+    now[0] = 20
+    assert controller.update(busy_pids=[1, 2, 3]) == 5
+    now[0] = 31
+    assert controller.update(busy_pids=[1, 2, 3]) == 2
+
+
+def test_restart_leaking_workers(host, monkeypatch):
+    killed = []
+
+    class FakeProcess:
+        def __init__(self, pid):
+            self.pid = pid
+
+        def name(self):
+            return "ray::IDLE" if self.pid != 3 else "ray::run_exp"
+
+        def kill(self):
+            killed.append(self.pid)
+
+    monkeypatch.setattr(adaptive_concurrency.psutil, "Process", FakeProcess)
+    controller = AdaptiveConcurrency(max_jobs=4, worker_memory_limit_gb=2)
+    controller.start(n_jobs=4)
+
+    host["rss"] = 3 * GB
+    controller.update(busy_pids=[1, 2, 3])
+    assert killed == []  # busy workers are only reported
+
+    controller.update(busy_pids=[2])
+    assert killed == [1]  # 3 is running something else
+
+
+def test_process_tree_rss():
+    assert process_tree_rss(os.getpid()) > 0
+    assert process_tree_rss(2**30) is None
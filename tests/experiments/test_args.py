@@ -1,5 +1,8 @@
 from ast import mod
 from dataclasses import dataclass
+
+import pytest
+
 from agentlab.experiments.args import (
     expand_cross_product,
     CrossProd,
@@ -7,6 +10,8 @@ from agentlab.experiments.args import (
     make_progression_study,
     sample_args,
     make_ablation_study,
+    iter_sweep,
+    config_hash,
 )
 
 
@@ -157,3 +162,89 @@ def test_make_ablation_study():
     params.sort()
 
     assert params == [("model1", 0.1), ("model1", 0.2), ("model2", 0.1)]
+
+
+def test_iter_sweep():
+    exp_args = ExpArgsTest(
+        n_episode=CrossProd([1, 2, 3]),
+        llm_args=LLMArgsTest(
+            model_name=CrossProd(["model1", "model2"]),
+        ),
+    )
+    sweep = iter_sweep(exp_args)
+    assert next(sweep).n_episode == 1  # lazy
+
+    configs = list(iter_sweep(exp_args))
+    variables = sorted((args.n_episode, args.llm_args.model_name) for args in configs)
+    expected = sorted(
+        (args.n_episode, args.llm_args.model_name) for args in expand_cross_product(exp_args)
+    )
+    assert variables == expected
+
+    # unchanged sub-objects are shared, changed ones are copied
+    shared = list(iter_sweep(ExpArgsTest(n_episode=CrossProd([1, 2]), llm_args=LLMArgsTest())))
+    assert shared[0].llm_args is shared[1].llm_args
+    assert configs[0].llm_args is not configs[1].llm_args
+    assert isinstance(exp_args.n_episode, CrossProd)  # the original is untouched
+
+    independent = list(iter_sweep(exp_args, independent=True))
+    assert len({id(args.llm_args) for args in independent}) == 6
+
+
+def test_iter_sweep_dedup():
+    ablation = make_ablation_study(
+        start_point=LLMArgsTest(model_name="model1", temperature=0.1),
+        changes=[("model_name", "model2"), ("model_name", "model2"), ("temperature", 0.1)],
+    )
+    exp_args = ExpArgsTest(n_episode=CrossProd([1, 2]), llm_args=ablation)
+
+    assert len(expand_cross_product(exp_args)) == 8
+    configs = list(iter_sweep(exp_args))
+    assert len(configs) == 4
+    assert len({config_hash(config) for config in configs}) == 4
+    assert len(list(iter_sweep(exp_args, dedup=False))) == 8
+
+    sampled = ExpArgsTest(n_episode=Choice([1, 2]), llm_args=LLMArgsTest())
+    assert len(list(iter_sweep(sampled, n_samples=50, seed=0))) == 2
+
+
+class Tokenizer:
+    def __init__(self, name):
+        self.name = name
+
+
+def test_config_hash_is_stable():
+    # objects are hashed by value, not by their repr and memory address
+    config = ExpArgsTest(llm_args=LLMArgsTest(model_name=Tokenizer("gpt2")))
+    same = ExpArgsTest(llm_args=LLMArgsTest(model_name=Tokenizer("gpt2")))
+    other = ExpArgsTest(llm_args=LLMArgsTest(model_name=Tokenizer("llama")))
+    assert config_hash(config) == config_hash(same) != config_hash(other)
+
+    assert config_hash({"fn": make_ablation_study}) != config_hash({"fn": make_progression_study})
+    assert config_hash({"cls": Tokenizer}) == config_hash({"cls": Tokenizer})
+
+    with pytest.raises(TypeError):
+        config_hash({"fn": lambda x: x})
+    with pytest.raises(TypeError):
+        config_hash({"lock": object()})
+
+
+def test_iter_sweep_shards():
+    exp_args = ExpArgsTest(
+        n_episode=Choice(list(range(100))),
+        llm_args=LLMArgsTest(model_name=CrossProd(["model1", "model2", "model3"])),
+    )
+    full = {config_hash(args) for args in iter_sweep(exp_args, n_samples=20, seed=1)}
+
+    shards = [
+        {
+            config_hash(args)
+            for args in iter_sweep(exp_args, n_samples=20, seed=1, shard_index=i, n_shards=3)
+        }
+        for i in range(3)
+    ]
+    assert set.union(*shards) == full
+    assert sum(len(shard) for shard in shards) == len(full)
+
+    with pytest.raises(ValueError):
+        next(iter_sweep(exp_args, shard_index=3, n_shards=3))
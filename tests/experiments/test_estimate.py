@@ -0,0 +1,63 @@
+import bgym
+import numpy as np
+import pandas as pd
+
+from agentlab.agents.generic_agent.agent_configs import FLAGS_GPT_4o
+from agentlab.agents.generic_agent.generic_agent import GenericAgentArgs
+from agentlab.experiments.estimate import estimate_study, expected_usage, recommend_n_jobs
+from agentlab.llm.chat_api import CheatMiniWoBLLMArgs
+
+
+def test_recommend_n_jobs():
+    n_jobs_list = [1, 2, 4, 8, 16]
+    makespans = [100, 50, 26, 25, 25]
+    assert recommend_n_jobs(n_jobs_list, makespans, tolerance=0.1) == 4
+    assert recommend_n_jobs(n_jobs_list, makespans, tolerance=0.0) == 8
+    assert recommend_n_jobs(n_jobs_list, makespans, tolerance=10) == 1
+
+
+def test_expected_usage():
+    records = pd.DataFrame(
+        {
+            "task_name": ["a", "a", "b", "c"],
+            "agent_name": ["agent1", "agent1", "agent1", "agent2"],
+            "input_tokens": [100, 200, 1000, 7],
+            "output_tokens": [10, 20, 100, 1],
+            "cost": [0.1, 0.2, 1.0, 0.01],
+        }
+    )
+
+    def make_exp_args(agent_name, task_name):
+        exp_args = bgym.ExpArgs(agent_args=None, env_args=bgym.EnvArgs(task_name=task_name))
+        exp_args.agent_args = GenericAgentArgs(agent_name=agent_name)
+        return exp_args
+
+    exp_args_list = [
+        make_exp_args("agent1", "a"),  # same agent and task
+        make_exp_args("agent1", "c"),  # same agent
+        make_exp_args("agent3", "c"),  # same task
+        make_exp_args("agent3", "d"),  # unknown
+    ]
+    usage = expected_usage(exp_args_list, records)
+
+    assert usage["input_tokens"].tolist()[:3] == [150, 200, 7]
+    assert np.isnan(usage["input_tokens"].iloc[3])
+    assert expected_usage(exp_args_list, None)["cost"].isna().all()
+
+
+def test_estimate_study():
+    agent_args = GenericAgentArgs(chat_model_args=CheatMiniWoBLLMArgs(), flags=FLAGS_GPT_4o)
+    estimate = estimate_study("miniwob_tiny_test", agent_args, n_jobs_list=[1, 2, 4, 8])
+
+    assert estimate.n_exp == 4
+    assert estimate.n_with_history == 0
+    assert estimate.makespans[0] == estimate.total_duration
+    assert estimate.makespans == sorted(estimate.makespans, reverse=True)
+    assert estimate.critical_path == estimate.makespans[-1]
+    assert estimate.recommended_n_jobs == 4
+    assert estimate.n_with_usage == 0
+    assert "Recommended n_jobs: 4" in str(estimate)
+
+
+if __name__ == "__main__":
+    test_estimate_study()
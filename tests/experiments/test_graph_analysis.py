@@ -0,0 +1,103 @@
+import itertools
+import random
+
+import pytest
+
+from agentlab.experiments.graph_analysis import (
+    compress_chains,
+    critical_path,
+    max_antichain,
+    max_parallelism,
+    successor_index,
+    topological_levels,
+)
+
+# a -> b -> c -> e, and d -> e, f is isolated
+DEP_GRAPH = {"a": [], "b": ["a"], "c": ["b"], "d": [], "e": ["c", "d"], "f": []}
+
+
+def _random_dag(seed, n_nodes=12, p_edge=0.2):
+    rng = random.Random(seed)
+    return {str(i): [str(j) for j in range(i) if rng.random() < p_edge] for i in range(n_nodes)}
+
+
+def _depends_on(dep_graph, node, other):
+    """True if node depends transitively on other."""
+    stack = list(dep_graph[node])
+    seen = set()
+    while stack:
+        dep = stack.pop()
+        if dep == other:
+            return True
+        if dep not in seen:
+            seen.add(dep)
+            stack.extend(dep_graph[dep])
+    return False
+
+
+def _is_antichain(dep_graph, nodes):
+    return not any(
+        _depends_on(dep_graph, a, b) or _depends_on(dep_graph, b, a)
+        for a, b in itertools.combinations(nodes, 2)
+    )
+
+
+def test_successor_index():
+    successors = successor_index(DEP_GRAPH)
+    assert successors == {"a": ["b"], "b": ["c"], "c": ["e"], "d": ["e"], "e": [], "f": []}
+
+
+def test_topological_levels():
+    assert topological_levels(DEP_GRAPH) == [["a", "d", "f"], ["b"], ["c"], ["e"]]
+
+    with pytest.raises(ValueError):
+        topological_levels({"a": ["b"], "b": ["a"]})
+
+
+def test_compress_chains():
+    compressed, chains = compress_chains(DEP_GRAPH)
+    assert chains == {"a-c": ["a", "b", "c"], "d": ["d"], "e": ["e"], "f": ["f"]}
+    assert compressed == {"a-c": [], "d": [], "e": ["a-c", "d"], "f": []}
+
+    # a node with 2 successors ends a chain
+    compressed, chains = compress_chains({"a": [], "b": ["a"], "c": ["b"], "d": ["b"]})
+    assert chains == {"a-b": ["a", "b"], "c": ["c"], "d": ["d"]}
+
+
+def test_critical_path():
+    assert critical_path(DEP_GRAPH) == (4, ["a", "b", "c", "e"])
+
+    length, path = critical_path(DEP_GRAPH, durations={"d": 10})
+    assert (length, path) == (11, ["d", "e"])
+    assert critical_path({}) == (0, [])
+
+
+def test_max_antichain():
+    antichain = max_antichain(DEP_GRAPH)
+    assert len(antichain) == 3
+    assert _is_antichain(DEP_GRAPH, antichain)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_max_antichain_brute_force(seed):
+    dep_graph = _random_dag(seed)
+    antichain = max_antichain(dep_graph)
+    assert _is_antichain(dep_graph, antichain)
+
+    best = max(
+        size
+        for size in range(1, len(dep_graph) + 1)
+        if any(_is_antichain(dep_graph, nodes) for nodes in itertools.combinations(dep_graph, size))
+    )
+    assert max_parallelism(dep_graph) == best
+
+
+def test_large_chain_graph():
+    # 900 tasks in chains of 30, like WebArena
+    dep_graph = {str(i): [str(i - 1)] if i % 30 else [] for i in range(900)}
+
+    compressed, chains = compress_chains(dep_graph)
+    assert len(compressed) == 30
+    assert len(topological_levels(dep_graph)) == 30
+    assert critical_path(dep_graph)[0] == 30
+    assert max_parallelism(dep_graph) == 30
@@ -0,0 +1,94 @@
+import csv
+import shutil
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+import pytest
+
+from agentlab.experiments.journal import JournalStore
+
+JOURNAL_CSV = Path(__file__).parent.parent.parent / "reproducibility_journal.csv"
+
+
+def _row(agent_name, benchmark="miniwob", date="2024-10-01_00-00-00", avg_reward=0.5, **kwargs):
+    return {
+        "git_user": "tester",
+        "agent_name": agent_name,
+        "benchmark": benchmark,
+        "date": date,
+        "avg_reward": avg_reward,
+        "n_err": 0,
+        **kwargs,
+    }
+
+
+def _read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def _append_rows(csv_path, worker_id, n_rows=5):
+    journal = JournalStore(csv_path)
+    for i in range(n_rows):
+        journal.append([_row(f"agent_{worker_id}", date=f"2024-10-01_00-00-{i:02d}")])
+
+
+def test_append_and_query(tmp_path):
+    journal = JournalStore(tmp_path / "journal.csv")
+    journal.append([_row("agent_a", avg_reward=0.2), _row("agent_b", avg_reward=0.6)])
+    journal.append([_row("agent_a", date="2024-11-01_00-00-00", avg_reward=0.4)])
+    journal.append([_row("agent_a", benchmark="webarena", comment="new column")])
+    assert len(journal) == 4
+
+    rows = _read_csv(tmp_path / "journal.csv")
+    assert len(rows) == 4
+    assert rows[0]["avg_reward"] == "0.2" and rows[0]["comment"] == ""
+    assert rows[3]["comment"] == "new column"
+
+    df = journal.query(agent_name="agent_a", benchmark="miniwob")
+    assert df["avg_reward"].tolist() == [0.2, 0.4]
+    assert len(journal.query(since="2024-11")) == 1
+    assert len(journal.query(agent_name=["agent_a", "agent_b"], until="2024-11")) == 3
+    assert len(journal.query(git_user="someone_else")) == 0
+    with pytest.raises(ValueError):
+        journal.query(unknown_column="x")
+
+    latest = journal.leaderboard("miniwob")
+    assert latest["agent_name"].tolist() == ["agent_b", "agent_a"]
+    assert latest["avg_reward"].tolist() == [0.6, 0.4]
+    best = journal.leaderboard("miniwob", latest=False)
+    assert best.set_index("agent_name").loc["agent_a", "date"] == "2024-11-01_00-00-00"
+
+
+def test_existing_csv_is_imported(tmp_path):
+    csv_path = tmp_path / "reproducibility_journal.csv"
+    shutil.copy(JOURNAL_CSV, csv_path)
+    n_rows = len(_read_csv(csv_path))
+
+    journal = JournalStore(csv_path)
+    assert len(journal) == n_rows
+    journal.append([_row("agent_a")])
+    rows = _read_csv(csv_path)
+    assert len(rows) == n_rows + 1
+    assert list(rows[0].keys())[:3] == ["git_user", "agent_name", "benchmark"]
+
+    # the CSV changed outside of the store, e.g. git pull
+    time.sleep(0.01)
+    with open(csv_path, "a", newline="") as f:
+        csv.DictWriter(f, fieldnames=list(rows[0].keys())).writerow(
+            {**rows[0], "agent_name": "pulled_agent"}
+        )
+    assert len(journal.query(agent_name="pulled_agent")) == 1
+    assert len(journal) == n_rows + 2
+
+
+def test_concurrent_appends(tmp_path):
+    csv_path = tmp_path / "journal.csv"
+    with Pool(4) as pool:
+        pool.starmap(_append_rows, [(csv_path, worker_id) for worker_id in range(4)])
+
+    assert len(JournalStore(csv_path)) == 20
+    rows = _read_csv(csv_path)
+    assert len(rows) == 20
+    assert {row["agent_name"] for row in rows} == {f"agent_{i}" for i in range(4)}
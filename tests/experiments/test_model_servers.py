@@ -0,0 +1,93 @@
+import time
+from dataclasses import dataclass
+
+import pytest
+
+from agentlab.experiments.model_servers import ModelServers, server_key
+
+
+@dataclass
+class FakeModelArgs:
+    model_name: str
+    delay: float = 0.0
+    n_probes_before_ready: int = 0
+    fail: bool = False
+
+    def __post_init__(self):
+        self.calls = []  # not a field, the server key stays the same
+
+    def server_ready(self):
+        self.calls.append("probe")
+        return self.calls.count("probe") > self.n_probes_before_ready
+
+
+@dataclass
+class FakeAgentArgs:
+    agent_name: str
+    chat_model_args: FakeModelArgs
+
+    def prepare(self):
+        model_args = self.chat_model_args
+        model_args.calls.append("prepare")
+        time.sleep(model_args.delay)
+        if model_args.fail:
+            raise RuntimeError(f"can't start {model_args.model_name}")
+
+    def close(self):
+        self.chat_model_args.calls.append("close")
+
+
+def test_servers_are_shared_between_agents():
+    model_args = FakeModelArgs("model_a")
+    agents = [FakeAgentArgs(f"agent_{i}", model_args) for i in range(5)]
+    assert len({server_key(agent) for agent in agents}) == 1
+
+    servers = ModelServers(probe_interval=0)
+    keys = servers.acquire(agents)
+    assert model_args.calls.count("prepare") == 1
+    assert servers.ref_count(agents[0]) == 5
+
+    servers.release(keys)
+    assert model_args.calls.count("close") == 1
+    assert len(servers) == 0
+
+
+def test_close_after_last_release():
+    model_args = FakeModelArgs("model_a")
+    servers = ModelServers(probe_interval=0)
+    keys_1 = servers.acquire([FakeAgentArgs("agent_1", model_args)])
+    keys_2 = servers.acquire([FakeAgentArgs("agent_2", model_args)])
+    assert model_args.calls.count("prepare") == 1
+
+    servers.release(keys_1)
+    assert "close" not in model_args.calls
+    servers.release(keys_2)
+    assert model_args.calls.count("close") == 1
+
+
+def test_servers_are_prepared_concurrently():
+    agents = [FakeAgentArgs(f"agent_{i}", FakeModelArgs(f"model_{i}", delay=0.5)) for i in range(4)]
+    servers = ModelServers(probe_interval=0)
+    start = time.time()
+    keys = servers.acquire(agents)
+    assert time.time() - start < 1.5
+    assert len(servers) == 4
+    servers.release(keys)
+
+
+def test_readiness_probe():
+    model_args = FakeModelArgs("model_a", n_probes_before_ready=3)
+    servers = ModelServers(probe_interval=0.01)
+    keys = servers.acquire([FakeAgentArgs("agent", model_args)])
+    assert model_args.calls.count("probe") == 4
+    servers.release(keys)
+
+
+def test_failed_preparation_releases_servers():
+    ok_model, failing_model = FakeModelArgs("ok"), FakeModelArgs("failing", fail=True)
+    agents = [FakeAgentArgs("agent_1", ok_model), FakeAgentArgs("agent_2", failing_model)]
+    servers = ModelServers(probe_interval=0)
+    with pytest.raises(RuntimeError):
+        servers.acquire(agents)
+    assert len(servers) == 0
+    assert ok_model.calls.count("close") == 1
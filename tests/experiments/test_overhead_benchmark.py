@@ -0,0 +1,39 @@
+import pandas as pd
+
+from agentlab.experiments.overhead_benchmark import (
+    compare_results,
+    load_results,
+    make_exp_args_list,
+    measure_overhead,
+    save_results,
+)
+
+
+def test_dependency_chains():
+    exp_args_list = make_exp_args_list(6, dependencies=True, n_chains=2)
+    assert [e.depends_on for e in exp_args_list[:2]] == [(), ()]
+    assert exp_args_list[4].depends_on == (exp_args_list[2].exp_id,)
+
+
+def test_measure_overhead(tmp_path):
+    record = measure_overhead("sequential", 3, n_jobs=1, n_steps=2)
+    assert record["n_errors"] == 0
+    assert record["wall_s"] > record["episode_s"] > 0
+    assert record["overhead_per_episode_ms"] > 0
+
+    path = tmp_path / "overhead.json"
+    save_results(pd.DataFrame([record]), path)
+    assert load_results(path).iloc[0]["n_experiments"] == 3
+
+
+def test_compare_results():
+    keys = {"backend": "ray", "dependencies": False, "n_jobs": 4}
+    baseline = pd.DataFrame(
+        [
+            {**keys, "n_experiments": 10, "overhead_per_episode_ms": 10.0},
+            {**keys, "n_experiments": 100, "overhead_per_episode_ms": 10.0},
+        ]
+    )
+    current = baseline.assign(overhead_per_episode_ms=[11.0, 15.0])
+    comparison = compare_results(baseline, current, threshold=1.2)
+    assert comparison["regression"].tolist() == [False, True]
@@ -1,12 +1,58 @@
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
 import bgym
 import pytest
 import ray
-from agentlab.experiments.graph_execution_ray import execute_task_graph
+from agentlab.experiments.adaptive_concurrency import AdaptiveConcurrency
+from agentlab.experiments.graph_execution_ray import (
+    SpeculativeExecution,
+    _hide_attempt,
+    _make_duplicate,
+    execute_task_graph,
+)
 from agentlab.experiments.exp_utils import MockedExpArgs, add_dependencies
 
 TASK_TIME = 3
 
 
+class StragglerExpArgs(MockedExpArgs):
+    """The first attempt hangs, duplicates run normally."""
+
+    def run(self):
+        if getattr(self, "speculative_attempt", 0) == 0:
+            self.task_time = 60
+        return super().run()
+
+
+class CrashingDuplicateExpArgs(MockedExpArgs):
+    """The first attempt is slow, duplicates crash right away and save their error."""
+
+    def prepare(self, exp_root):
+        attempt = getattr(self, "speculative_attempt", 0)
+        self.exp_dir = Path(exp_root) / f"{self.exp_name}_{attempt}"
+        self.exp_dir.mkdir()
+
+    def run(self):
+        crashed = getattr(self, "speculative_attempt", 0) > 0
+        self.task_time = 0 if crashed else 15
+        result = super().run()
+        # like ExpArgs.run, which catches the errors of the episode
+        summary_info = {
+            "err_msg": "Exception uncaught by agent or environment" if crashed else None
+        }
+        with open(self.exp_dir / "summary_info.json", "w") as f:
+            json.dump(summary_info, f)
+        return result
+
+
+# ray workers can't import the test module, send the class by value
+ray.cloudpickle.register_pickle_by_value(sys.modules[__name__])
+
+
 def test_execute_task_graph():
     # Define a list of ExpArgs with dependencies
     exp_args_list = [
@@ -40,6 +86,135 @@ def test_execute_task_graph():
     )  # Since the critical path involves at least 1.5 seconds of work
 
 
+def test_speculative_execution():
+    exp_args_list = [MockedExpArgs(exp_id=f"task{i}", task_time=1) for i in range(6)]
+    exp_args_list.append(StragglerExpArgs(exp_id="straggler", task_time=1))
+
+    ray.init(num_cpus=4)
+    try:
+        results = execute_task_graph(
+            exp_args_list,
+            avg_step_timeout=10,
+            speculative_execution=True,
+            task_durations={None: [1] * 5},
+        )
+    finally:
+        ray.shutdown()
+
+    straggler = results["straggler"]
+    assert getattr(straggler, "speculative_attempt", 0) == 1
+    assert straggler.end_time - straggler.start_time < 10
+
+
+def test_failed_duplicate_does_not_win():
+    exp_args = CrashingDuplicateExpArgs(exp_id="slow")
+
+    ray.init(num_cpus=4)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            exp_args.prepare(exp_root=tmp_dir)
+            results = execute_task_graph(
+                [exp_args],
+                avg_step_timeout=10,
+                speculative_execution=True,
+                task_durations={None: [1] * 5},
+            )
+            visible = [d.name for d in Path(tmp_dir).iterdir() if not d.name.startswith("_")]
+            hidden = [d.name for d in Path(tmp_dir).iterdir() if d.name.startswith("_")]
+    finally:
+        ray.shutdown()
+
+    # the duplicate crashed first, the original attempt kept running and was kept
+    assert getattr(results["slow"], "speculative_attempt", 0) == 0
+    assert results["slow"].end_time - results["slow"].start_time >= 15
+    assert visible == ["exp_slow_0"]
+    assert hidden == ["_exp_slow_1"]
+
+
+def test_adaptive_concurrency():
+    exp_args_list = [MockedExpArgs(exp_id=f"task{i}", task_time=1) for i in range(5)]
+    exp_args_list.append(MockedExpArgs(exp_id="task5", depends_on=["task0"], task_time=1))
+    concurrency = AdaptiveConcurrency(min_jobs=1, max_jobs=2, initial_jobs=2, poll_interval=0.2)
+
+    ray.init(num_cpus=4)
+    try:
+        results = execute_task_graph(exp_args_list, concurrency=concurrency)
+    finally:
+        ray.shutdown()
+
+    assert len(results) == 6
+    assert results["task0"].end_time < results["task5"].start_time
+
+    # no more than 2 tasks running at the same time, although 4 cpus are available
+    for exp_args in results.values():
+        n_overlapping = sum(
+            other.start_time < exp_args.start_time < other.end_time for other in results.values()
+        )
+        assert n_overlapping <= 1
+    assert len(concurrency.history) > 0
+
+
+def test_last_dispatched_task_is_timed_out():
+    # the hanging task is dispatched when the first one finishes, by the last dispatcher update
+    exp_args_list = [
+        MockedExpArgs(exp_id="task0", task_time=1),
+        MockedExpArgs(exp_id="hanging", task_time=300),
+    ]
+    for exp_args in exp_args_list:
+        exp_args.episode_timeout = 3
+    concurrency = AdaptiveConcurrency(min_jobs=1, max_jobs=1, poll_interval=0.2)
+
+    ray.init(num_cpus=2)
+    try:
+        start = time.time()
+        results = execute_task_graph(
+            exp_args_list, avg_step_timeout=1, concurrency=concurrency, kill_grace=1
+        )
+        elapsed = time.time() - start
+    finally:
+        ray.shutdown()
+
+    assert results["task0"].end_time is not None
+    # the hanging task was cancelled (force-killed 1s after its timeout) instead of waited on
+    assert isinstance(results["hanging"], Exception)
+    assert elapsed < 45
+
+
+def test_speculative_candidates_and_threshold():
+    exp_args_list = [
+        MockedExpArgs(exp_id="task1"),
+        MockedExpArgs(exp_id="task2", depends_on=["task1"]),
+        MockedExpArgs(exp_id="task3"),
+    ]
+    speculator = SpeculativeExecution(exp_args_list, min_history=3, slack=2)
+
+    # only task3 has no dependencies and no dependents
+    assert speculator.candidates == {"task3"}
+
+    assert speculator.straggler_threshold(exp_args_list[2]) is None
+    speculator.observed_durations = [1, 2, 10]
+    assert speculator.straggler_threshold(exp_args_list[2]) == pytest.approx(2 * 8.4)
+
+
+def test_speculative_directories():
+    exp_args = bgym.ExpArgs(
+        agent_args=None, env_args=bgym.EnvArgs(task_name="miniwob.click-test", task_seed=0)
+    )
+    exp_args.exp_name = "test_exp"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        exp_args.prepare(exp_root=tmp_dir)
+        duplicate_args = _make_duplicate(exp_args)
+
+        assert duplicate_args.exp_id == exp_args.exp_id
+        assert duplicate_args.exp_dir != exp_args.exp_dir
+        assert exp_args.exp_dir.exists() and duplicate_args.exp_dir.exists()
+
+        _hide_attempt(exp_args)
+        visible = [d.name for d in Path(tmp_dir).iterdir() if not d.name.startswith("_")]
+        assert visible == [duplicate_args.exp_dir.name]
+
+
 def test_add_dependencies():
     # Prepare a simple list of ExpArgs
 
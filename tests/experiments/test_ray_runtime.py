@@ -0,0 +1,98 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+import ray
+from ray.util import placement_group_table
+
+from agentlab.experiments.exp_utils import MockedExpArgs
+from agentlab.experiments.launch_exp import run_experiments
+from agentlab.experiments.ray_runtime import RayRuntime
+from agentlab.experiments.study import _shared_ray_runtime
+
+
+def _overlaps(results) -> int:
+    """Maximum number of tasks running at the start of another one."""
+    return max(
+        sum(other.start_time < exp_args.start_time < other.end_time for other in results)
+        for exp_args in results
+    )
+
+
+def _connect(runtime: RayRuntime):
+    """Run a worker on the runtime, returns the address and CPUs of the cluster it joined."""
+    runtime.start(n_jobs=1)
+    try:
+        return ray.get_runtime_context().gcs_address, ray.cluster_resources()["CPU"]
+    finally:
+        runtime.stop()
+
+
+def test_runtime_is_kept_across_runs(tmp_path):
+    runtime = RayRuntime(num_cpus=4)
+    try:
+        exp_args_list = [MockedExpArgs(exp_id=f"task{i}", task_time=1) for i in range(4)]
+        run_experiments(2, exp_args_list, tmp_path, parallel_backend="ray", ray_runtime=runtime)
+        assert ray.is_initialized()
+        address = ray.get_runtime_context().gcs_address
+
+        run_experiments(2, exp_args_list, tmp_path, parallel_backend="ray", ray_runtime=runtime)
+        assert ray.get_runtime_context().gcs_address == address
+
+        # reservations are released at the end of each run
+        assert all(pg["state"] == "REMOVED" for pg in placement_group_table().values())
+    finally:
+        runtime.shutdown()
+    assert not ray.is_initialized()
+
+
+def test_reservation_limits_concurrency():
+    from agentlab.experiments.graph_execution_ray import execute_task_graph
+
+    runtime = RayRuntime(num_cpus=4)
+    runtime.start(n_jobs=2)
+    try:
+        with runtime.reserve(2) as (task_options, max_running):
+            assert max_running == 2
+            exp_args_list = [MockedExpArgs(exp_id=f"task{i}", task_time=1) for i in range(4)]
+            results = execute_task_graph(exp_args_list, task_options=task_options)
+        assert _overlaps(list(results.values())) <= 1
+
+        # a local runtime can't grow, reservations are capped to its CPUs
+        with runtime.reserve(8) as (_, max_running):
+            assert max_running == 4
+
+        # a second run waits for the resources held by the first one
+        with runtime.reserve(3):
+            runtime.reservation_timeout = 1
+            with pytest.raises(TimeoutError):
+                with runtime.reserve(2):
+                    pass
+    finally:
+        runtime.shutdown()
+
+
+def test_external_runtime_is_not_shut_down():
+    ray.init(num_cpus=2)
+    try:
+        runtime = RayRuntime(keep_alive=False)
+        runtime.start(n_jobs=2)
+        runtime.stop()
+        assert ray.is_initialized()
+    finally:
+        ray.shutdown()
+
+
+def test_parallel_studies_share_one_local_runtime():
+    runtime = RayRuntime(num_cpus=2, keep_alive=False)
+    studies = [SimpleNamespace(ray_runtime=runtime), SimpleNamespace(ray_runtime=None)]
+    with _shared_ray_runtime(studies, None, 4, "ray") as worker_runtime:
+        address = ray.get_runtime_context().gcs_address
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=2, mp_context=ctx) as executor:
+            futures = [executor.submit(_connect, worker_runtime) for _ in range(2)]
+            # the workers join the runtime of the main process instead of starting their own
+            assert [f.result() for f in futures] == [(address, 2)] * 2
+        assert ray.is_initialized()
+    assert not ray.is_initialized()
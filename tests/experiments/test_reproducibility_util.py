@@ -2,6 +2,7 @@ import json
 import tempfile
 import time
 from pathlib import Path
+from types import SimpleNamespace
 
 import bgym
 import pytest
@@ -38,6 +39,93 @@ def test_get_reproducibility_info(benchmark_name):
     assert "browsergym__local_modifications" in info
 
 
+def _make_repo(tmp_path: Path):
+    """A git repository containing a package, and the package as a module-like object."""
+    from git import Repo
+
+    repo = Repo.init(tmp_path)
+    package_dir = tmp_path / "pkg"
+    package_dir.mkdir()
+    (package_dir / "__init__.py").write_text("x = 1\n")
+    repo.index.add(["pkg/__init__.py"])
+    repo.index.commit("initial commit")
+    return SimpleNamespace(__file__=str(package_dir / "__init__.py"))
+
+
+def test_git_info_cache(tmp_path, monkeypatch):
+    module = _make_repo(tmp_path)
+    reproducibility_util.clear_cache()
+    n_reads = []
+    read_git_info = reproducibility_util._read_git_info
+
+    def counting_read_git_info(*args, **kwargs):
+        n_reads.append(1)
+        return read_git_info(*args, **kwargs)
+
+    monkeypatch.setattr(reproducibility_util, "_read_git_info", counting_read_git_info)
+
+    git_hash, modified_files = reproducibility_util._get_git_info(module)
+    assert git_hash is not None and modified_files == []
+    assert reproducibility_util._get_git_info(module) == (git_hash, modified_files)
+    assert len(n_reads) == 1
+
+    # modifying a tracked file invalidates the cache
+    time.sleep(0.01)
+    (tmp_path / "pkg" / "__init__.py").write_text("x = 2\n")
+    _, modified_files = reproducibility_util._get_git_info(module)
+    assert len(n_reads) == 2
+    assert [str(file) for _, file in modified_files] == ["pkg/__init__.py"]
+
+    # the cache can be reused by another process
+    snapshot = reproducibility_util.cache_snapshot()
+    reproducibility_util.clear_cache()
+    reproducibility_util.load_cache(snapshot)
+    reproducibility_util._get_git_info(module)
+    assert len(n_reads) == 2
+
+
+def test_git_info_cache_untracked_dir(tmp_path):
+    module = _make_repo(tmp_path)
+    reproducibility_util.clear_cache()
+    (tmp_path / "scripts" / "exp").mkdir(parents=True)
+    (tmp_path / "scripts" / "exp" / "a.py").write_text("")
+    _, modified_files = reproducibility_util._get_git_info(module)
+    assert [str(file) for _, file in modified_files] == ["scripts/exp/a.py"]
+
+    # a new file in a directory that is not tracked invalidates the cache
+    time.sleep(0.01)
+    (tmp_path / "scripts" / "exp" / "b.py").write_text("")
+    _, modified_files = reproducibility_util._get_git_info(module)
+    assert sorted(str(file) for _, file in modified_files) == [
+        "scripts/exp/a.py",
+        "scripts/exp/b.py",
+    ]
+
+    time.sleep(0.01)
+    (tmp_path / "scripts" / "other").mkdir()
+    (tmp_path / "scripts" / "other" / "c.py").write_text("")
+    _, modified_files = reproducibility_util._get_git_info(module)
+    assert "scripts/other/c.py" in {str(file) for _, file in modified_files}
+
+
+def test_git_info_ignore_paths(tmp_path):
+    module = _make_repo(tmp_path)
+    reproducibility_util.clear_cache()
+    (tmp_path / "results" / "study").mkdir(parents=True)
+    (tmp_path / "results" / "study" / "summary_info.json").write_text("{}")
+    (tmp_path / "pkg" / "new_module.py").write_text("")
+
+    _, modified_files = reproducibility_util._get_git_info(module)
+    assert {str(file) for _, file in modified_files} == {
+        "pkg/new_module.py",
+        "results/study/summary_info.json",
+    }
+
+    for ignore_paths in (["results"], [tmp_path / "results"]):
+        _, modified_files = reproducibility_util._get_git_info(module, ignore_paths=ignore_paths)
+        assert modified_files == [("??", Path("pkg/new_module.py"))]
+
+
 # def test_save_reproducibility_info():
 #     with tempfile.TemporaryDirectory() as tmp_dir:
 #         tmp_dir = Path(tmp_dir)
@@ -0,0 +1,127 @@
+import copy
+import json
+import shutil
+from pathlib import Path
+
+from browsergym.experiments.loop import yield_all_exp_results
+
+from agentlab.experiments.launch_exp import find_incomplete
+from agentlab.experiments.result_reuse import (
+    REUSED_FROM_FILE_NAME,
+    EpisodeIndex,
+    agent_hash,
+    code_hash,
+    env_hash,
+    episode_key,
+    register_completed_episodes,
+    reuse_completed_episodes,
+)
+
+TEST_STUDY_DIR = Path(__file__).parent.parent / "data" / "test_study"
+
+REPRO_INFO = {
+    "agentlab_version": "0.3.2",
+    "agentlab_git_hash": "abc",
+    "agentlab__local_modifications": "",
+    "browsergym_version": "0.10.0",
+    "browsergym_git_hash": "def",
+    "browsergym__local_modifications": "",
+    "benchmark_version": "1.0",
+    "date": "2024-08-01_10-20-52",
+}
+
+
+def _make_finished_study(tmp_path: Path) -> Path:
+    """Copy the test study and mark all its episodes as done."""
+    study_dir = tmp_path / "old_study"
+    shutil.copytree(TEST_STUDY_DIR, study_dir)
+    for exp_dir in study_dir.iterdir():
+        summary_info = {"n_steps": 3, "cum_reward": 1.0, "terminated": True, "err_msg": None}
+        (exp_dir / "summary_info.json").write_text(json.dumps(summary_info))
+    return study_dir
+
+
+def _fresh_exp_args(study_dir: Path):
+    """Unprepared copies of the experiments of a study, as make_study would create them."""
+    exp_args_list = []
+    for exp_result in yield_all_exp_results(study_dir, progress_fn=None):
+        exp_args = copy.deepcopy(exp_result.exp_args)
+        exp_args.exp_dir = None
+        exp_args.exp_id = None
+        exp_args.exp_name = None
+        exp_args_list.append(exp_args)
+    return exp_args_list
+
+
+def test_hashes():
+    exp_args = _fresh_exp_args(TEST_STUDY_DIR)[0]
+
+    agent_args = copy.deepcopy(exp_args.agent_args)
+    agent_args.agent_name = "renamed"
+    assert agent_hash(agent_args) == agent_hash(exp_args.agent_args)
+    agent_args.flags.use_thinking = not agent_args.flags.use_thinking
+    assert agent_hash(agent_args) != agent_hash(exp_args.agent_args)
+    agent_args = copy.deepcopy(exp_args.agent_args)
+    agent_args.chat_model_args.temperature += 0.1
+    assert agent_hash(agent_args) != agent_hash(exp_args.agent_args)
+
+    env_args = copy.deepcopy(exp_args.env_args)
+    env_args.headless = not env_args.headless
+    assert env_hash(env_args) == env_hash(exp_args.env_args)
+    env_args.task_seed += 1
+    assert env_hash(env_args) != env_hash(exp_args.env_args)
+
+    assert code_hash(REPRO_INFO) != code_hash({**REPRO_INFO, "agentlab_git_hash": "xyz"})
+    assert code_hash(REPRO_INFO) == code_hash({**REPRO_INFO, "date": "2025-01-01_00-00-00"})
+    assert code_hash({**REPRO_INFO, "agentlab__local_modifications": "  M: main.py"}) is None
+
+    assert episode_key(exp_args, REPRO_INFO) is not None
+    exp_args.env_args.task_seed = None
+    assert episode_key(exp_args, REPRO_INFO) is None
+
+
+def test_register_and_reuse(tmp_path):
+    old_study_dir = _make_finished_study(tmp_path)
+    index = EpisodeIndex(tmp_path / "index.sqlite")
+    assert register_completed_episodes(old_study_dir, REPRO_INFO, index=index) == 2
+    assert len(index) == 2
+
+    # different code version, nothing to reuse
+    exp_args_list = _fresh_exp_args(old_study_dir)
+    new_study_dir = tmp_path / "new_study"
+    other_code = {**REPRO_INFO, "browsergym_git_hash": "xyz"}
+    assert reuse_completed_episodes(exp_args_list, other_code, new_study_dir, index=index) == 0
+    assert not any(getattr(exp_args, "is_dummy", False) for exp_args in exp_args_list)
+
+    assert reuse_completed_episodes(exp_args_list, REPRO_INFO, new_study_dir, index=index) == 2
+    for exp_args in exp_args_list:
+        assert exp_args.is_dummy
+        assert (exp_args.exp_dir / "summary_info.json").exists()
+        source_dir = Path((exp_args.exp_dir / REUSED_FROM_FILE_NAME).read_text())
+        assert source_dir.parent == old_study_dir.resolve()
+
+    # the reused episodes have their own exp_args and are seen as completed when relaunching
+    relaunched = find_incomplete(new_study_dir)
+    assert all(exp_args.is_dummy for exp_args in relaunched)
+    assert {exp_args.exp_id for exp_args in relaunched} == {
+        exp_args.exp_id for exp_args in exp_args_list
+    }
+
+
+def test_deleted_episodes_are_not_reused(tmp_path):
+    old_study_dir = _make_finished_study(tmp_path)
+    index = EpisodeIndex(tmp_path / "index.sqlite")
+    register_completed_episodes(old_study_dir, REPRO_INFO, index=index)
+    shutil.rmtree(old_study_dir)
+
+    exp_args_list = _fresh_exp_args(TEST_STUDY_DIR)
+    assert reuse_completed_episodes(exp_args_list, REPRO_INFO, tmp_path / "new", index=index) == 0
+    assert len(index) == 0
+
+
+def test_local_modifications_disable_reuse(tmp_path):
+    old_study_dir = _make_finished_study(tmp_path)
+    index = EpisodeIndex(tmp_path / "index.sqlite")
+    modified = {**REPRO_INFO, "agentlab__local_modifications": "  M: agent.py"}
+    assert register_completed_episodes(old_study_dir, modified, index=index) == 0
+    assert len(index) == 0
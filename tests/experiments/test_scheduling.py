@@ -0,0 +1,101 @@
+from pathlib import Path
+
+import bgym
+import pytest
+
+from agentlab.experiments.scheduling import (
+    DEFAULT_STEP_DURATION,
+    estimate_makespan,
+    expected_durations,
+    load_task_durations,
+    order_longest_first,
+    schedule_longest_first,
+)
+
+TEST_STUDY_DIR = Path(__file__).parent.parent / "data" / "test_study"
+
+
+def make_exp_args(task_name, max_steps=10, depends_on=()):
+    exp_args = bgym.ExpArgs(
+        agent_args=None, env_args=bgym.EnvArgs(task_name=task_name, max_steps=max_steps)
+    )
+    exp_args.exp_id = task_name
+    exp_args.depends_on = tuple(depends_on)
+    return exp_args
+
+
+def test_load_task_durations():
+    task_durations = load_task_durations(TEST_STUDY_DIR)
+
+    # one of the 2 episodes has no agent stats and is skipped
+    assert list(task_durations.keys()) == ["miniwob.ascending-numbers"]
+    assert len(task_durations["miniwob.ascending-numbers"]) == 1
+    assert task_durations["miniwob.ascending-numbers"][0] > 0
+
+
+def test_expected_durations_fallback():
+    exp_args_list = [make_exp_args("a", max_steps=5), make_exp_args("b", max_steps=20)]
+
+    assert expected_durations(exp_args_list) == [
+        5 * DEFAULT_STEP_DURATION,
+        20 * DEFAULT_STEP_DURATION,
+    ]
+
+    # history of "a" gives 2s per step for "b"
+    durations = expected_durations(exp_args_list, {"a": [8, 10, 12]})
+    assert durations == [10, 40]
+
+    exp_args_list[1].is_dummy = True
+    assert expected_durations(exp_args_list, {"a": [8, 10, 12]}) == [10, 0]
+
+
+def test_order_longest_first():
+    exp_args_list = [make_exp_args(name) for name in "abcd"]
+    ordered = order_longest_first(exp_args_list, [1, 3, 2, 3])
+    assert [exp_args.exp_id for exp_args in ordered] == ["b", "d", "c", "a"]
+
+
+def test_order_longest_first_respects_dependencies():
+    exp_args_list = [
+        make_exp_args("a"),
+        make_exp_args("b", depends_on=["a"]),
+        make_exp_args("c"),
+        make_exp_args("d", depends_on=["b", "c"]),
+    ]
+    ordered = order_longest_first(exp_args_list, [1, 10, 5, 100])
+    assert [exp_args.exp_id for exp_args in ordered] == ["c", "a", "b", "d"]
+
+    exp_args_list[0].depends_on = ("d",)
+    with pytest.raises(ValueError):
+        order_longest_first(exp_args_list, [1, 10, 5, 100])
+
+
+def test_estimate_makespan():
+    exp_args_list = [make_exp_args(name) for name in "abcde"]
+    durations = [1, 1, 1, 1, 4]
+
+    assert estimate_makespan(exp_args_list, durations, n_jobs=1) == 8
+    # list order leaves the long task for the end
+    assert estimate_makespan(exp_args_list, durations, n_jobs=2) == 6
+
+    ordered, makespan = schedule_longest_first(
+        exp_args_list, n_jobs=2, task_durations={"e": [4], "a": [1], "b": [1], "c": [1], "d": [1]}
+    )
+    assert ordered[0].exp_id == "e"
+    assert makespan == 4
+
+
+def test_estimate_makespan_with_dependencies():
+    exp_args_list = [
+        make_exp_args("a"),
+        make_exp_args("b", depends_on=["a"]),
+        make_exp_args("c"),
+    ]
+    assert estimate_makespan(exp_args_list, [2, 2, 1], n_jobs=4) == 4
+
+    # a dependent listed before its dependency still waits for it
+    assert estimate_makespan(exp_args_list[::-1], [1, 2, 2], n_jobs=4) == 4
+
+
+if __name__ == "__main__":
+    test_estimate_makespan()
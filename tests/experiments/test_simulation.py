@@ -0,0 +1,89 @@
+from pathlib import Path
+
+import pytest
+
+from agentlab.experiments.simulation import (
+    SimulatedTask,
+    compare_policies,
+    load_study_trace,
+    make_mocked_exp_args,
+    replay,
+    simulate,
+)
+
+TEST_STUDY_DIR = Path(__file__).parent.parent / "data" / "test_study"
+
+
+def _chain_and_singles():
+    # a chain a -> b -> c of 1s tasks submitted last, and 3 independent tasks of 2s
+    return [
+        SimulatedTask("x", 2),
+        SimulatedTask("y", 2),
+        SimulatedTask("z", 2),
+        SimulatedTask("a", 1),
+        SimulatedTask("b", 1, depends_on=("a",)),
+        SimulatedTask("c", 1, depends_on=("b",)),
+    ]
+
+
+def test_simulate_policies():
+    tasks = _chain_and_singles()
+
+    ray_result = simulate(tasks, n_jobs=2, policy="ray")
+    assert ray_result.makespan == 5
+
+    # the chain starts first and runs alongside the independent tasks
+    cp_result = simulate(tasks, n_jobs=2, policy="critical_path")
+    assert cp_result.makespan == 5
+    assert cp_result.schedule.set_index("exp_id").loc["a", "start"] == 0
+
+    lpt_result = simulate(tasks, n_jobs=2, policy="lpt")
+    assert lpt_result.schedule.set_index("exp_id").loc["x", "start"] == 0
+
+    no_deps = simulate(tasks, n_jobs=3, policy="ray", ignore_dependencies=True)
+    assert no_deps.makespan == 3
+    assert no_deps.utilization == pytest.approx(9 / 9)
+
+    with pytest.raises(ValueError):
+        simulate(tasks, n_jobs=2, policy="unknown")
+
+
+def test_simulate_schedule_and_timeline():
+    tasks = _chain_and_singles()
+    result = simulate(tasks, n_jobs=1)
+
+    assert result.makespan == 9
+    assert result.utilization == 1
+    assert len(result.schedule) == len(tasks)
+    assert (result.schedule["start"] >= result.schedule["ready"]).all()
+    schedule = result.schedule.set_index("exp_id")
+    assert schedule.loc["b", "ready"] == schedule.loc["a", "end"]
+
+    timeline = result.timeline
+    assert timeline["n_running"].max() == 1
+    assert timeline["n_queued"].iloc[0] == 3
+    assert timeline["time"].iloc[-1] == 9
+
+
+def test_compare_policies():
+    df = compare_policies(_chain_and_singles(), n_jobs_list=[1, 2])
+    assert len(df) == 2 * 3 * 2
+    assert df.loc[(1, "ray", False), "makespan_h"] == pytest.approx(9 / 3600)
+
+
+def test_load_study_trace():
+    tasks = load_study_trace(TEST_STUDY_DIR)
+    assert len(tasks) == 2
+    # one episode has no agent stats and gets the median duration of the others
+    assert tasks[0].duration == tasks[1].duration > 0
+    assert all(task.name == "miniwob.ascending-numbers" for task in tasks)
+
+
+def test_replay_sequential():
+    tasks = _chain_and_singles()
+    exp_args_list = make_mocked_exp_args(tasks, time_scale=0.01)
+    assert exp_args_list[4].depends_on == ["a"]
+    assert exp_args_list[0].task_time == pytest.approx(0.02)
+
+    makespan = replay(tasks, n_jobs=1, parallel_backend="sequential", time_scale=0.01)
+    assert makespan >= simulate(tasks, n_jobs=1).makespan
@@ -0,0 +1,152 @@
+import json
+import time
+from dataclasses import dataclass
+
+import bgym
+import pytest
+
+from agentlab.agents.agent_args import AgentArgs
+from agentlab.experiments.exp_utils import run_exp
+from agentlab.experiments.step_watchdog import StepDeadlines, StepTimeoutError, StepWatchdog
+
+
+class FakeChat:
+    def add_message(self, role, msg):
+        pass
+
+
+class FakeActionSet:
+    def to_python_code(self, action):
+        return action
+
+
+class FakeEnv:
+    """Mimics the structure of browsergym's BrowserEnv.step."""
+
+    def __init__(self, action_time=0.0, n_steps=3):
+        self.chat = FakeChat()
+        self.action_time = action_time
+        self.n_steps = n_steps
+        self.step_count = 0
+
+    @property
+    def unwrapped(self):
+        return self
+
+    def reset(self, seed=None):
+        return {"step": 0}, {}
+
+    def pre_step(self):
+        return {"action_exec_start": time.time(), "action_exec_timeout": 0}
+
+    def post_step(self, info):
+        info["action_exec_stop"] = time.time()
+        self.step_count += 1
+        return {"step": self.step_count}, 0.0, self.step_count >= self.n_steps, False, info
+
+    def step(self, action):
+        info = self.pre_step()
+        try:
+            time.sleep(self.action_time)
+        except Exception:  # browsergym stores action errors instead of raising
+            pass
+        return self.post_step(info)
+
+    def close(self):
+        pass
+
+
+class FakeAgent:
+    action_set = FakeActionSet()
+    obs_preprocessor = None
+
+    def __init__(self, action_delay=0.0):
+        self.action_delay = action_delay
+
+    def get_action(self, obs):
+        for _ in range(3):
+            try:  # retry loops catching everything should not defeat the deadline
+                time.sleep(self.action_delay)
+                break
+            except Exception:
+                pass
+        return "noop()", {}
+
+
+@dataclass
+class FakeAgentArgs(AgentArgs):
+    action_delay: float = 0.0
+
+    def make_agent(self):
+        return FakeAgent(self.action_delay)
+
+
+@dataclass
+class FakeEnvArgs(bgym.EnvArgs):
+    action_time: float = 0.0
+
+    def make_env(self, action_mapping, exp_dir, exp_task_kwargs: dict = {}):
+        return FakeEnv(self.action_time)
+
+
+def _run(tmp_path, agent_args, env_args, deadlines):
+    exp_args = bgym.ExpArgs(agent_args=agent_args, env_args=env_args)
+    exp_args.save_screenshot = False
+    exp_args.save_som = False
+    exp_args.step_deadlines = deadlines
+    exp_args.prepare(tmp_path)
+
+    start = time.time()
+    run_exp(exp_args)
+    elapsed = time.time() - start
+
+    with open(exp_args.exp_dir / "summary_info.json") as f:
+        return json.load(f), elapsed, exp_args.exp_dir
+
+
+def test_no_timeout(tmp_path):
+    summary_info, _, _ = _run(
+        tmp_path,
+        FakeAgentArgs(agent_name="fake"),
+        FakeEnvArgs(task_name="fake_task", task_seed=0),
+        StepDeadlines(get_action=2, action_execution=2, env_step=2),
+    )
+    assert summary_info["err_msg"] is None
+    assert summary_info["terminated"]
+    assert "timeout" not in summary_info
+
+
+def test_action_execution_timeout(tmp_path):
+    summary_info, elapsed, exp_dir = _run(
+        tmp_path,
+        FakeAgentArgs(agent_name="fake"),
+        FakeEnvArgs(task_name="fake_task", task_seed=0, action_time=30),
+        StepDeadlines(get_action=5, action_execution=0.3, env_step=5, grace=0.1),
+    )
+    assert elapsed < 10
+    assert summary_info["timeout"] == "action_execution"
+    assert summary_info["timeout_step"] == 1
+    assert "StepTimeoutError" in summary_info["err_msg"]
+    assert (exp_dir / "step_0.pkl.gz").exists()
+
+
+def test_get_action_timeout_is_raised_again_if_swallowed(tmp_path):
+    summary_info, elapsed, _ = _run(
+        tmp_path,
+        FakeAgentArgs(agent_name="fake", action_delay=30),
+        FakeEnvArgs(task_name="fake_task", task_seed=0),
+        StepDeadlines(get_action=0.3, action_execution=5, env_step=5, grace=0.1),
+    )
+    assert elapsed < 10
+    assert summary_info["timeout"] == "get_action"
+    assert summary_info["n_steps"] == 0
+
+
+def test_nested_phases():
+    watchdog = StepWatchdog(StepDeadlines(get_action=None, action_execution=None, env_step=0.2))
+    with watchdog.installed():
+        with pytest.raises(StepTimeoutError) as error:
+            with watchdog.phase("env_step"):
+                with watchdog.phase("action_execution"):  # no deadline, env_step still applies
+                    time.sleep(5)
+    assert error.value.phase == "env_step"
@@ -0,0 +1,104 @@
+from dataclasses import dataclass
+
+import pandas as pd
+import pytest
+
+from agentlab.agents.agent_args import AgentArgs
+from agentlab.experiments import successive_halving
+from agentlab.experiments.successive_halving import (
+    SuccessiveHalving,
+    budget_report,
+    interleave_episodes,
+    leaderboard,
+    rung_sizes,
+    top_configs,
+)
+
+
+@dataclass
+class ConfigArgs(AgentArgs):
+    quality: float = 0.0
+
+    def make_agent(self):
+        raise NotImplementedError
+
+
+def _records(rewards: dict[int, list[float]], rung=0):
+    return pd.DataFrame(
+        [
+            dict(
+                config_id=config_id,
+                rung=rung,
+                task_name=f"task_{i}",
+                task_seed=0,
+                reward=reward,
+                status="done",
+                cost=0.1,
+            )
+            for config_id, config_rewards in rewards.items()
+            for i, reward in enumerate(config_rewards)
+        ],
+        columns=successive_halving.RECORD_COLUMNS,
+    )
+
+
+def test_rung_sizes():
+    assert rung_sizes(625, n_rungs=3, eta=3) == [70, 209, 625]
+    assert rung_sizes(4, n_rungs=3, eta=3) == [1, 2, 4]
+    assert rung_sizes(4, n_rungs=3, eta=3, min_episodes=2) == [2, 4]
+
+
+def test_interleave_episodes():
+    import bgym
+
+    env_args_list = bgym.DEFAULT_BENCHMARKS["miniwob"]().env_args_list
+    episodes = interleave_episodes(env_args_list, seed=0)
+    assert len(episodes) == len(env_args_list)
+
+    n_tasks = len({env_args.task_name for env_args in env_args_list})
+    assert len({env_args.task_name for env_args in episodes[:n_tasks]}) == n_tasks
+    assert interleave_episodes(env_args_list, seed=0) == episodes
+    assert interleave_episodes(env_args_list, seed=1) != episodes
+
+
+def test_top_configs_and_leaderboard():
+    records = _records({0: [0, 1], 1: [1, 1], 2: [0, 0], 3: [1, 1]})
+    assert top_configs(records, [0, 1, 2, 3], n_keep=2) == [1, 3]
+    assert top_configs(records, [0, 2], n_keep=1) == [0]
+
+    records = pd.concat([records, _records({1: [1, 0]}, rung=1)])
+    board = leaderboard(records, names={1: "best"})
+    assert board.index[0] == 1
+    assert board.loc[1, "agent_name"] == "best"
+    assert board.loc[1, "n_episodes"] == 4
+    assert board.loc[1, "mean_reward"] == pytest.approx(0.75)
+    assert list(board.index[1:]) == [3, 0, 2]
+
+    budget = budget_report(records, n_configs=4, n_episodes=10)
+    assert budget["episodes_run"] == 10
+    assert budget["saved_fraction"] == pytest.approx(0.75)
+    assert budget["cost_full"] == pytest.approx(4.0)
+
+
+def test_successive_halving(tmp_path, monkeypatch):
+    configs = [ConfigArgs(agent_name=f"config_{i}", quality=i / 10) for i in range(9)]
+    search = SuccessiveHalving(configs, "miniwob", eta=3, dir=tmp_path)
+    assert search.rung_sizes == [70, 209, 625]
+
+    def fake_run_rung(rung, config_ids, env_args_list, run_kwargs):
+        rewards = {i: [configs[i].quality] * len(env_args_list) for i in config_ids}
+        return _records(rewards, rung=rung)
+
+    monkeypatch.setattr(search, "_run_rung", fake_run_rung)
+    board = search.run(n_jobs=4)
+
+    assert search.promoted == [list(range(9)), [6, 7, 8], [8]]
+    assert board.index[0] == 8
+    assert board.loc[8, "n_episodes"] == 625
+    assert board.loc[0, "n_episodes"] == 70
+
+    budget = search.budget()
+    assert budget["episodes_run"] == 9 * 70 + 3 * (209 - 70) + (625 - 209)
+    assert budget["episodes_full"] == 9 * 625
+    assert (tmp_path / "leaderboard.csv").exists()
+    assert "saved" in search.report()
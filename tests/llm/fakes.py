@@ -0,0 +1,123 @@
+"""Fake clients of the chat completions API, to test the chat models without querying an API."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from agentlab.llm.chat_api import ChatModel
+
+
+def make_completion(
+    content, n=1, prompt_tokens=10, completion_tokens=2, cached_tokens=None
+) -> SimpleNamespace:
+    """A completion with n identical choices, shaped like the ones of the openai client."""
+    usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    if cached_tokens is not None:
+        usage.prompt_tokens_details = SimpleNamespace(cached_tokens=cached_tokens)
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(usage=usage, choices=[SimpleNamespace(message=message)] * n)
+
+
+class FakeClient:
+    """Answers with the content of the last message, or with a fixed answer.
+
+    Args:
+        answer: str
+            Content of the answers, the content of the last message if None.
+        errors: list[Exception]
+            Errors raised by the first queries, one per query.
+        delays: list[float]
+            Latency in seconds of the first queries, the last one is kept for the next queries.
+        prompt_tokens: int
+            Input tokens of each query.
+        completion_tokens: int
+            Output tokens of each query.
+        cached_tokens: int
+            Cached input tokens of each query, not reported if None.
+        is_async: bool
+            Whether `create` is a coroutine, like the one of `AsyncOpenAI`.
+    """
+
+    def __init__(
+        self,
+        answer=None,
+        errors=(),
+        delays=(0.0,),
+        prompt_tokens=10,
+        completion_tokens=2,
+        cached_tokens=None,
+        is_async=False,
+    ):
+        self.answer = answer
+        self.errors = list(errors)
+        self.delays = list(delays)
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+        self.n_calls = 0
+        self.n_chunks_sent = 0
+        create = self.acreate if is_async else self.create
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+    def create(self, model, messages, n, temperature, max_tokens, **stream_args):
+        time.sleep(self._next_delay())
+        return self._answer(messages, n, **stream_args)
+
+    async def acreate(self, model, messages, n, temperature, max_tokens, **stream_args):
+        await asyncio.sleep(self._next_delay())
+        return self._answer(messages, n, **stream_args)
+
+    def _next_delay(self) -> float:
+        self.n_calls += 1
+        if self.errors:
+            # failed queries are not delayed
+            return 0.0
+        return self.delays.pop(0) if len(self.delays) > 1 else self.delays[0]
+
+    def _answer(self, messages, n, stream=False, stream_options=None):
+        if self.errors:
+            raise self.errors.pop(0)
+        content = messages[-1]["content"] if self.answer is None else self.answer
+        if stream:
+            assert stream_options == {"include_usage": True}
+            return FakeStream(self, content)
+        return make_completion(
+            content, n, self.prompt_tokens, self.completion_tokens, self.cached_tokens
+        )
+
+
+class FakeStream:
+    """Streams an answer by chunks of 4 characters, with the usage in a last chunk."""
+
+    def __init__(self, client, content):
+        self.client = client
+        self.content = content
+        self.closed = False
+
+    def __iter__(self):
+        for i in range(0, len(self.content), 4):
+            self.client.n_chunks_sent += 1
+            delta = SimpleNamespace(content=self.content[i : i + 4])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        usage = SimpleNamespace(
+            prompt_tokens=self.client.prompt_tokens,
+            completion_tokens=self.client.completion_tokens,
+        )
+        yield SimpleNamespace(choices=[], usage=usage)
+
+    def close(self):
+        self.closed = True
+
+
+def make_model(client=None, async_client=None, model_name="fake", **kwargs) -> ChatModel:
+    """A ChatModel querying the given fake clients, with its own clients."""
+    return ChatModel(
+        model_name=model_name,
+        api_key="fake",
+        client_class=lambda api_key, **client_args: client,
+        async_client_class=(
+            None if async_client is None else lambda api_key, **client_args: async_client
+        ),
+        shared_client=False,
+        **kwargs,
+    )
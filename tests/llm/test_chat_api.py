@@ -1,14 +1,25 @@
+import asyncio
 import os
+import time
 
+import httpx
+import openai
 import pytest
 
+import agentlab.llm.tracking as tracking
+from agentlab.llm import chat_api, response_cache
+from agentlab.llm.base_api import AsyncChatModel
 from agentlab.llm.chat_api import (
     AzureModelArgs,
     OpenAIModelArgs,
+    RetryError,
+    make_assistant_message,
     make_system_message,
     make_user_message,
 )
 
+from fakes import FakeClient, make_model
+
 # TODO(optimass): figure out a good model for all tests
 
 
@@ -59,3 +70,108 @@ def test_api_model_args_openai():
     answer = model(messages)
 
     assert "5" in answer.get("content")
+
+
+def _make_fake_model(n_failures=0):
+    error = openai.APIConnectionError(request=httpx.Request("POST", "http://fake"))
+    client = FakeClient(errors=[error] * n_failures, delays=[0.2], is_async=True)
+    return make_model(async_client=client, min_retry_wait_time=0)
+
+
+def test_abatch_overlaps_queries():
+    model = _make_fake_model()
+    model.input_cost, model.output_cost = 0.01, 0.1
+    messages_list = [[make_user_message(f"prompt {i}")] for i in range(5)]
+
+    with tracking.set_tracker() as tracker:
+        start = time.time()
+        answers = asyncio.run(model.abatch(messages_list))
+        elapsed = time.time() - start
+
+    assert elapsed < 0.6
+    assert [answer["content"] for answer in answers] == [f"prompt {i}" for i in range(5)]
+    assert tracker.stats["input_tokens"] == 50
+    assert tracker.stats["output_tokens"] == 10
+    assert tracker.stats["cost"] == pytest.approx(5 * (10 * 0.01 + 2 * 0.1))
+
+    # a new event loop gets its own client
+    asyncio.run(model.acall([make_user_message("again")]))
+    assert len(model._async_clients) <= 1
+
+
+def test_acall_retries():
+    model = _make_fake_model(n_failures=2)
+    answer = asyncio.run(model.acall([make_user_message("hello")]))
+    assert answer["content"] == "hello"
+    assert model.get_stats()["n_retry_llm"] == 3
+
+    model = _make_fake_model(n_failures=4)
+    with pytest.raises(RetryError):
+        asyncio.run(model.acall([make_user_message("hello")]))
+
+
+def test_default_acall_runs_in_thread():
+    class SlowModel(AsyncChatModel):
+        def __call__(self, messages, n_samples=1):
+            time.sleep(0.2)
+            tracking.get_tracker()(1, 1, 1.0)
+            return make_assistant_message(messages[-1]["content"])
+
+    messages_list = [[make_user_message(f"prompt {i}")] for i in range(4)]
+    with tracking.set_tracker() as tracker:
+        start = time.time()
+        answers = asyncio.run(SlowModel().abatch(messages_list, max_concurrency=2))
+        elapsed = time.time() - start
+
+    assert 0.4 <= elapsed < 0.6
+    assert [answer["content"] for answer in answers] == [f"prompt {i}" for i in range(4)]
+    assert tracker.stats["cost"] == 4
+
+
+STREAMED_ANSWER = "<think>\nlet's click\n</think>\n<action>\nclick('12')\n</action>\nand more text"
+
+
+def test_streaming_stops_at_action(monkeypatch):
+    monkeypatch.setattr(chat_api, "estimate_tokens", lambda text, model: len(text.split()))
+    client = FakeClient(answer=STREAMED_ANSWER, prompt_tokens=7, completion_tokens=20)
+    model = make_model(client, stream=True)
+    messages = [make_system_message("system prompt"), make_user_message("click the button")]
+
+    with tracking.set_tracker() as tracker:
+        answer = model(messages, stop_tags=["think", "action"])
+
+    assert "</action>" in answer["content"] and "more text" not in answer["content"]
+    n_chunks = client.n_chunks_sent
+    assert n_chunks < len(STREAMED_ANSWER) / 4
+    # the usage of a stopped stream is estimated
+    assert tracker.stats["output_tokens"] == n_chunks
+    assert tracker.stats["input_tokens"] == 5
+
+    stats = model.get_stats()
+    assert stats["stream_stopped_early"] == 1
+    assert 0 <= stats["time_to_first_token"] <= stats["time_to_action"]
+
+    # without stop tags, the whole answer is received with its usage
+    with tracking.set_tracker() as tracker:
+        answer = model(messages)
+    assert answer["content"] == STREAMED_ANSWER
+    assert tracker.stats["output_tokens"] == 20
+    assert model.get_stats()["stream_stopped_early"] == 0
+
+
+def test_stopped_streams_are_cached_apart(tmp_path):
+    response_cache.enable_cache(tmp_path / "cache.sqlite")
+    try:
+        client = FakeClient(answer=STREAMED_ANSWER)
+        messages = [make_user_message("click the button")]
+        streamed_model = make_model(client, stream=True, temperature=0)
+        stopped = streamed_model(messages, stop_tags=["think", "action"])
+        full = make_model(client, temperature=0)(messages)
+        assert streamed_model(messages, stop_tags=["think", "action"]) == stopped
+    finally:
+        response_cache.disable_cache()
+
+    # the truncated answer is not returned to queries that were not stopped
+    assert "more text" not in stopped["content"]
+    assert full["content"] == STREAMED_ANSWER
+    assert client.n_calls == 2
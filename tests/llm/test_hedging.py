@@ -0,0 +1,153 @@
+import asyncio
+import pickle
+import time
+from dataclasses import dataclass
+
+import pytest
+
+import agentlab.llm.tracking as tracking
+from agentlab.experiments.args import config_hash
+from agentlab.llm import hedging
+from agentlab.llm.base_api import BaseModelArgs
+from agentlab.llm.chat_api import OpenAIModelArgs, make_user_message
+from agentlab.llm.hedging import HedgePolicy, LatencyHistogram, first_of
+
+from fakes import FakeClient, make_model
+
+
+@pytest.fixture(autouse=True)
+def hedge_states(monkeypatch):
+    monkeypatch.setattr(hedging, "_STATES", {})
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram(window=10)
+    assert histogram.quantile(0.9) is None
+    for latency in range(20):
+        histogram.add(latency)
+    # only the last 10 latencies are kept
+    assert len(histogram) == 10
+    assert histogram.quantile(0.0) == 10
+    assert histogram.quantile(1.0) == 19
+    assert histogram.quantile(0.5, min_samples=11) is None
+
+
+async def _answer(value, delay, cancelled=None):
+    try:
+        await asyncio.sleep(delay)
+    except asyncio.CancelledError:
+        if cancelled is not None:
+            cancelled.append(value)
+        raise
+    return value
+
+
+async def _fail(delay):
+    await asyncio.sleep(delay)
+    raise ValueError("failed")
+
+
+def test_first_of():
+    # fast enough, no duplicate
+    result = asyncio.run(first_of(_answer("primary", 0.01), 0.5, lambda: _answer("hedge", 0)))
+    assert result == ("primary", False, False)
+
+    # the duplicate wins and the primary is cancelled
+    cancelled = []
+    result = asyncio.run(
+        first_of(_answer("primary", 5, cancelled), 0.05, lambda: _answer("hedge", 0.01))
+    )
+    assert result == ("hedge", True, True)
+    assert cancelled == ["primary"]
+
+    # no budget for a duplicate
+    result = asyncio.run(first_of(_answer("primary", 0.1), 0.01, lambda: None))
+    assert result == ("primary", False, False)
+
+    # a failed duplicate doesn't fail the query
+    result = asyncio.run(first_of(_answer("primary", 0.1), 0.01, lambda: _fail(0)))
+    assert result == ("primary", True, False)
+
+    with pytest.raises(ValueError):
+        asyncio.run(first_of(_fail(0.05), 0.01, lambda: _fail(0)))
+
+
+def _make_model(hedge_policy, delays=(10, 0.01), model_name="hedged-model"):
+    # by default, the first query hangs and the next ones answer quickly
+    client = FakeClient(delays=delays, prompt_tokens=100, completion_tokens=10, is_async=True)
+    model = make_model(async_client=client, model_name=model_name, hedge_policy=hedge_policy)
+    model.input_cost, model.output_cost = 0.01, 0.1
+    return model, client
+
+
+def test_chat_model_hedges_slow_queries():
+    model, _ = _make_model(HedgePolicy(quantile=0.9, min_samples=5))
+    for _ in range(5):
+        hedging.record_latency("hedged-model", 0.05)
+
+    with tracking.set_tracker() as tracker:
+        start = time.time()
+        answer = model([make_user_message("hello")])
+        elapsed = time.time() - start
+
+    assert answer["content"] == "hello"
+    assert elapsed < 1
+    query_cost = 100 * 0.01 + 10 * 0.1
+    assert tracker.stats["hedges"] == 1
+    assert tracker.stats["hedge_cost"] == pytest.approx(100 * 0.01)
+    assert tracker.stats["cost"] == pytest.approx(query_cost + 100 * 0.01)
+    assert tracker.stats["input_tokens"] == 200
+
+
+def test_hedging_budget():
+    model, _ = _make_model(HedgePolicy(quantile=0.9, min_samples=5, max_extra_cost_ratio=0.0))
+    for _ in range(5):
+        hedging.record_latency("hedged-model", 0.05)
+    state = hedging.get_hedge_state("hedged-model")
+    state.tracker.record_hedge(1, 1.0)
+
+    # the extra spend is over budget, the slow query is not duplicated
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(model.acall([make_user_message("hi")]), 0.5))
+    assert state.tracker.hedges == 1
+
+
+@dataclass
+class FastModelArgs(BaseModelArgs):
+    def make_model(self):
+        return _make_model(None, delays=[0.01], model_name=self.model_name)[0]
+
+
+def test_alternate_model_args():
+    model_args = OpenAIModelArgs(
+        model_name="gpt-4o-mini",
+        hedge_policy=HedgePolicy(alternate=OpenAIModelArgs(model_name="gpt-4o-mini")),
+    )
+    assert pickle.loads(pickle.dumps(model_args)) == model_args
+    assert config_hash(model_args) == config_hash(pickle.loads(pickle.dumps(model_args)))
+
+    model, _ = _make_model(HedgePolicy(min_samples=5, alternate=FastModelArgs("alternate")))
+    assert model._alternate_model is None
+    for _ in range(5):
+        hedging.record_latency("hedged-model", 0.05)
+    with tracking.set_tracker() as tracker:
+        assert model([make_user_message("hello")])["content"] == "hello"
+    # the duplicate was sent to a model made from the args of the policy
+    assert tracker.stats["hedges"] == 1
+    assert model._alternate_model.model_name == "alternate"
+
+
+def test_quantile_of_hedged_queries():
+    # the primary queries are slow and the duplicates fast
+    policy = HedgePolicy(quantile=0.5, min_samples=5, max_extra_cost_ratio=1.0)
+    model, client = _make_model(policy, delays=[0.5, 0.01] * 10)
+    for _ in range(5):
+        hedging.record_latency("hedged-model", 0.1)
+
+    for _ in range(10):
+        model([make_user_message("hello")])
+    assert client.n_calls == 20
+
+    # the cancelled primaries count with the time they ran, the quantile doesn't decay
+    histogram = hedging.get_hedge_state("hedged-model").histogram
+    assert histogram.quantile(0.5) >= 0.1
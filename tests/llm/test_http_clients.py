@@ -0,0 +1,153 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import OpenAI
+
+import agentlab.llm.tracking as tracking
+from agentlab.llm import http_clients
+from agentlab.llm.chat_api import (
+    ChatModel,
+    SelfHostedModelArgs,
+    make_system_message,
+    make_user_message,
+)
+
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    """Minimal /chat/completions route with keep-alive connections."""
+
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        CompletionHandler.requests.append((self.path, request))
+        body = json.dumps(
+            {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": request["model"],
+                "choices": [
+                    {
+                        "index": i,
+                        "message": {"role": "assistant", "content": "ok"},
+                        "finish_reason": "stop",
+                    }
+                    for i in range(request.get("n", 1))
+                ],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def base_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CompletionHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = http_clients.ClientRegistry()
+    monkeypatch.setattr(http_clients, "REGISTRY", registry)
+    yield registry
+    registry.close()
+
+
+def _make_model(base_url, api_key="key"):
+    return ChatModel(
+        "stub", api_key=api_key, client_class=OpenAI, client_args={"base_url": base_url}
+    )
+
+
+def test_models_share_clients_and_connections(base_url, registry):
+    models = [_make_model(base_url) for _ in range(3)]
+    assert all(model.client is models[0].client for model in models)
+    for model in models:
+        assert model([make_user_message("hello")])["content"] == "ok"
+
+    stats = registry.stats()
+    assert stats["clients"] == 1 and stats["client_reuses"] == 2
+    assert stats["requests"] == 3
+    assert stats["new_connections"] == 1 and stats["reused_connections"] == 2
+
+    # another api key gets another client
+    assert _make_model(base_url, api_key="other").client is not models[0].client
+    assert registry.stats()["clients"] == 2
+
+
+def test_async_clients_are_shared_per_event_loop(base_url, registry):
+    model = _make_model(base_url)
+
+    async def query_twice():
+        await model.abatch([[make_user_message("a")], [make_user_message("b")]])
+        await model.acall([make_user_message("c")])
+        return model._get_async_client()
+
+    first_client = asyncio.run(query_twice())
+    second_client = asyncio.run(query_twice())
+    assert first_client is not second_client
+    assert registry.stats()["requests"] == 6
+
+
+def test_async_clients_of_closed_loops_are_dropped(base_url, registry):
+    model = _make_model(base_url)
+    for _ in range(5):
+        asyncio.run(model.acall([make_user_message("hello")]))
+    # the client of the last loop is dropped when another loop needs one
+    assert len(registry._async_clients) == 1
+
+    async def query():
+        await model.acall([make_user_message("hello")])
+        return model._get_async_client()
+
+    loop = asyncio.new_event_loop()
+    try:
+        client = loop.run_until_complete(query())
+        assert len(registry._async_clients) == 1
+        registry.close()
+        assert client.is_closed()
+    finally:
+        loop.close()
+
+
+def test_self_hosted_openai_backend(base_url, registry):
+    CompletionHandler.requests.clear()
+    model_args = SelfHostedModelArgs(
+        model_name="meta-llama/Meta-Llama-3-8B-Instruct",
+        model_url=base_url.removesuffix("/v1"),
+        max_new_tokens=64,
+        backend="openai",
+    )
+    messages = [make_system_message("You are a web agent."), make_user_message("hello")]
+
+    with tracking.set_tracker() as tracker:
+        for _ in range(2):
+            answers = model_args.make_model()(messages, n_samples=2)
+
+    assert [answer["content"] for answer in answers] == ["ok", "ok"]
+    # the messages are sent as is, the server applies the chat template
+    path, request = CompletionHandler.requests[-1]
+    assert path == "/v1/chat/completions"
+    assert request["messages"] == messages
+    assert request["n"] == 2 and request["max_tokens"] == 64
+    assert tracker.stats["input_tokens"] == 6 and tracker.stats["output_tokens"] == 2
+
+    stats = registry.stats()
+    assert stats["clients"] == 1 and stats["new_connections"] == 1
@@ -1,7 +1,16 @@
+import time
+
 import pytest
 
+from agentlab.llm import huggingface_utils
 from agentlab.llm.chat_api import HuggingFaceURLChatModel, make_system_message, make_user_message
-from agentlab.llm.llm_utils import download_and_save_model
+from agentlab.llm.huggingface_utils import HFBaseChatModel
+from agentlab.llm.llm_utils import (
+    Discussion,
+    HumanMessage,
+    download_and_save_model,
+    retry_multiple,
+)
 from agentlab.llm.prompt_templates import STARCHAT_PROMPT_TEMPLATE
 
 # TODO(optimass): figure out a good model for all tests
@@ -30,3 +39,37 @@ def test_download_and_save_model():
     save_dir = "test_models"
 
     download_and_save_model(model_path, save_dir)
+
+
+class FakeTokenizer:
+    def apply_chat_template(self, messages, tokenize=False):
+        return "\n".join(message["content"] for message in messages)
+
+
+def test_samples_are_generated_concurrently(monkeypatch):
+    monkeypatch.setattr(
+        huggingface_utils.AutoTokenizer, "from_pretrained", lambda name: FakeTokenizer()
+    )
+    model = HFBaseChatModel("fake-model", None, n_retry_server=1)
+    model.temperature = 0.5
+
+    def generate(prompt, temperature):
+        time.sleep(0.3)
+        return "<action>click('12')</action>"
+
+    model.llm = generate
+
+    start = time.time()
+    answers = model([make_user_message("click the button")], n_samples=4)
+    assert time.time() - start < 0.6
+    assert [answer["content"] for answer in answers] == ["<action>click('12')</action>"] * 4
+
+    def parser(content):
+        return {"action": content}
+
+    start = time.time()
+    parsed_answers, n_retries = retry_multiple(
+        model, Discussion([HumanMessage("click the button")]), 2, parser, num_samples=4
+    )
+    assert time.time() - start < 0.6
+    assert len(parsed_answers) == 4 and n_retries == 0
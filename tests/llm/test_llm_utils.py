@@ -37,6 +37,13 @@ def test_count_tokens():
     assert llm_utils.count_tokens(text) == 6
 
 
+def test_estimate_tokens(monkeypatch):
+    # the tokenizers of the HF hub are never loaded
+    monkeypatch.setattr(llm_utils, "AutoTokenizer", None)
+    assert llm_utils.estimate_tokens("a" * 40, model="my-azure-deployment") == 10
+    assert llm_utils.get_local_encoding("my-azure-deployment") is None
+
+
 def test_json_parser():
     # Testing valid JSON
     message = '{"test": "Hello, World!"}'
@@ -244,6 +251,25 @@ An inline code block ```click()```
     assert llm_utils.extract_code_blocks(text) == expected_output
 
 
+def test_incremental_tag_parser():
+    answer = "<think>\nclick the button\n</think>\n<action>\nclick('12')\n</action>\n<memory>"
+    parser = llm_utils.IncrementalTagParser(["think", "action"])
+    # chunks split the tags
+    chunks = [answer[i : i + 3] for i in range(0, len(answer), 3)]
+    for chunk in chunks:
+        if parser.feed(chunk):
+            break
+    assert "</action>" in parser.text and "<memory>" not in parser.text
+    assert llm_utils.parse_html_tags_raise(parser.text, keys=["think", "action"])["action"] == (
+        "click('12')"
+    )
+
+    # a closing tag before the opening one doesn't count
+    parser = llm_utils.IncrementalTagParser(["action"])
+    assert not parser.feed("</action> <action>click('1')")
+    assert parser.feed("</action>")
+
+
 def test_message_merge_only_text():
     content = [
         {"type": "text", "text": "Hello, world!"},
@@ -0,0 +1,243 @@
+import dataclasses
+import threading
+import time
+from dataclasses import dataclass
+
+import httpx
+import openai
+import pytest
+import requests
+from huggingface_hub.errors import HfHubHTTPError
+
+from agentlab.llm import pooled_model
+from agentlab.llm.base_api import AbstractChatModel, BaseModelArgs
+from agentlab.llm.chat_api import AzureModelArgs, RetryError
+from agentlab.llm.pooled_model import (
+    AllEndpointsFailedError,
+    CircuitBreaker,
+    PooledModelArgs,
+    _endpoint_name,
+)
+from agentlab.llm.retry_policy import RetryPolicy
+
+REQUEST = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+
+
+def _error(error_class, status_code):
+    response = httpx.Response(status_code, request=REQUEST)
+    return error_class("error", response=response, body=None)
+
+
+def _http_error(error_class, status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return error_class("error", response=response)
+
+
+class FakeModel(AbstractChatModel):
+    def __init__(self, name, errors, delay):
+        self.name = name
+        self.errors = errors
+        self.delay = delay
+        self.n_calls = 0
+        self.retry_policy = RetryPolicy()
+
+    def __call__(self, messages, n_samples=1):
+        self.n_calls += 1
+        time.sleep(self.delay)
+        if self.errors:
+            error = self.errors.pop(0)
+            # like ChatModel once its retries are exhausted
+            raise RetryError("failed") from error
+        return {"role": "assistant", "content": self.name}
+
+    def get_stats(self):
+        return {"n_retry_llm": 1}
+
+
+@dataclass
+class FakeModelArgs(BaseModelArgs):
+    errors: list = None
+    delay: float = 0.0
+    max_input_tokens: int = 1000
+
+    def make_model(self):
+        return FakeModel(self.model_name, list(self.errors or []), self.delay)
+
+
+@pytest.fixture(autouse=True)
+def endpoints(monkeypatch):
+    monkeypatch.setattr(pooled_model, "_ENDPOINTS", {})
+
+
+def test_model_args():
+    model_args = PooledModelArgs(
+        backends=[
+            FakeModelArgs("a", max_input_tokens=1000, vision_support=True),
+            FakeModelArgs("b", max_input_tokens=500, vision_support=True),
+        ]
+    )
+    assert model_args.model_name == "pooled-a"
+    assert model_args.max_input_tokens == 500
+    assert model_args.vision_support
+
+    model = model_args.make_model()
+    # backends fail over instead of retrying
+    assert all(m.retry_policy.max_retry == 1 for m in model.models)
+
+
+def test_azure_resources(monkeypatch):
+    monkeypatch.delenv("AZURE_OPENAI_ENDPOINT", raising=False)
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY_EASTUS", "eastus-key")
+    eastus = AzureModelArgs(
+        model_name="gpt-4o",
+        deployment_name="gpt-4o",
+        endpoint="https://eastus.openai.azure.com/",
+        api_key_env_var="AZURE_OPENAI_API_KEY_EASTUS",
+    )
+    westus = dataclasses.replace(eastus, endpoint="https://westus.openai.azure.com")
+
+    # deployments of the same name in two resources are distinct endpoints
+    assert _endpoint_name(eastus) == "AzureModelArgs(gpt-4o@https://eastus.openai.azure.com/gpt-4o)"
+    assert _endpoint_name(eastus) != _endpoint_name(westus)
+
+    model = eastus.make_model()
+    assert model.client_args["azure_endpoint"] == "https://eastus.openai.azure.com/"
+    assert model.api_key == "eastus-key"
+
+
+def test_failover_on_rate_limit():
+    model_args = PooledModelArgs(
+        backends=[
+            FakeModelArgs("a", errors=[_error(openai.RateLimitError, 429)]),
+            FakeModelArgs("b", errors=[_error(openai.InternalServerError, 503)]),
+        ],
+        weights=[1.0, 0.0001],
+        routing="weighted",
+    )
+    model = model_args.make_model()
+    model.retry_policy = RetryPolicy(base_delay=0, rate_limit_delay=0)
+
+    answer = model([{"role": "user", "content": "hi"}])
+
+    # both endpoints failed once, the query succeeded in the second round
+    assert answer["content"] in ("a", "b")
+    assert model.get_stats()["n_failover_llm"] == 2
+    stats = model.routing_stats()
+    assert sum(s["failures"] for s in stats.values()) == 2
+    assert sum(s["successes"] for s in stats.values()) == 1
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        _error(openai.BadRequestError, 400),
+        _error(openai.AuthenticationError, 401),
+        _error(openai.PermissionDeniedError, 403),
+        _http_error(HfHubHTTPError, 422),
+        TypeError("a bug"),
+    ],
+)
+def test_query_errors_are_raised(error):
+    model = PooledModelArgs(
+        backends=[FakeModelArgs("a", errors=[error]), FakeModelArgs("b", errors=[error])],
+        failure_threshold=1,
+    ).make_model()
+    with pytest.raises(RetryError):
+        model([{"role": "user", "content": "hi"}])
+    # no failover, and the breakers stay closed
+    assert sum(m.n_calls for m in model.models) == 1
+    stats = model.routing_stats().values()
+    assert all(s["failures"] == 0 and s["breaker_state"] == "closed" for s in stats)
+
+
+@pytest.mark.parametrize(
+    "error, failover",
+    [
+        (requests.ConnectionError("connection refused"), True),
+        (requests.ReadTimeout("read timed out"), True),
+        (TimeoutError("inference timed out"), True),
+        (_http_error(requests.HTTPError, 503), True),
+        (_http_error(HfHubHTTPError, 429), True),
+        (_http_error(HfHubHTTPError, 401), False),
+        (ValueError("a bug"), False),
+    ],
+)
+def test_failover_errors_of_http_backends(error, failover):
+    # the errors of TGI and other huggingface_hub backends
+    try:
+        raise RetryError("failed") from error
+    except RetryError as retry_error:
+        assert pooled_model.is_failover_error(retry_error) == failover
+
+
+def test_all_endpoints_failing():
+    model = PooledModelArgs(
+        backends=[FakeModelArgs("a", errors=[_error(openai.InternalServerError, 500)] * 10)]
+    ).make_model()
+    model.retry_policy = RetryPolicy(max_retry=2, base_delay=0)
+    with pytest.raises(AllEndpointsFailedError):
+        model([{"role": "user", "content": "hi"}])
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.1)
+    breaker.on_failure()
+    assert breaker.state == "closed"
+    breaker.on_failure()
+    assert breaker.state == "open" and not breaker.allows()
+    assert breaker.trips == 1
+
+    time.sleep(0.15)
+    # a single trial query is let through
+    assert breaker.allows()
+    breaker.on_request()
+    assert not breaker.allows()
+    breaker.on_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.15)
+    breaker.on_request()
+    breaker.on_success()
+    assert breaker.state == "closed" and breaker.allows()
+
+
+def test_open_endpoint_is_skipped():
+    model = PooledModelArgs(
+        backends=[
+            FakeModelArgs("a", errors=[_error(openai.InternalServerError, 500)] * 2),
+            FakeModelArgs("b"),
+        ],
+        weights=[1000.0, 1.0],
+        routing="weighted",
+        failure_threshold=2,
+        cooldown=60,
+    ).make_model()
+    model.retry_policy = RetryPolicy(base_delay=0)
+    for _ in range(10):
+        assert model([{"role": "user", "content": "hi"}])["content"] == "b"
+
+    # "a" was put aside after 2 failures, and only "b" was queried since
+    assert model.models[0].n_calls == 2
+    stats = model.routing_stats()
+    assert stats["FakeModelArgs(a)"]["breaker_state"] == "open"
+    assert stats["FakeModelArgs(b)"]["successes"] == 10
+
+
+def test_least_outstanding_spreads_load():
+    model = PooledModelArgs(
+        backends=[FakeModelArgs("a", delay=0.2), FakeModelArgs("b", delay=0.2)]
+    ).make_model()
+
+    start = time.time()
+    threads = [
+        threading.Thread(target=model, args=([{"role": "user", "content": "hi"}],))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert time.time() - start < 1
+    assert [m.n_calls for m in model.models] == [2, 2]
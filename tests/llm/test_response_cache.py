@@ -0,0 +1,78 @@
+import time
+from multiprocessing import Pool
+
+import pytest
+
+import agentlab.llm.tracking as tracking
+from agentlab.llm import response_cache
+from agentlab.llm.chat_api import make_system_message, make_user_message
+from agentlab.llm.llm_utils import Discussion, HumanMessage, SystemMessage
+from agentlab.llm.response_cache import ResponseCache, make_key
+
+from fakes import FakeClient, make_model
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    path = tmp_path / "llm_cache.sqlite"
+    response_cache.enable_cache(path)
+    yield path
+    response_cache.disable_cache()
+
+
+def _put_entries(path, worker_id, n_entries=10):
+    cache = ResponseCache(path)
+    for i in range(n_entries):
+        cache.put(f"{worker_id}-{i}", [f"answer {i}"])
+
+
+def test_key_normalizes_messages():
+    messages = [make_system_message("system"), make_user_message("part 1\npart 2")]
+    discussion = Discussion([SystemMessage("system"), HumanMessage("part 1")])
+    discussion.add_text("part 2")
+    assert make_key("model", messages, 0, 1, 100) == make_key("model", discussion, 0, 1, 100)
+    assert make_key("model", messages, 0, 1, 100) != make_key("model", messages, 0.5, 1, 100)
+    assert make_key("model", messages, 0, 1, 100) != make_key("model", messages, 0, 2, 100)
+
+
+def test_eviction(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_entries=2)
+    for key in "abc":
+        cache.put(key, [key])
+        time.sleep(0.01)
+    assert len(cache) == 2 and cache.get("a") is None
+
+    cache = ResponseCache(tmp_path / "cache_ttl.sqlite", ttl=0.1)
+    cache.put("a", ["a"])
+    assert cache.get("a") == ["a"]
+    time.sleep(0.2)
+    assert cache.get("a") is None
+
+
+def test_chat_model_cache(cache_path):
+    model = make_model(FakeClient(), temperature=0)
+    messages = [make_system_message("system"), make_user_message("hello")]
+
+    with tracking.set_tracker() as tracker:
+        first = model(messages)
+        second = model(messages)
+        samples = model(messages, n_samples=2)
+
+    assert first == second and first["content"] == "hello"
+    assert len(samples) == 2
+    assert model.client.n_calls == 2
+    assert tracker.stats["cache_hits"] == 1 and tracker.stats["cache_misses"] == 2
+    assert tracker.stats["input_tokens"] == 20
+
+    # the cache is persistent
+    other_model = make_model(FakeClient(), temperature=0)
+    assert other_model(messages) == first
+    assert other_model.client.n_calls == 0
+
+
+def test_concurrent_writes(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    ResponseCache(path)
+    with Pool(4) as pool:
+        pool.starmap(_put_entries, [(path, worker_id) for worker_id in range(4)])
+    assert len(ResponseCache(path)) == 40
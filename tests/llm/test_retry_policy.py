@@ -0,0 +1,131 @@
+import time
+
+import httpx
+import openai
+import pytest
+
+from agentlab.llm.chat_api import RetryError, make_user_message
+from agentlab.llm.retry_policy import RetryPolicy, RetryState, classify_error, retry_after
+
+from fakes import FakeClient, make_model
+
+REQUEST = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+
+
+def _status_error(error_class, status_code, headers=None, message="error"):
+    response = httpx.Response(status_code, headers=headers or {}, request=REQUEST)
+    return error_class(message, response=response, body=None)
+
+
+def test_classify_error():
+    assert classify_error(_status_error(openai.RateLimitError, 429)) == "rate_limit"
+    assert classify_error(_status_error(openai.InternalServerError, 503)) == "server"
+    assert classify_error(_status_error(openai.AuthenticationError, 401)) == "fatal"
+    assert classify_error(_status_error(openai.BadRequestError, 400)) == "fatal"
+    assert classify_error(openai.APITimeoutError(request=REQUEST)) == "timeout"
+    assert classify_error(openai.APIConnectionError(request=REQUEST)) == "connection"
+    assert classify_error(ValueError("not an API error")) == "fatal"
+
+
+def test_retry_after_headers():
+    error = _status_error(openai.RateLimitError, 429, {"retry-after": "3"})
+    assert retry_after(error) == 3
+    error = _status_error(openai.RateLimitError, 429, {"retry-after-ms": "250"})
+    assert retry_after(error) == 0.25
+    # Retry-After is preferred over the reset of the limits
+    error = _status_error(
+        openai.RateLimitError, 429, {"retry-after": "2", "x-ratelimit-reset-tokens": "6m0s"}
+    )
+    assert retry_after(error) == 2
+    # only the reset of the exhausted limit is used
+    headers = {
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "1s",
+        "x-ratelimit-remaining-tokens": "5000",
+        "x-ratelimit-reset-tokens": "6m0s",
+    }
+    assert retry_after(_status_error(openai.RateLimitError, 429, headers)) == 1
+    headers = {"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "6m0s"}
+    assert retry_after(_status_error(openai.RateLimitError, 429, headers)) == 360
+    headers = {"x-ratelimit-reset-requests": "1s", "x-ratelimit-reset-tokens": "6m0s"}
+    assert retry_after(_status_error(openai.RateLimitError, 429, headers)) is None
+    headers = {"x-ratelimit-remaining": "0", "x-ratelimit-reset": str(time.time() + 5)}
+    assert 4 < retry_after(_status_error(openai.RateLimitError, 429, headers)) <= 5
+    error = _status_error(
+        openai.RateLimitError, 429, message="Rate limit reached. Please try again in 120ms."
+    )
+    assert retry_after(error) == pytest.approx(0.12)
+    assert retry_after(_status_error(openai.RateLimitError, 429)) is None
+
+
+def test_rate_limit_waits_for_header():
+    state = RetryState(RetryPolicy(rate_limit_delay=30))
+    wait_time = state.next_wait(_status_error(openai.RateLimitError, 429, {"retry-after": "2"}))
+    # the hint of the API replaces the fixed rate limit delay, with a little jitter
+    assert 2 <= wait_time <= 2.2
+    assert state.error_types == ["rate_limit"]
+
+    # long hints are capped, unless a deadline bounds the total wait
+    headers = {"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "1h"}
+    error = _status_error(openai.RateLimitError, 429, headers)
+    assert RetryState(RetryPolicy(max_delay=60)).next_wait(error) == 60
+    assert RetryState(RetryPolicy(max_delay=60, deadline=7200)).next_wait(error) >= 3600
+
+
+def test_backoff_bounds():
+    policy = RetryPolicy(max_retry=50, base_delay=1, max_delay=8)
+    state = RetryState(policy)
+    waits = [state.next_wait(_status_error(openai.InternalServerError, 500)) for _ in range(20)]
+    assert all(1 <= wait_time <= 8 for wait_time in waits)
+    assert state.total_wait == pytest.approx(sum(waits))
+
+
+def test_stops_retrying():
+    server_error = _status_error(openai.InternalServerError, 500)
+
+    state = RetryState(RetryPolicy(max_retry=3, base_delay=0))
+    assert state.next_wait(server_error) is not None
+    assert state.next_wait(server_error) is not None
+    assert state.next_wait(server_error) is None
+
+    state = RetryState(RetryPolicy(max_retry=10))
+    assert state.next_wait(_status_error(openai.AuthenticationError, 401)) is None
+
+    state = RetryState(RetryPolicy(max_retry=10, deadline=1))
+    rate_limit = _status_error(openai.RateLimitError, 429, {"retry-after": "5"})
+    assert state.next_wait(rate_limit) is None
+
+
+def _make_model(errors, retry_policy):
+    client = FakeClient(answer="hello", errors=errors)
+    return make_model(client, retry_policy=retry_policy), client
+
+
+def test_chat_model_retries_server_errors_quickly():
+    errors = [_status_error(openai.InternalServerError, 502)] * 2
+    model, client = _make_model(errors, RetryPolicy(base_delay=0.01, max_delay=0.05))
+
+    start = time.time()
+    answer = model([make_user_message("hi")])
+
+    assert time.time() - start < 1
+    assert answer["content"] == "hello"
+    assert client.n_calls == 3
+    assert model.error_types == ["server", "server"]
+    stats = model.get_stats()
+    assert stats["n_retry_llm"] == 3
+    assert 0.02 <= stats["retry_wait_llm"] <= 0.1
+
+
+def test_chat_model_raises_fatal_errors():
+    model, client = _make_model(
+        [_status_error(openai.AuthenticationError, 401)], RetryPolicy(max_retry=4)
+    )
+    with pytest.raises(RetryError):
+        model([make_user_message("hi")])
+    assert client.n_calls == 1
+
+
+def test_client_retries_disabled():
+    model, _ = _make_model([], None)
+    assert model.client_args["max_retries"] == 0
@@ -13,6 +13,8 @@ from agentlab.llm.chat_api import (
     make_user_message,
 )
 
+from fakes import FakeClient, make_model
+
 
 def test_get_action_decorator():
     action, agent_info = tracking.cost_tracker_decorator(lambda x, y: call_llm())(None, None)
@@ -181,3 +183,18 @@ def test_openrouter_chat_model():
         answer = chat_model(messages)
     assert "5" in answer.get("content")
     assert tracker.stats["cost"] > 0
+
+
+def test_cached_tokens_pricing():
+    client = FakeClient(prompt_tokens=1000, completion_tokens=10, cached_tokens=800)
+    pricing_func = lambda: {"model": {"prompt": 1.0, "completion": 2.0, "cached_prompt": 0.25}}
+    chat_model = make_model(client, model_name="model", pricing_func=pricing_func)
+
+    with tracking.set_tracker() as tracker:
+        chat_model([make_user_message("hello")])
+    assert tracker.stats["input_tokens"] == 1000
+    assert tracker.stats["cached_tokens"] == 800
+    assert tracker.stats["cost"] == 200 * 1.0 + 800 * 0.25 + 10 * 2.0
+
+    pricing = tracking.get_pricing_openai()
+    assert pricing["gpt-4o-mini"]["cached_prompt"] < pricing["gpt-4o-mini"]["prompt"]